@@ -0,0 +1,4 @@
+"""
+HTTP API for the Stable Diffusion Image Generator.
+Serves the generation engine over FastAPI without a browser session.
+"""
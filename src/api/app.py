@@ -0,0 +1,361 @@
+"""
+FastAPI service exposing every generation flow of the app.
+
+Run with ``uvicorn src.api.app:app --host 0.0.0.0 --port 8000``. Image inputs
+are multipart uploads and every endpoint returns the generated image as PNG,
+with an ``X-Result-Cache`` header telling whether it came from the result cache.
+With ``background=true`` a generation endpoint instead returns a job whose
+progress is streamed from ``/jobs/{id}/events`` as server-sent events.
+"""
+import base64
+import json
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, File, Form, HTTPException, UploadFile
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+from PIL import Image
+from src.config.constants import (
+    MODEL_CONFIGS,
+    SCHEDULERS,
+    INFERENCE_WORKERS,
+    WARM_STYLES,
+    DEFAULT_SEED,
+    DEFAULT_STEPS,
+    DEFAULT_GUIDANCE_SCALE,
+    DEFAULT_STRENGTH
+)
+from src.pipelines import engine, model_store
+from src.pipelines.fusion import fused_mode, fusion_report, set_fused_mode
+from src.pipelines.jobs import JobCancelled, job_manager
+from src.pipelines.model_loader import ModelLoadError, memory_report
+from src.pipelines.result_cache import is_hit, result_cache
+from src.pipelines.warmup import readiness, start_warmup
+from src.pipelines.workers import active_pool, get_worker_pool, run_inference
+from src.utils.image_io import decode_image
+from src.utils.metrics import flow_labels, labels, render_prometheus, stage
+
+@asynccontextmanager
+async def lifespan(app):
+    if INFERENCE_WORKERS:
+        # The workers warm WARM_STYLES themselves
+        get_worker_pool()
+    elif WARM_STYLES:
+        start_warmup()
+    yield
+
+app = FastAPI(title="IP-Adapter Image Generator API", lifespan=lifespan)
+
+def _read_image(upload):
+    if upload is None:
+        return None
+    try:
+        return decode_image(upload.file.read())
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid image '{upload.filename}': {str(e)}")
+
+def _check_style(model_name):
+    if model_name not in MODEL_CONFIGS:
+        raise HTTPException(status_code=404, detail=f"Unknown style: {model_name}")
+
+def _cache_status(image):
+    return "hit" if is_hit(image) else "miss"
+
+def _png_response(image):
+    return Response(
+        content=engine.encode_image(image),
+        media_type="image/png",
+        headers={"X-Result-Cache": _cache_status(image)}
+    )
+
+def _result_image(result):
+    # The refining flow returns (base_image, refined_image)
+    return result[-1] if isinstance(result, tuple) else result
+
+def _dispatch(fn, kind, background=False, session_id=None, **kwargs):
+    if background:
+        job = job_manager.submit(fn, kwargs, kind=kind, session_id=session_id)
+        return JSONResponse(status_code=202, content=job.to_dict())
+    # Generation endpoints are plain ``def`` so FastAPI runs them in its
+    # threadpool; the engine serialises access to shared pipelines itself
+    request_labels = flow_labels(kind, kwargs.get("model_name"), kwargs.get("width"), kwargs.get("height"))
+    try:
+        with labels(**request_labels):
+            with stage("request"):
+                image = _result_image(run_inference(fn, kwargs))
+            return _png_response(image)
+    except ModelLoadError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+def _get_job(job_id):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return job
+
+def _event_value(value):
+    # Previews are small enough to inline as PNG data URIs
+    if isinstance(value, Image.Image):
+        return "data:image/png;base64," + base64.b64encode(engine.encode_image(value)).decode("ascii")
+    return value
+
+def _event_json(event):
+    # Streams carry the JSON-safe fields and inlined images
+    return json.dumps({
+        name: _event_value(value) for name, value in event.items()
+        if isinstance(value, (str, int, float, bool, Image.Image)) or value is None
+    })
+
+@app.get("/health")
+def health():
+    return {"status": "ok"}
+
+@app.get("/styles")
+def styles():
+    return {
+        name: {
+            "base_model": config["base_model"],
+            "default_prompt": config["default_prompt"],
+            "use_ip_adapter": config.get("use_ip_adapter", False),
+            "scheduler": config.get("scheduler"),
+            "readiness": readiness(name)["state"]
+        }
+        for name, config in MODEL_CONFIGS.items()
+    }
+
+@app.get("/schedulers")
+def schedulers():
+    return SCHEDULERS
+
+@app.get("/readiness")
+def style_readiness():
+    return readiness()
+
+@app.get("/memory")
+def memory():
+    report = memory_report()
+    report["bases"] = {" | ".join(key): modules for key, modules in report["bases"].items()}
+    return report
+
+@app.get("/workers")
+def workers():
+    pool = active_pool()
+    return pool.status() if pool is not None else []
+
+@app.get("/fusion")
+def fusion():
+    return {"enabled": fused_mode(), "styles": fusion_report()}
+
+@app.post("/fusion")
+def set_fusion(enabled: bool = Form(...)):
+    # Applies to generation in this process; inference workers keep FUSED_MODE
+    if active_pool() is not None:
+        raise HTTPException(status_code=409, detail="Fused mode of inference workers is set with FUSED_MODE")
+    set_fused_mode(enabled)
+    return fusion()
+
+@app.get("/models")
+def models():
+    return model_store.status()
+
+@app.get("/result-cache")
+def result_cache_stats():
+    return result_cache.stats()
+
+@app.delete("/result-cache")
+def clear_result_cache():
+    result_cache.clear()
+    return result_cache.stats()
+
+@app.get("/metrics")
+def metrics():
+    return Response(content=render_prometheus(), media_type="text/plain; version=0.0.4")
+
+@app.post("/text-to-image")
+def text_to_image(
+    style: str = Form(...),
+    prompt: str = Form(...),
+    width: int = Form(512),
+    height: int = Form(512),
+    num_inference_steps: int = Form(DEFAULT_STEPS),
+    guidance_scale: float = Form(DEFAULT_GUIDANCE_SCALE),
+    seed: int = Form(DEFAULT_SEED),
+    scheduler: Optional[str] = Form(None),
+    ip_adapter_scale: Optional[float] = Form(None),
+    ip_adapter_image: Optional[UploadFile] = File(None),
+    background: bool = Form(False),
+    session_id: Optional[str] = Form(None)
+):
+    _check_style(style)
+    return _dispatch(
+        engine.generate_text_to_image,
+        "text2img",
+        background=background,
+        session_id=session_id,
+        model_name=style,
+        prompt=prompt,
+        width=width,
+        height=height,
+        num_inference_steps=num_inference_steps,
+        guidance_scale=guidance_scale,
+        seed=seed,
+        ip_adapter_image=_read_image(ip_adapter_image),
+        ip_adapter_scale=ip_adapter_scale,
+        scheduler=scheduler
+    )
+
+@app.post("/image-to-image")
+def image_to_image(
+    style: str = Form(...),
+    prompt: str = Form(...),
+    image: UploadFile = File(...),
+    width: int = Form(512),
+    height: int = Form(512),
+    num_inference_steps: int = Form(DEFAULT_STEPS),
+    guidance_scale: float = Form(DEFAULT_GUIDANCE_SCALE),
+    strength: float = Form(DEFAULT_STRENGTH),
+    seed: int = Form(DEFAULT_SEED),
+    scheduler: Optional[str] = Form(None),
+    ip_adapter_scale: Optional[float] = Form(None),
+    ip_adapter_image: Optional[UploadFile] = File(None),
+    background: bool = Form(False),
+    session_id: Optional[str] = Form(None)
+):
+    _check_style(style)
+    return _dispatch(
+        engine.generate_image_to_image,
+        "img2img",
+        background=background,
+        session_id=session_id,
+        model_name=style,
+        prompt=prompt,
+        image=_read_image(image),
+        width=width,
+        height=height,
+        num_inference_steps=num_inference_steps,
+        guidance_scale=guidance_scale,
+        strength=strength,
+        seed=seed,
+        ip_adapter_image=_read_image(ip_adapter_image),
+        ip_adapter_scale=ip_adapter_scale,
+        scheduler=scheduler
+    )
+
+@app.post("/inpainting")
+def inpainting(
+    style: str = Form(...),
+    prompt: str = Form(...),
+    image: UploadFile = File(...),
+    mask_image: UploadFile = File(...),
+    num_inference_steps: int = Form(75),
+    guidance_scale: float = Form(DEFAULT_GUIDANCE_SCALE),
+    high_noise_frac: float = Form(0.7),
+    seed: int = Form(DEFAULT_SEED),
+    scheduler: Optional[str] = Form(None),
+    background: bool = Form(False),
+    session_id: Optional[str] = Form(None)
+):
+    _check_style(style)
+    return _dispatch(
+        engine.inpaint,
+        "inpainting",
+        background=background,
+        session_id=session_id,
+        model_name=style,
+        prompt=prompt,
+        image=_read_image(image),
+        mask_image=_read_image(mask_image),
+        num_inference_steps=num_inference_steps,
+        guidance_scale=guidance_scale,
+        high_noise_frac=high_noise_frac,
+        seed=seed,
+        scheduler=scheduler
+    )
+
+@app.post("/refining")
+def refining(
+    style: str = Form(...),
+    prompt: str = Form(...),
+    num_inference_steps: int = Form(DEFAULT_STEPS),
+    guidance_scale: float = Form(DEFAULT_GUIDANCE_SCALE),
+    denoising_end: float = Form(0.8),
+    seed: int = Form(DEFAULT_SEED),
+    scheduler: Optional[str] = Form(None),
+    background: bool = Form(False),
+    session_id: Optional[str] = Form(None)
+):
+    _check_style(style)
+    return _dispatch(
+        engine.refine,
+        "refining",
+        background=background,
+        session_id=session_id,
+        model_name=style,
+        prompt=prompt,
+        num_inference_steps=num_inference_steps,
+        guidance_scale=guidance_scale,
+        denoising_end=denoising_end,
+        seed=seed,
+        scheduler=scheduler
+    )
+
+@app.post("/two-text-encoders")
+def two_text_encoders(
+    prompt: str = Form(...),
+    prompt_2: str = Form(...),
+    num_inference_steps: int = Form(30),
+    guidance_scale: float = Form(7.5),
+    seed: int = Form(42),
+    scheduler: Optional[str] = Form(None),
+    background: bool = Form(False),
+    session_id: Optional[str] = Form(None)
+):
+    return _dispatch(
+        engine.generate_two_text_encoders,
+        "two_text_encoders",
+        background=background,
+        session_id=session_id,
+        prompt=prompt,
+        prompt_2=prompt_2,
+        num_inference_steps=num_inference_steps,
+        guidance_scale=guidance_scale,
+        seed=seed,
+        scheduler=scheduler
+    )
+
+@app.get("/jobs/{job_id}")
+def get_job(job_id: str):
+    job = _get_job(job_id)
+    info = job.to_dict()
+    if job.status == "succeeded":
+        info["result_cache"] = _cache_status(_result_image(job.result))
+    return info
+
+@app.get("/jobs/{job_id}/events")
+def job_events(job_id: str):
+    job = _get_job(job_id)
+
+    def stream():
+        for event in job.events():
+            yield f"data: {_event_json(event)}\n\n"
+
+    return StreamingResponse(stream(), media_type="text/event-stream")
+
+@app.get("/jobs/{job_id}/result")
+def job_result(job_id: str):
+    job = _get_job(job_id)
+    if not job.done:
+        raise HTTPException(status_code=409, detail=f"Job is {job.status}")
+    try:
+        return _png_response(_result_image(job.wait()))
+    except JobCancelled:
+        raise HTTPException(status_code=410, detail="Job was cancelled")
+    except RuntimeError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    job = _get_job(job_id)
+    job.cancel()
+    return job.to_dict()
@@ -1,15 +1,14 @@
+import math
 import streamlit as st
-import torch
-import io
-import time
-from PIL import Image
-from src.pipelines.model_loader import load_model
+from src.components.sampling import render_sampling_controls
+from src.components.sweep import render_sweep_controls, show_sweep_results, sweep_kwargs
+from src.pipelines.warmup import style_label
+from src.utils.image_io import load_upload
+from src.utils.job_runner import run_job, show_previews
 from src.utils.template_loader import load_template
 from src.config.constants import (
     MODEL_CONFIGS,
     DEFAULT_SEED,
-    DEFAULT_STEPS,
-    DEFAULT_GUIDANCE_SCALE,
     DEFAULT_STRENGTH,
     SUPPORTED_IMAGE_FORMATS
 )
@@ -26,7 +25,7 @@ def render_image_to_image_tab():
         selected_model = st.selectbox(
             "Select Style (Image to Image):",
             options=list(MODEL_CONFIGS.keys()),
-            format_func=lambda x: x,
+            format_func=style_label,
             key="img2img_model"
         )
         
@@ -36,17 +35,19 @@ def render_image_to_image_tab():
         # Image upload
         uploaded_file = st.file_uploader("Upload an image to transform:", type=SUPPORTED_IMAGE_FORMATS)
         
-        if uploaded_file is not None:
+        # Decoded once per file, already shrunk to fit the output size set below
+        target_size = (st.session_state.get("img2img_width", 512), st.session_state.get("img2img_height", 512))
+        init_image = load_upload(uploaded_file, st.session_state, "img2img_init_image", max_size=target_size)
+        if init_image is not None:
             # Display the uploaded image
-            init_image = Image.open(uploaded_file)
             st.image(init_image, caption="Original Image", use_container_width=True)
         
         # IP-Adapter image upload if enabled
         ip_adapter_image = None
         if model_config.get("use_ip_adapter", False):
             ip_uploaded_file = st.file_uploader("Upload reference image for IP-Adapter", type=SUPPORTED_IMAGE_FORMATS, key="img2img_ip_adapter")
-            if ip_uploaded_file is not None:
-                ip_adapter_image = Image.open(ip_uploaded_file)
+            ip_adapter_image = load_upload(ip_uploaded_file, st.session_state, "img2img_ip_adapter_image")
+            if ip_adapter_image is not None:
                 st.image(ip_adapter_image, caption="Reference Image", use_column_width=True)
         
         # Text input with a larger text area
@@ -68,9 +69,13 @@ def render_image_to_image_tab():
         with col_height:
             height = st.number_input("Height", min_value=256, max_value=1024, value=512, step=64, key="img2img_height")
         
-        num_inference_steps = st.slider("Number of inference steps", 20, 100, DEFAULT_STEPS, key="img2img_steps")
-        guidance_scale = st.slider("Guidance scale", 1.0, 20.0, DEFAULT_GUIDANCE_SCALE, key="img2img_guidance")
-        strength = st.slider("Transformation strength", 0.0, 1.0, DEFAULT_STRENGTH, key="img2img_strength")
+        # Only int(steps * strength) steps run, so the step slider starts where that reaches 1
+        strength = st.slider("Transformation strength", 0.01, 1.0, DEFAULT_STRENGTH, key="img2img_strength")
+        scheduler, num_inference_steps, guidance_scale = render_sampling_controls(
+            "img2img",
+            selected_model,
+            min_steps=math.ceil(1 / strength)
+        )
         
         # IP-Adapter scale if enabled
         ip_adapter_scale = None
@@ -80,6 +85,9 @@ def render_image_to_image_tab():
         # Seed control
         seed = st.number_input("Seed (for reproducibility)", value=DEFAULT_SEED, step=1, key="img2img_seed")
         
+        # Sweep mode: a grid over seeds and settings
+        sweep_settings = render_sweep_controls("img2img", seed, guidance_scale, num_inference_steps, ip_adapter_scale)
+        
         # Generate button
         generate_button = st.button("🎨 Transform Image", type="primary", key="img2img_generate")
 
@@ -92,51 +100,67 @@ def render_image_to_image_tab():
         
         if generate_button and prompt and uploaded_file is not None:
             try:
+                # Imported on first generation so script reruns never load torch or diffusers
+                from src.pipelines.engine import generate_image_to_image, sweep, encode_image
+                from src.pipelines.result_cache import is_hit
                 # Create loading animation
                 loading_container = st.empty()
                 with loading_container:
                     st.spinner("Loading model...")
                 
-                # Load model
-                pipe = load_model(selected_model, img2img=True)
-                
                 # Create progress bar
                 progress_bar = st.empty()
                 progress_text = st.empty()
                 time_text = st.empty()
                 
+                # Only int(steps * strength) of the steps are denoised
+                total_steps = int(num_inference_steps * strength)
+                if sweep_settings is not None:
+                    sweep_args, total_steps = sweep_kwargs(sweep_settings, strength)
+                
                 # Progress callback
                 def progress_callback(step, timestep, latents):
-                    progress = step / num_inference_steps
+                    progress = min(step / total_steps, 1.0)
                     progress_bar.progress(progress)
-                    progress_text.text(f"Step {step}/{num_inference_steps}")
+                    progress_text.text(f"Step {step}/{total_steps}")
                     time_text.text(f"Timestep: {timestep:.2f}")
                 
-                # Set up generator for reproducibility
-                generator = torch.Generator(device="cpu").manual_seed(seed)
-                
-                # Prepare generation parameters
-                gen_params = {
-                    "prompt": prompt,
-                    "image": init_image,
-                    "height": height,
-                    "width": width,
-                    "num_inference_steps": num_inference_steps,
-                    "guidance_scale": guidance_scale,
-                    "strength": strength,
-                    "generator": generator,
-                    "callback": progress_callback,
-                    "callback_steps": 1
-                }
-                
-                # Add IP-Adapter parameters if enabled
-                if model_config.get("use_ip_adapter", False) and ip_adapter_image is not None:
-                    gen_params["ip_adapter_image"] = ip_adapter_image
-                    if ip_adapter_scale is not None:
-                        pipe.set_ip_adapter_scale(ip_adapter_scale)
-                
-                # Generate image with progress callback
-                image = pipe(**gen_params).images[0]
+                # Generate in a background job; rerunning the script cancels it
+                if sweep_settings is not None:
+                    result = run_job(
+                        sweep,
+                        "img2img",
+                        on_event=show_previews(image_placeholder),
+                        progress_callback=progress_callback,
+                        model_name=selected_model,
+                        prompt=prompt,
+                        image=init_image,
+                        width=width,
+                        height=height,
+                        strength=strength,
+                        ip_adapter_image=ip_adapter_image,
+                        scheduler=scheduler,
+                        **sweep_args
+                    )
+                else:
+                    result = run_job(
+                        generate_image_to_image,
+                        "img2img",
+                        on_event=show_previews(image_placeholder),
+                        progress_callback=progress_callback,
+                        model_name=selected_model,
+                        prompt=prompt,
+                        image=init_image,
+                        width=width,
+                        height=height,
+                        num_inference_steps=num_inference_steps,
+                        guidance_scale=guidance_scale,
+                        strength=strength,
+                        seed=seed,
+                        ip_adapter_image=ip_adapter_image,
+                        ip_adapter_scale=ip_adapter_scale,
+                        scheduler=scheduler
+                    )
                 
                 # Clear loading animation and progress
                 loading_container.empty()
@@ -144,18 +168,21 @@ def render_image_to_image_tab():
                 progress_text.empty()
                 time_text.empty()
                 
-                # Display image
-                image_placeholder.image(image, caption=f"Transformed Image using {selected_model} style", use_container_width=True)
-                
-                # Add download button
-                buf = io.BytesIO()
-                image.save(buf, format="PNG")
-                st.download_button(
-                    label="⬇️ Download Image",
-                    data=buf.getvalue(),
-                    file_name=f"{selected_model.lower()}_style_transformed.png",
-                    mime="image/png"
-                )
+                if sweep_settings is not None:
+                    show_sweep_results(result, sweep_args["seeds"], image_placeholder, f"{selected_model.lower()}_style_sweep.png")
+                else:
+                    # Display image
+                    image_placeholder.image(result, caption=f"Transformed Image using {selected_model} style", use_container_width=True)
+                    if is_hit(result):
+                        st.caption("⚡ Served from the result cache")
+                    
+                    # Add download button
+                    st.download_button(
+                        label="⬇️ Download Image",
+                        data=encode_image(result),
+                        file_name=f"{selected_model.lower()}_style_transformed.png",
+                        mime="image/png"
+                    )
                 
             except Exception as e:
                 # Clear all loading states
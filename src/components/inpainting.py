@@ -1,20 +1,15 @@
 import streamlit as st
-import torch
-import io
-from PIL import Image
-from src.pipelines.model_loader import load_model
+from src.components.sampling import render_sampling_controls
+from src.pipelines.warmup import style_label
+from src.utils.image_grid import make_image_grid
+from src.utils.image_io import load_upload
+from src.utils.job_runner import run_job, show_previews
+from src.utils.metrics import stage
 from src.utils.template_loader import load_template
 from src.config.constants import (
-    MODEL_CONFIGS, DEFAULT_SEED, DEFAULT_STEPS, DEFAULT_GUIDANCE_SCALE, DEFAULT_STRENGTH, SUPPORTED_IMAGE_FORMATS
+    MODEL_CONFIGS, DEFAULT_SEED, SUPPORTED_IMAGE_FORMATS
 )
 
-def make_image_grid(images, rows=1, cols=3):
-    w, h = images[0].size
-    grid = Image.new('RGB', size=(cols * w, rows * h))
-    for i, image in enumerate(images):
-        grid.paste(image.resize((w, h)), box=(i % cols * w, i // cols * h))
-    return grid
-
 def render_inpainting_tab():
     col1, col2 = st.columns([1, 1])
 
@@ -22,23 +17,22 @@ def render_inpainting_tab():
         st.markdown(load_template("cards").split("<!-- Input Card -->")[1].split("<!-- Parameters Card -->")[0], unsafe_allow_html=True)
         selected_model = st.selectbox(
             "Select Style (Inpainting):",
-            options=list(MODEL_CONFIGS.keys()),
-            format_func=lambda x: x,
+            # The base+refiner ensemble is SDXL only
+            options=[name for name, config in MODEL_CONFIGS.items() if config["pipeline"] == "sdxl"],
+            format_func=style_label,
             key="inpaint_model"
         )
         model_config = MODEL_CONFIGS[selected_model]
         uploaded_file = st.file_uploader("Upload an image to inpaint:", type=SUPPORTED_IMAGE_FORMATS)
         mask_file = st.file_uploader("Upload a mask image (white areas will be inpainted):", type=SUPPORTED_IMAGE_FORMATS)
-        if uploaded_file is not None:
-            init_image = Image.open(uploaded_file)
+        # Decoded once per file; the mask is matched to the decoded image
+        init_image = load_upload(uploaded_file, st.session_state, "inpaint_init_image")
+        if init_image is not None:
             st.image(init_image, caption="Original Image", use_container_width=True)
-        else:
-            init_image = None
-        if mask_file is not None:
-            mask_image = Image.open(mask_file)
+        mask_size = init_image.size if init_image is not None else None
+        mask_image = load_upload(mask_file, st.session_state, "inpaint_mask_image", mode="L", size=mask_size)
+        if mask_image is not None:
             st.image(mask_image, caption="Mask Image", use_container_width=True)
-        else:
-            mask_image = None
         prompt = st.text_area(
             "Enter your prompt:",
             height=80,
@@ -47,8 +41,8 @@ def render_inpainting_tab():
             key="inpaint_prompt"
         )
         st.markdown(load_template("cards").split("<!-- Parameters Card -->")[1].split("<!-- Output Card -->")[0], unsafe_allow_html=True)
-        num_inference_steps = st.slider("Number of inference steps", 20, 100, 75, key="inpaint_steps")
-        guidance_scale = st.slider("Guidance scale", 1.0, 20.0, DEFAULT_GUIDANCE_SCALE, key="inpaint_guidance")
+        # The refiner has no LCM-LoRA, so few-step LCM sampling is not offered
+        scheduler, num_inference_steps, guidance_scale = render_sampling_controls("inpaint", selected_model, default_steps=75, allow_lcm=False)
         high_noise_frac = st.slider("Refiner high noise fraction", 0.0, 1.0, 0.7, key="inpaint_high_noise_frac")
         seed = st.number_input("Seed (for reproducibility)", value=DEFAULT_SEED, step=1, key="inpaint_seed")
         generate_button = st.button("🎨 Inpaint Image", type="primary", key="inpaint_generate")
@@ -60,48 +54,34 @@ def render_inpainting_tab():
             loading_container = st.empty()
             loading_container.markdown(load_template("loading"), unsafe_allow_html=True)
             try:
-                with st.spinner("Loading models..."):
-                    pipes = load_model(selected_model, inpainting=True)
-                    base_pipe = pipes["base"]
-                    refiner_pipe = pipes["refiner"]
-                generator = torch.Generator(device="cuda" if torch.cuda.is_available() else "cpu").manual_seed(seed)
-                # BASE: output_type="latent"
-                base_result = base_pipe(
-                    prompt=prompt,
-                    image=init_image,
-                    mask_image=mask_image,
-                    num_inference_steps=num_inference_steps,
-                    guidance_scale=guidance_scale,
-                    denoising_end=high_noise_frac,
-                    output_type="latent",
-                    generator=generator,
-                    return_dict=True
-                )
-                latents = base_result.images
-                # REFINER: input latent, output PIL
-                refined_result = refiner_pipe(
-                    prompt=prompt,
-                    image=latents,
-                    mask_image=mask_image,
-                    num_inference_steps=num_inference_steps,
-                    guidance_scale=guidance_scale,
-                    denoising_start=high_noise_frac,
-                    generator=generator,
-                    return_dict=True
-                )
-                refined_image = refined_result.images[0]
+                # Imported on first generation so script reruns never load torch or diffusers
+                from src.pipelines.engine import inpaint, encode_image
+                from src.pipelines.result_cache import is_hit
+                with st.spinner("Generating..."):
+                    refined_image = run_job(
+                        inpaint,
+                        "inpainting",
+                        on_event=show_previews(image_placeholder),
+                        model_name=selected_model,
+                        prompt=prompt,
+                        image=init_image,
+                        mask_image=mask_image,
+                        num_inference_steps=num_inference_steps,
+                        guidance_scale=guidance_scale,
+                        high_noise_frac=high_noise_frac,
+                        seed=seed,
+                        scheduler=scheduler
+                    )
                 loading_container.empty()
                 # --- Compose grid ---
-                w, h = refined_image.size
-                init_resized = init_image.resize((w, h))
-                mask_resized = mask_image.resize((w, h))
-                grid = make_image_grid([init_resized, mask_resized, refined_image], rows=1, cols=3)
+                with stage("grid_compose", style=selected_model, task="inpainting"):
+                    grid = make_image_grid([init_image, mask_image, refined_image], rows=1, cols=3, size=refined_image.size)
                 image_placeholder.image(grid, caption="Original | Mask | Inpainted", use_container_width=True)
-                buf = io.BytesIO()
-                refined_image.save(buf, format="PNG")
+                if is_hit(refined_image):
+                    st.caption("⚡ Served from the result cache")
                 st.download_button(
                     label="⬇️ Download Inpainted Image",
-                    data=buf.getvalue(),
+                    data=encode_image(refined_image),
                     file_name=f"{selected_model.lower()}_inpainted_refined.png",
                     mime="image/png"
                 )
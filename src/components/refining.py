@@ -1,26 +1,14 @@
 import streamlit as st
-import torch
-import io
 import time
-from PIL import Image
-from src.pipelines.model_loader import load_model
+from src.components.sampling import render_sampling_controls
+from src.pipelines.warmup import style_label
+from src.utils.job_runner import run_job, show_previews
 from src.utils.template_loader import load_template
 from src.config.constants import (
     MODEL_CONFIGS,
-    DEFAULT_SEED,
-    DEFAULT_STEPS,
-    DEFAULT_GUIDANCE_SCALE,
-    SUPPORTED_IMAGE_FORMATS
+    DEFAULT_SEED
 )
 
-def make_image_grid(images, rows=1, cols=2):
-    """Create a grid of images."""
-    w, h = images[0].size
-    grid = Image.new('RGB', size=(cols * w, rows * h))
-    for i, image in enumerate(images):
-        grid.paste(image, box=(i % cols * w, i // cols * h))
-    return grid
-
 def render_refining_tab():
     # Create two columns for input and output
     col1, col2 = st.columns([1, 1])
@@ -32,8 +20,9 @@ def render_refining_tab():
         # Model selection
         selected_model = st.selectbox(
             "Select Style (Refining):",
-            options=list(MODEL_CONFIGS.keys()),
-            format_func=lambda x: x,
+            # The base+refiner ensemble is SDXL only
+            options=[name for name, config in MODEL_CONFIGS.items() if config["pipeline"] == "sdxl"],
+            format_func=style_label,
             key="refine_model"
         )
         
@@ -52,8 +41,8 @@ def render_refining_tab():
         # Parameters section
         st.markdown(load_template("cards").split("<!-- Parameters Card -->")[1].split("<!-- Output Card -->")[0], unsafe_allow_html=True)
         
-        num_inference_steps = st.slider("Number of inference steps", 20, 50, DEFAULT_STEPS, key="refine_steps")
-        guidance_scale = st.slider("Guidance scale", 1.0, 20.0, DEFAULT_GUIDANCE_SCALE, key="refine_guidance")
+        # The refiner has no LCM-LoRA, so few-step LCM sampling is not offered
+        scheduler, num_inference_steps, guidance_scale = render_sampling_controls("refine", selected_model, max_steps=50, allow_lcm=False)
         denoising_end = st.slider("Denoising end", 0.0, 1.0, 0.8, key="refine_denoising_end")
         
         # Seed control
@@ -76,12 +65,9 @@ def render_refining_tab():
             loading_container.markdown(load_template("loading"), unsafe_allow_html=True)
             
             try:
-                # Load the selected model
-                with st.spinner("Loading models..."):
-                    pipes = load_model(selected_model, img2img=True)
-                    base_pipe = pipes["base"]
-                    refiner_pipe = pipes["refiner"]
-                
+                # Imported on first generation so script reruns never load torch or diffusers
+                from src.pipelines.engine import refine, encode_image
+                from src.pipelines.result_cache import is_hit
                 # Create progress bar and time display
                 progress_bar = st.progress(0)
                 progress_text = st.empty()
@@ -96,7 +82,7 @@ def render_refining_tab():
                     elapsed_time = current_time - start_time
                     
                     # Calculate progress
-                    progress = min(int((step + 1) / num_inference_steps * 100), 100)
+                    progress = min(int(step / num_inference_steps * 100), 100)
                     
                     # Calculate estimated time remaining
                     if step > 0:
@@ -120,51 +106,42 @@ def render_refining_tab():
                             unsafe_allow_html=True
                         )
                 
-                # Set deterministic seed
-                generator = torch.Generator(device="cuda" if torch.cuda.is_available() else "cpu").manual_seed(seed)
-                
-                # Generate image with base model
-                with torch.no_grad():
-                    # BASE: output_type="latent" for refiner, decode for display
-                    progress_text.markdown(
-                        '<span style="color: #FFD700">Stage 1: Generating with base model...</span>', 
-                        unsafe_allow_html=True
-                    )
-                    base_result = base_pipe(
-                        prompt=prompt,
-                        num_inference_steps=num_inference_steps,
-                        guidance_scale=guidance_scale,
-                        denoising_end=denoising_end,
-                        output_type="latent",
-                        generator=generator,
-                        callback=progress_callback,
-                        callback_steps=1,
-                        return_dict=True
-                    )
-                    latents = base_result.images
-                    # Decode latent to PIL for display
-                    base_pil = base_pipe.decode_latents(latents)
-                    base_pil = base_pipe.numpy_to_pil(base_pil)[0]
-                    base_image_placeholder.image(base_pil, caption="Base Image", use_container_width=True)
-                    
+                show_preview = show_previews(refined_image_placeholder)
+
+                # Show latent previews while denoising and the base image as soon as stage 1 finishes
+                def show_base_image(event):
+                    if event["type"] != "base_image":
+                        show_preview(event)
+                        return
+                    base_image_placeholder.image(event["value"], caption="Base Image (preview)", use_container_width=True)
                     # REFINER: input latent, output PIL
                     progress_text.markdown(
                         '<span style="color: #FFD700">Stage 2: Refining with refiner model...</span>', 
                         unsafe_allow_html=True
                     )
-                    refined_result = refiner_pipe(
-                        prompt=prompt,
-                        num_inference_steps=num_inference_steps,
-                        guidance_scale=guidance_scale,
-                        denoising_start=denoising_end,
-                        image=latents,
-                        generator=generator,
-                        callback=progress_callback,
-                        callback_steps=1,
-                        return_dict=True
-                    )
-                    refined_image = refined_result.images[0]
-                    refined_image_placeholder.image(refined_image, caption="Refined Image", use_container_width=True)
+                
+                # BASE: output_type="latent" for refiner, decode for display
+                progress_text.markdown(
+                    '<span style="color: #FFD700">Stage 1: Generating with base model...</span>', 
+                    unsafe_allow_html=True
+                )
+                _, refined_image = run_job(
+                    refine,
+                    "refining",
+                    progress_callback=progress_callback,
+                    on_event=show_base_image,
+                    event_kwargs={"on_base_image": "base_image"},
+                    model_name=selected_model,
+                    prompt=prompt,
+                    num_inference_steps=num_inference_steps,
+                    guidance_scale=guidance_scale,
+                    denoising_end=denoising_end,
+                    seed=seed,
+                    scheduler=scheduler
+                )
+                refined_image_placeholder.image(refined_image, caption="Refined Image", use_container_width=True)
+                if is_hit(refined_image):
+                    st.caption("⚡ Served from the result cache")
                 
                 # Clear loading animation and progress
                 loading_container.empty()
@@ -173,11 +150,9 @@ def render_refining_tab():
                 time_text.empty()
                 
                 # Add download button
-                buf = io.BytesIO()
-                refined_image.save(buf, format="PNG")
                 st.download_button(
                     label="⬇️ Download Refined Image",
-                    data=buf.getvalue(),
+                    data=encode_image(refined_image),
                     file_name=f"{selected_model.lower()}_style_refined.png",
                     mime="image/png"
                 )
@@ -0,0 +1,55 @@
+import streamlit as st
+from src.config.constants import (
+    MODEL_CONFIGS,
+    SCHEDULERS,
+    DEFAULT_SCHEDULER,
+    LCM_LORA_REPOS,
+    DEFAULT_STEPS,
+    DEFAULT_GUIDANCE_SCALE
+)
+
+def render_sampling_controls(
+    key_prefix,
+    model_name=None,
+    default_steps=DEFAULT_STEPS,
+    default_guidance_scale=DEFAULT_GUIDANCE_SCALE,
+    max_steps=100,
+    allow_lcm=True,
+    min_steps=1
+):
+    """Scheduler picker plus step and guidance sliders preset for the chosen scheduler.
+
+    ``default_steps`` and ``default_guidance_scale`` are the tab's settings for
+    the default scheduler; the others start from their ``SCHEDULERS`` preset.
+    ``min_steps`` is the lowest step count the slider offers. Returns
+    ``(scheduler, num_inference_steps, guidance_scale)``, with no scheduler for
+    styles that keep their own sampler.
+    """
+    pipeline_type = MODEL_CONFIGS[model_name]["pipeline"] if model_name else "sdxl"
+    scheduler = None
+    if pipeline_type in LCM_LORA_REPOS:
+        options = [name for name in SCHEDULERS if allow_lcm or name != "lcm"]
+        configured = (MODEL_CONFIGS[model_name].get("scheduler") if model_name else None) or DEFAULT_SCHEDULER
+        scheduler = st.selectbox(
+            "Scheduler",
+            options=options,
+            index=options.index(configured) if configured in options else 0,
+            format_func=lambda name: SCHEDULERS[name]["label"],
+            key=f"{key_prefix}_scheduler"
+        )
+        if scheduler != DEFAULT_SCHEDULER:
+            default_steps = SCHEDULERS[scheduler]["steps"]
+            default_guidance_scale = SCHEDULERS[scheduler]["guidance_scale"]
+        if scheduler == "lcm":
+            st.caption("LCM-LoRA needs only 4-8 steps; guidance 1.0 skips the unconditional pass.")
+    # Keyed by scheduler, so switching starts from that scheduler's preset
+    min_steps = min(min_steps, max_steps)
+    num_inference_steps = st.slider(
+        "Number of inference steps",
+        min_steps,
+        max_steps,
+        max(default_steps, min_steps),
+        key=f"{key_prefix}_steps_{scheduler}"
+    )
+    guidance_scale = st.slider("Guidance scale", 1.0, 20.0, float(default_guidance_scale), key=f"{key_prefix}_guidance_{scheduler}")
+    return scheduler, num_inference_steps, guidance_scale
@@ -0,0 +1,66 @@
+import math
+import streamlit as st
+from src.config.constants import BATCH_MAX_SIZE
+from src.utils.image_grid import make_image_grid
+
+def _parse_values(text, cast, name):
+    try:
+        values = [cast(value) for value in text.replace(";", ",").split(",") if value.strip()]
+    except ValueError:
+        raise ValueError(f"Invalid {name}: '{text}'. Enter comma-separated numbers.")
+    if not values:
+        raise ValueError(f"Enter at least one value for {name}.")
+    return values
+
+def render_sweep_controls(key_prefix, seed, guidance_scale, num_inference_steps, ip_adapter_scale=None):
+    """Expander for sweep mode, prefilled from the single-image settings.
+
+    Returns the raw settings for ``sweep_kwargs``, or None while sweep mode is off.
+    """
+    with st.expander("🔁 Sweep seeds and settings"):
+        enabled = st.checkbox("Generate a grid of variations instead of a single image", key=f"{key_prefix}_sweep")
+        settings = {
+            "seeds": st.text_input("Seeds", value=", ".join(str(int(seed) + i) for i in range(4)), key=f"{key_prefix}_sweep_seeds"),
+            "guidance_scales": st.text_input("Guidance scales", value=str(guidance_scale), key=f"{key_prefix}_sweep_guidance"),
+            "steps": st.text_input("Inference steps", value=str(num_inference_steps), key=f"{key_prefix}_sweep_steps")
+        }
+        if ip_adapter_scale is not None:
+            settings["ip_adapter_scales"] = st.text_input("IP-Adapter influences", value=str(ip_adapter_scale), key=f"{key_prefix}_sweep_ip_scales")
+        st.caption("Comma-separated values. Every combination of settings is run for each seed; the seeds of one combination share a batched pipeline call.")
+    return settings if enabled else None
+
+def sweep_kwargs(settings, strength=None):
+    """Parse sweep settings into ``engine.sweep`` kwargs and the total number of steps.
+
+    With an image-to-image ``strength`` each call denoises only
+    ``int(steps * strength)`` of its steps.
+    """
+    kwargs = {
+        "seeds": _parse_values(settings["seeds"], int, "seeds"),
+        "guidance_scales": _parse_values(settings["guidance_scales"], float, "guidance scales"),
+        "steps": _parse_values(settings["steps"], int, "inference steps")
+    }
+    if "ip_adapter_scales" in settings:
+        kwargs["ip_adapter_scales"] = _parse_values(settings["ip_adapter_scales"], float, "IP-Adapter influences")
+    calls = len(kwargs["guidance_scales"]) * len(kwargs.get("ip_adapter_scales", [None])) * math.ceil(len(kwargs["seeds"]) / BATCH_MAX_SIZE)
+    denoised = [int(steps * strength) if strength is not None else steps for steps in kwargs["steps"]]
+    return kwargs, calls * sum(denoised)
+
+def show_sweep_results(rows, seeds, placeholder, file_name):
+    """Draw a sweep as one grid, a row per combination and a column per seed."""
+    # Imported with the engine, which the caller has already loaded
+    from src.pipelines.engine import encode_image
+
+    grid = make_image_grid([image for row in rows for image in row["images"]], rows=len(rows), cols=len(seeds))
+    placeholder.image(grid, caption=f"Columns: seeds {', '.join(str(seed) for seed in seeds)}", use_container_width=True)
+    for index, row in enumerate(rows, start=1):
+        settings = f"guidance {row['guidance_scale']} · {row['num_inference_steps']} steps"
+        if row["ip_adapter_scale"] is not None:
+            settings += f" · IP-Adapter {row['ip_adapter_scale']}"
+        st.caption(f"Row {index}: {settings}")
+    st.download_button(
+        label="⬇️ Download Grid",
+        data=encode_image(grid),
+        file_name=file_name,
+        mime="image/png"
+    )
@@ -1,15 +1,13 @@
 import streamlit as st
-import torch
-import io
-import time
-from PIL import Image
-from src.pipelines.model_loader import load_model
+from src.components.sampling import render_sampling_controls
+from src.components.sweep import render_sweep_controls, show_sweep_results, sweep_kwargs
+from src.pipelines.warmup import style_label
+from src.utils.image_io import load_upload
+from src.utils.job_runner import run_job, show_previews
 from src.utils.template_loader import load_template
 from src.config.constants import (
     MODEL_CONFIGS,
-    DEFAULT_SEED,
-    DEFAULT_STEPS,
-    DEFAULT_GUIDANCE_SCALE
+    DEFAULT_SEED
 )
 
 def render_text_to_image_tab():
@@ -24,7 +22,7 @@ def render_text_to_image_tab():
         selected_model = st.selectbox(
             "Select Style:",
             options=list(MODEL_CONFIGS.keys()),
-            format_func=lambda x: x
+            format_func=style_label
         )
         
         # Load model configuration
@@ -42,8 +40,8 @@ def render_text_to_image_tab():
         ip_adapter_image = None
         if model_config.get("use_ip_adapter", False):
             uploaded_file = st.file_uploader("Upload reference image for IP-Adapter", type=["png", "jpg", "jpeg"])
-            if uploaded_file is not None:
-                ip_adapter_image = Image.open(uploaded_file)
+            ip_adapter_image = load_upload(uploaded_file, st.session_state, "text2img_ip_adapter_image")
+            if ip_adapter_image is not None:
                 st.image(ip_adapter_image, caption="Reference Image", use_column_width=True)
         
         # Parameters section
@@ -56,8 +54,7 @@ def render_text_to_image_tab():
         with col_height:
             height = st.number_input("Height", min_value=256, max_value=1024, value=512, step=64)
         
-        num_inference_steps = st.slider("Number of inference steps", 20, 100, DEFAULT_STEPS)
-        guidance_scale = st.slider("Guidance scale", 1.0, 20.0, DEFAULT_GUIDANCE_SCALE)
+        scheduler, num_inference_steps, guidance_scale = render_sampling_controls("text2img", selected_model)
         
         # IP-Adapter scale if enabled
         ip_adapter_scale = None
@@ -67,6 +64,9 @@ def render_text_to_image_tab():
         # Seed control
         seed = st.number_input("Seed (for reproducibility)", value=DEFAULT_SEED, step=1)
         
+        # Sweep mode: a grid over seeds and settings
+        sweep_settings = render_sweep_controls("text2img", seed, guidance_scale, num_inference_steps, ip_adapter_scale)
+        
         # Generate button
         generate_button = st.button("🎨 Generate Image", type="primary")
 
@@ -80,49 +80,62 @@ def render_text_to_image_tab():
         if generate_button:
             if prompt:
                 try:
+                    # Imported on first generation so script reruns never load torch or diffusers
+                    from src.pipelines.engine import generate_text_to_image, sweep, encode_image
+                    from src.pipelines.result_cache import is_hit
                     # Create loading animation
                     loading_container = st.empty()
                     with loading_container:
                         st.spinner("Loading model...")
                     
-                    # Load model
-                    pipe = load_model(selected_model)
-                    
                     # Create progress bar
                     progress_bar = st.empty()
                     progress_text = st.empty()
                     time_text = st.empty()
                     
+                    total_steps = num_inference_steps
+                    if sweep_settings is not None:
+                        sweep_args, total_steps = sweep_kwargs(sweep_settings)
+                    
                     # Progress callback
                     def progress_callback(step, timestep, latents):
-                        progress = step / num_inference_steps
+                        progress = min(step / total_steps, 1.0)
                         progress_bar.progress(progress)
-                        progress_text.text(f"Step {step}/{num_inference_steps}")
+                        progress_text.text(f"Step {step}/{total_steps}")
                         time_text.text(f"Timestep: {timestep:.2f}")
                     
-                    # Set up generator for reproducibility
-                    generator = torch.Generator(device="cpu").manual_seed(seed)
-                    
-                    # Prepare generation parameters
-                    gen_params = {
-                        "prompt": prompt,
-                        "height": height,
-                        "width": width,
-                        "num_inference_steps": num_inference_steps,
-                        "guidance_scale": guidance_scale,
-                        "generator": generator,
-                        "callback": progress_callback,
-                        "callback_steps": 1
-                    }
-                    
-                    # Add IP-Adapter parameters if enabled
-                    if model_config.get("use_ip_adapter", False) and ip_adapter_image is not None:
-                        gen_params["ip_adapter_image"] = ip_adapter_image
-                        if ip_adapter_scale is not None:
-                            pipe.set_ip_adapter_scale(ip_adapter_scale)
-                    
-                    # Generate image with progress callback
-                    image = pipe(**gen_params).images[0]
+                    # Generate in a background job; rerunning the script cancels it
+                    if sweep_settings is not None:
+                        result = run_job(
+                            sweep,
+                            "text2img",
+                            on_event=show_previews(image_placeholder),
+                            progress_callback=progress_callback,
+                            model_name=selected_model,
+                            prompt=prompt,
+                            width=width,
+                            height=height,
+                            ip_adapter_image=ip_adapter_image,
+                            scheduler=scheduler,
+                            **sweep_args
+                        )
+                    else:
+                        result = run_job(
+                            generate_text_to_image,
+                            "text2img",
+                            on_event=show_previews(image_placeholder),
+                            progress_callback=progress_callback,
+                            model_name=selected_model,
+                            prompt=prompt,
+                            width=width,
+                            height=height,
+                            num_inference_steps=num_inference_steps,
+                            guidance_scale=guidance_scale,
+                            seed=seed,
+                            ip_adapter_image=ip_adapter_image,
+                            ip_adapter_scale=ip_adapter_scale,
+                            scheduler=scheduler
+                        )
                     
                     # Clear loading animation and progress
                     loading_container.empty()
@@ -130,18 +143,21 @@ def render_text_to_image_tab():
                     progress_text.empty()
                     time_text.empty()
                     
-                    # Display image
-                    image_placeholder.image(image, caption=f"Generated Image using {selected_model} style", use_container_width=True)
-                    
-                    # Add download button
-                    buf = io.BytesIO()
-                    image.save(buf, format="PNG")
-                    st.download_button(
-                        label="⬇️ Download Image",
-                        data=buf.getvalue(),
-                        file_name=f"{selected_model.lower()}_style_output.png",
-                        mime="image/png"
-                    )
+                    if sweep_settings is not None:
+                        show_sweep_results(result, sweep_args["seeds"], image_placeholder, f"{selected_model.lower()}_style_sweep.png")
+                    else:
+                        # Display image
+                        image_placeholder.image(result, caption=f"Generated Image using {selected_model} style", use_container_width=True)
+                        if is_hit(result):
+                            st.caption("⚡ Served from the result cache")
+                        
+                        # Add download button
+                        st.download_button(
+                            label="⬇️ Download Image",
+                            data=encode_image(result),
+                            file_name=f"{selected_model.lower()}_style_output.png",
+                            mime="image/png"
+                        )
                     
                 except Exception as e:
                     # Clear all loading states
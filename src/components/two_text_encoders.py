@@ -1,9 +1,7 @@
 import streamlit as st
-import torch
-import io
-from PIL import Image
+from src.components.sampling import render_sampling_controls
 from src.utils.template_loader import load_template
-from diffusers import StableDiffusionXLPipeline
+from src.utils.job_runner import run_job, show_previews
 
 def render_two_text_encoders_tab():
     col1, col2 = st.columns([1, 1])
@@ -21,8 +19,7 @@ def render_two_text_encoders_tab():
             value="Van Gogh painting",
             key="twoenc_prompt2"
         )
-        num_inference_steps = st.slider("Number of inference steps", 20, 50, 30, key="twoenc_steps")
-        guidance_scale = st.slider("Guidance scale", 1.0, 20.0, 7.5, key="twoenc_guidance")
+        scheduler, num_inference_steps, guidance_scale = render_sampling_controls("twoenc", default_steps=30, default_guidance_scale=7.5, max_steps=50)
         seed = st.number_input("Seed (for reproducibility)", value=42, step=1, key="twoenc_seed")
         generate_button = st.button("🎨 Generate Image", type="primary", key="twoenc_generate")
 
@@ -33,30 +30,28 @@ def render_two_text_encoders_tab():
             loading_container = st.empty()
             loading_container.markdown(load_template("loading"), unsafe_allow_html=True)
             try:
-                with st.spinner("Loading SDXL pipeline..."):
-                    pipe = StableDiffusionXLPipeline.from_pretrained(
-                        "stabilityai/stable-diffusion-xl-base-1.0",
-                        torch_dtype=torch.float32,
-                        variant="fp16",
-                        use_safetensors=True
-                    ).to("cuda" if torch.cuda.is_available() else "cpu")
-                generator = torch.Generator(device="cuda" if torch.cuda.is_available() else "cpu").manual_seed(seed)
-                result = pipe(
-                    prompt=prompt,
-                    prompt_2=prompt_2,
-                    num_inference_steps=num_inference_steps,
-                    guidance_scale=guidance_scale,
-                    generator=generator,
-                    return_dict=True
-                )
-                image = result.images[0]
+                # Imported on first generation so script reruns never load torch or diffusers
+                from src.pipelines.engine import generate_two_text_encoders, encode_image
+                from src.pipelines.result_cache import is_hit
+                with st.spinner("Generating..."):
+                    image = run_job(
+                        generate_two_text_encoders,
+                        "two_text_encoders",
+                        on_event=show_previews(image_placeholder),
+                        prompt=prompt,
+                        prompt_2=prompt_2,
+                        num_inference_steps=num_inference_steps,
+                        guidance_scale=guidance_scale,
+                        seed=seed,
+                        scheduler=scheduler
+                    )
                 loading_container.empty()
                 image_placeholder.image(image, caption="SDXL Two Text-Encoders Result", use_container_width=True)
-                buf = io.BytesIO()
-                image.save(buf, format="PNG")
+                if is_hit(image):
+                    st.caption("⚡ Served from the result cache")
                 st.download_button(
                     label="⬇️ Download Image",
-                    data=buf.getvalue(),
+                    data=encode_image(image),
                     file_name="sdxl_two_text_encoders.png",
                     mime="image/png"
                 )
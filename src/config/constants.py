@@ -1,6 +1,11 @@
 """
 Constants and configuration values for the Stable Diffusion Image Generator.
 """
+import os
+from dotenv import load_dotenv
+
+# Load environment variables from .env file before any setting below is read
+load_dotenv()
 
 # Model configurations for different styles
 MODEL_CONFIGS = {
@@ -9,8 +14,10 @@ MODEL_CONFIGS = {
         "lora_path": "models/disney_style_xl.safetensors",
         "default_prompt": "disney style, animal focus, animal, cat",
         "use_safetensors": True,
+        "precision": "fp32",
         "is_sdxl": True,
         "pipeline": "sdxl",
+        "scheduler": "euler_a",
         "use_ip_adapter": True,
         "ip_adapter_scale": 0.6
     },
@@ -19,6 +26,7 @@ MODEL_CONFIGS = {
         "lora_path": "models/joco.safetensors",
         "default_prompt": "A cartoon style couple takes a selfie in front of an Egyptian pyramid, which is composed of a man and a woman, both wearing sunglasses. Men wear blue shirts, jeans, and white shoes, while women wear yellow hats, blue jackets, white tops, orange dresses, and pink sneakers. Sand and a group of tourists in the distance. Integrating reality and cartoon elements.",
         "use_safetensors": True,
+        "precision": "fp32",
         "is_sdxl": False,
         "pipeline": "flux"
     },
@@ -27,8 +35,10 @@ MODEL_CONFIGS = {
         "lora_path": "models/pytorch_lora_weights.safetensors",
         "default_prompt": "Draw a picture of two female boxers fighting each other.",
         "use_safetensors": True,
+        "precision": "fp32",
         "is_sdxl": True,
         "pipeline": "sdxl",
+        "scheduler": "euler_a",
         "use_ip_adapter": True,
         "ip_adapter_scale": 0.6
     },
@@ -37,16 +47,20 @@ MODEL_CONFIGS = {
         "lora_path": "models/ClayAnimationRedmond15-ClayAnimation-Clay.safetensors",
         "default_prompt": "A cute blonde girl, ,Clay Animation, Clay,",
         "use_safetensors": True,
+        "precision": "fp32",
         "is_sdxl": False,
-        "pipeline": "stable-diffusion"
+        "pipeline": "stable-diffusion",
+        "scheduler": "euler_a"
     },
     "StoryboardSketch": {
         "base_model": "stabilityai/stable-diffusion-xl-base-1.0",
         "lora_path": "models/Storyboard_sketch.safetensors",
         "default_prompt": "storyboard sketch of a zombie basketball player dunking with both hands, action shot, motion blur, hero",
         "use_safetensors": True,
+        "precision": "fp32",
         "is_sdxl": True,
         "pipeline": "sdxl",
+        "scheduler": "euler_a",
         "use_ip_adapter": True,
         "ip_adapter_scale": 0.6
     },
@@ -55,24 +69,134 @@ MODEL_CONFIGS = {
         "lora_path": "models/Graphic_Novel_Illustration-000007.safetensors",
         "default_prompt": "breathtaking highly detailed graphic novel illustration of morgan freeman riding a harley davidson motorcycle, dark and gritty",
         "use_safetensors": True,
+        "precision": "fp32",
         "is_sdxl": True,
         "pipeline": "sdxl",
+        "scheduler": "euler_a",
         "use_ip_adapter": True,
         "ip_adapter_scale": 0.6
     }
 }
 
+# Samplers a style can run with, set per style ("scheduler" in MODEL_CONFIGS)
+# and selectable per request. Steps and guidance are presets of comparable
+# quality: the multistep solvers converge in fewer steps than Euler Ancestral,
+# and "lcm" stacks the LCM-LoRA on the style's LoRA for few-step sampling
+# without classifier-free guidance. Flux keeps its own sampler.
+SCHEDULERS = {
+    "euler_a": {"label": "Euler Ancestral", "steps": 30, "guidance_scale": 7.5},
+    "dpmpp_2m": {"label": "DPM-Solver++ 2M Karras", "steps": 20, "guidance_scale": 7.0},
+    "unipc": {"label": "UniPC", "steps": 12, "guidance_scale": 7.0},
+    "lcm": {"label": "LCM-LoRA (few steps)", "steps": 6, "guidance_scale": 1.0}
+}
+DEFAULT_SCHEDULER = "euler_a"
+LCM_LORA_REPOS = {
+    "sdxl": "latent-consistency/lcm-lora-sdxl",
+    "stable-diffusion": "latent-consistency/lcm-lora-sdv1-5"
+}
+
+# Dynamic batching of concurrent text2img/img2img requests: largest batch and
+# how long the oldest request may wait for companions
+BATCHING_ENABLED = os.getenv("BATCHING_ENABLED", "1") == "1"
+BATCH_MAX_SIZE = int(os.getenv("BATCH_MAX_SIZE", "4"))
+BATCH_MAX_WAIT_MS = float(os.getenv("BATCH_MAX_WAIT_MS", "50"))
+
+# Emit per-stage metrics as JSON log lines on stderr
+METRICS_LOG = os.getenv("METRICS_LOG", "0") == "1"
+
+# Deserialize the UNet, VAE, text encoders and tokenizers of SD1.5 and SDXL
+# pipelines concurrently, on this many threads
+PARALLEL_LOADING = os.getenv("PARALLEL_LOADING", "1") == "1"
+LOAD_WORKERS = int(os.getenv("LOAD_WORKERS", "4"))
+
+# Warm pool: styles preloaded in the background at startup, the tasks they are
+# warmed for and the denoising steps of the dummy generation
+WARM_STYLES = [s.strip() for s in os.getenv("WARM_STYLES", "").split(",") if s.strip()]
+WARM_TASKS = [t.strip() for t in os.getenv("WARM_TASKS", "text2img").split(",") if t.strip()]
+WARMUP_STEPS = int(os.getenv("WARMUP_STEPS", "2"))
+
+# Steps between approximate latent previews published by generation jobs; 0
+# disables previews
+PREVIEW_EVERY = int(os.getenv("PREVIEW_EVERY", "5"))
+
+# Threads running background generation jobs
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+
+# Inference worker processes, each pinned to its own slice of the CPU cores;
+# 0 runs generation in the server process. Keep JOB_WORKERS at least as large
+# so every worker can be busy at once
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+
+# Plain SDXL base used by the two text-encoders tab
+TWO_TEXT_ENCODERS_MODEL = "stabilityai/stable-diffusion-xl-base-1.0"
+
 # File paths
 STATIC_DIR = "static"
 TEMPLATES_DIR = "templates"
 CSS_DIR = "css"
 MODELS_DIR = "models"
 
+# Hub repos loaded next to the style base models
+IP_ADAPTER_REPO = "h94/IP-Adapter"
+IP_ADAPTER_SUBFOLDER = "sdxl_models"
+IP_ADAPTER_WEIGHT_NAME = "ip-adapter_sdxl.bin"
+REFINER_MODEL = "stabilityai/stable-diffusion-xl-refiner-1.0"
+
+# Local model store: manifest of pinned snapshots, where prefetch puts them, and
+# strict offline mode that never contacts the Hub
+MODEL_STORE_MANIFEST = os.getenv("MODEL_STORE_MANIFEST", os.path.join(MODELS_DIR, "manifest.json"))
+MODEL_STORE_DIR = os.getenv("MODEL_STORE_DIR", os.path.join(MODELS_DIR, "hub"))
+OFFLINE_MODE = os.getenv("OFFLINE_MODE", "0") == "1"
+if OFFLINE_MODE:
+    # huggingface_hub, diffusers and transformers read these once, when first
+    # imported; every entry point imports this module before any of them
+    os.environ["HF_HUB_OFFLINE"] = "1"
+    os.environ["TRANSFORMERS_OFFLINE"] = "1"
+
+# Pipeline cache: byte budget for resident pipelines and styles kept loaded
+# regardless of how recently they were used
+PIPELINE_CACHE_BUDGET_BYTES = int(float(os.getenv("PIPELINE_CACHE_BUDGET_GB", "24")) * 1024 ** 3)
+PINNED_STYLES = [s.strip() for s in os.getenv("PINNED_STYLES", "").split(",") if s.strip()]
+_unknown_pinned = [s for s in PINNED_STYLES if s not in MODEL_CONFIGS]
+if _unknown_pinned:
+    raise ValueError(
+        f"PINNED_STYLES names unknown styles: {', '.join(_unknown_pinned)}. "
+        f"Expected any of {', '.join(MODEL_CONFIGS)}"
+    )
+
+# Prompt embedding cache: in-memory entries, optional on-disk tier and whether
+# the default prompts of every style are encoded when the app starts
+PROMPT_CACHE_SIZE = int(os.getenv("PROMPT_CACHE_SIZE", "256"))
+PROMPT_CACHE_DIR = os.getenv("PROMPT_CACHE_DIR") or None
+PRECOMPUTE_DEFAULT_PROMPTS = os.getenv("PRECOMPUTE_DEFAULT_PROMPTS", "0") == "1"
+
+# VAE-encoded img2img and inpainting init images kept in memory
+LATENT_CACHE_SIZE = int(os.getenv("LATENT_CACHE_SIZE", "32"))
+
+# Finished generations stored on disk as PNG and replayed for identical
+# requests; an empty RESULT_CACHE_DIR disables the cache
+RESULT_CACHE_DIR = os.getenv("RESULT_CACHE_DIR", os.path.join("cache", "results"))
+RESULT_CACHE_MAX_BYTES = int(float(os.getenv("RESULT_CACHE_MAX_GB", "2")) * 1024 ** 3)
+
+# IP-Adapter reference image embeddings kept in memory
+IP_ADAPTER_CACHE_SIZE = int(os.getenv("IP_ADAPTER_CACHE_SIZE", "64"))
+
+# Precision of loaded pipelines: "fp32", "bf16" or "int8" (CPU only). Each
+# style's "precision" entry picks its mode; PRECISION_MODE overrides them all
+PRECISION_MODE = os.getenv("PRECISION_MODE") or None
+
+# Merge the active style's LoRA into the base weights and fuse the attention
+# QKV projections when a style is activated (float32 bases only)
+FUSED_MODE = os.getenv("FUSED_MODE", "0") == "1"
+
 # UI Constants
 DEFAULT_SEED = 123
 DEFAULT_STEPS = 30
 DEFAULT_GUIDANCE_SCALE = 7.5
 DEFAULT_STRENGTH = 0.75
 
+# Uploads are decoded no larger than this on their longest side
+UPLOAD_MAX_SIDE = int(os.getenv("UPLOAD_MAX_SIDE", "1024"))
+
 # Supported image formats
 SUPPORTED_IMAGE_FORMATS = ["png", "jpg", "jpeg"] 
\ No newline at end of file
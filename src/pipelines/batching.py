@@ -0,0 +1,127 @@
+"""
+Dynamic batching of concurrent generation requests.
+
+Requests are queued under a compatibility key (style, task, resolution, step
+count, guidance and anything else that must be uniform across one pipeline
+call). A single worker thread runs a full group as one batched call right
+away, oldest first, and otherwise takes the oldest group once its oldest
+request has waited ``max_wait_ms``.
+Progress events are queued per request and replayed in the caller's thread by
+``BatchRequest.wait``, so UI callbacks never run on the worker thread.
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from src.pipelines.jobs import JobCancelled
+
+class BatchRequest:
+    def __init__(self, key, params, progress_callback=None, cancel_event=None):
+        self.key = key
+        self.params = params
+        self.future = Future()
+        self.events = queue.Queue()
+        self.enqueued_at = time.monotonic()
+        self.cancel_event = cancel_event
+        # Set only when the request runs in the caller's own thread
+        self._direct_callback = progress_callback
+
+    @property
+    def cancelled(self):
+        return self.cancel_event is not None and self.cancel_event.is_set()
+
+    def publish(self, *event):
+        if self._direct_callback is not None:
+            self._direct_callback(*event)
+        else:
+            self.events.put(event)
+
+    def wait(self, progress_callback=None, poll_interval=0.05):
+        """Block until the batch containing this request has run.
+
+        Progress events published by the worker are passed to
+        ``progress_callback`` from the calling thread. A cancelled request is
+        withdrawn if its batch has not started; otherwise its result is
+        discarded and the batch stops early once every member is cancelled.
+        """
+        while True:
+            if self.cancelled:
+                self.future.cancel()
+                raise JobCancelled()
+            try:
+                event = self.events.get(timeout=poll_interval)
+            except queue.Empty:
+                if self.future.done():
+                    break
+                continue
+            if progress_callback is not None:
+                progress_callback(*event)
+        return self.future.result()
+
+class BatchScheduler:
+    def __init__(self, run_batch, max_batch_size=4, max_wait_ms=50):
+        self._run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._pending = {}
+        self._cond = threading.Condition()
+        self._thread = None
+        self.batches = 0
+        self.requests = 0
+
+    def submit(self, key, params, cancel_event=None):
+        request = BatchRequest(key, params, cancel_event=cancel_event)
+        with self._cond:
+            self._pending.setdefault(key, []).append(request)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._worker, name="batch-scheduler", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return request
+
+    def _next_batch(self):
+        with self._cond:
+            while True:
+                if not self._pending:
+                    self._cond.wait()
+                    continue
+                # A full group has nothing to wait for, even behind an older
+                # partial one; otherwise serve the group waiting longest
+                full = [item for item in self._pending.items() if len(item[1]) >= self.max_batch_size]
+                key, group = min(full or self._pending.items(), key=lambda item: item[1][0].enqueued_at)
+                remaining = group[0].enqueued_at + self.max_wait - time.monotonic()
+                if len(group) >= self.max_batch_size or remaining <= 0:
+                    batch, rest = group[:self.max_batch_size], group[self.max_batch_size:]
+                    if rest:
+                        self._pending[key] = rest
+                    else:
+                        del self._pending[key]
+                    return key, batch
+                self._cond.wait(remaining)
+
+    def _worker(self):
+        while True:
+            key, batch = self._next_batch()
+            live = [request for request in batch if request.future.set_running_or_notify_cancel()]
+            if not live:
+                continue
+            self.batches += 1
+            self.requests += len(live)
+            try:
+                results = self._run_batch(key, live)
+            except Exception as e:
+                for request in live:
+                    request.future.set_exception(e)
+                continue
+            for request, result in zip(live, results):
+                request.future.set_result(result)
+
+    def stats(self):
+        with self._cond:
+            queued = sum(len(group) for group in self._pending.values())
+        return {
+            "batches": self.batches,
+            "requests": self.requests,
+            "mean_batch_size": self.requests / self.batches if self.batches else 0.0,
+            "queued": queued
+        }
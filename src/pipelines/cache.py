@@ -0,0 +1,113 @@
+"""
+Memory-budgeted LRU cache for resident pipelines.
+
+Entries are sized by the bytes held in their parameters and buffers. When the
+total exceeds the budget the least recently used entries are evicted, except
+for pinned ones, which stay resident regardless of age.
+"""
+import gc
+import threading
+from collections import OrderedDict
+import torch
+
+class PipelineCache:
+    def __init__(self, budget_bytes, on_evict=None):
+        self.budget_bytes = budget_bytes
+        self._entries = OrderedDict()
+        self._sizes = {}
+        self._last_sizes = {}
+        self._pinned = set()
+        self._on_evict = on_evict
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get(self, key):
+        """Return the entry for ``key`` and mark it most recently used."""
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def peek(self, key):
+        """Return the entry for ``key`` without touching LRU order or counters."""
+        return self._entries.get(key)
+
+    def keys(self):
+        return list(self._entries)
+
+    def reserve(self, key):
+        """Evict ahead of a load, using the size ``key`` had last time it was resident."""
+        with self._lock:
+            self._evict_until(self._last_sizes.get(key, 0), keep=key)
+
+    def put(self, key, value, nbytes):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            self._sizes[key] = nbytes
+            self._last_sizes[key] = nbytes
+            self._evict_until(0, keep=key)
+
+    def resize(self, key, nbytes):
+        """Update the measured size of ``key``, e.g. after an adapter was added."""
+        with self._lock:
+            if key not in self._entries:
+                return
+            self._sizes[key] = nbytes
+            self._last_sizes[key] = nbytes
+            self._evict_until(0, keep=key)
+
+    def pin(self, key):
+        with self._lock:
+            self._pinned.add(key)
+
+    def unpin(self, key):
+        with self._lock:
+            self._pinned.discard(key)
+            self._evict_until(0)
+
+    def evict(self, key):
+        with self._lock:
+            if key not in self._entries:
+                return
+            value = self._entries.pop(key)
+            self._sizes.pop(key, None)
+            self.evictions += 1
+            if self._on_evict is not None:
+                self._on_evict(key, value)
+        del value
+        gc.collect()
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    @property
+    def total_bytes(self):
+        return sum(self._sizes.values())
+
+    def _evict_until(self, incoming_bytes, keep=None):
+        for key in list(self._entries):
+            if self.total_bytes + incoming_bytes <= self.budget_bytes:
+                return
+            if key == keep or key in self._pinned:
+                continue
+            self.evict(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "pinned": sorted(str(key) for key in self._pinned if key in self._entries),
+                "resident_bytes": self.total_bytes,
+                "budget_bytes": self.budget_bytes
+            }
@@ -0,0 +1,299 @@
+"""
+Content-addressed caches for conditioning computed ahead of the denoising loop.
+
+Prompt embeddings are keyed by the identity of the text encoders and
+tokenizers, the prompts themselves and the LoRA adapters active on the text
+encoders. Entries are held in an in-memory LRU and, when ``PROMPT_CACHE_DIR``
+is set, mirrored to disk so they survive restarts.
+
+IP-Adapter reference images are keyed by a hash of their pixel content and the
+image encoder, so the CLIP vision encoder runs once per unique image.
+
+Init images of img2img and inpainting are VAE-encoded once per pixel content,
+resolution and VAE; changing strength, seed, guidance or prompt reuses the
+latents.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+import torch
+from src.config.constants import (
+    MODEL_CONFIGS,
+    PROMPT_CACHE_SIZE,
+    PROMPT_CACHE_DIR,
+    IP_ADAPTER_CACHE_SIZE,
+    LATENT_CACHE_SIZE
+)
+from src.utils.metrics import stage
+
+class LRUCache:
+    """Thread-safe LRU mapping bounded by entry count."""
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+_prompt_cache = LRUCache(PROMPT_CACHE_SIZE)
+_image_embed_cache = LRUCache(IP_ADAPTER_CACHE_SIZE)
+_latent_cache = LRUCache(LATENT_CACHE_SIZE)
+
+def _module_id(module):
+    if module is None:
+        return None
+    config = getattr(module, "config", None)
+    name = getattr(config, "_name_or_path", None) or getattr(module, "name_or_path", None)
+    # The same weights in another precision produce different embeddings
+    return (name, getattr(module, "precision_mode", "fp32"))
+
+def _text_lora_state(pipe):
+    """Adapters that are active on the text encoders of ``pipe``."""
+    if not hasattr(pipe, "get_list_adapters"):
+        return ()
+    try:
+        active = set(pipe.get_active_adapters())
+        loaded = pipe.get_list_adapters()
+    except ValueError:
+        # Raised by diffusers when no PEFT adapters have been loaded
+        return ()
+    return tuple(sorted(
+        (component, adapter)
+        for component, adapters in loaded.items()
+        if component.startswith("text_encoder")
+        for adapter in adapters
+        if adapter in active
+    ))
+
+def _pipeline_family(pipe):
+    """``"sdxl"``, ``"sd"`` or ``None`` for pipelines whose prompts are not cached."""
+    name = type(pipe).__name__
+    if name.startswith("StableDiffusionXL"):
+        return "sdxl"
+    if name.startswith("StableDiffusion"):
+        return "sd"
+    return None
+
+def prompt_cache_key(pipe, prompt, prompt_2=None, negative_prompt=None):
+    encoders = (getattr(pipe, "text_encoder", None), getattr(pipe, "text_encoder_2", None))
+    tokenizers = (getattr(pipe, "tokenizer", None), getattr(pipe, "tokenizer_2", None))
+    return (
+        tuple(_module_id(encoder) for encoder in encoders),
+        tuple(getattr(tokenizer, "name_or_path", None) for tokenizer in tokenizers),
+        prompt,
+        prompt_2,
+        negative_prompt,
+        _text_lora_state(pipe)
+    )
+
+def _disk_path(key):
+    digest = hashlib.sha256(repr(key).encode("utf-8")).hexdigest()
+    return os.path.join(PROMPT_CACHE_DIR, f"{digest}.pt")
+
+def _load_from_disk(key, device):
+    if not PROMPT_CACHE_DIR:
+        return None
+    path = _disk_path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        return torch.load(path, map_location=device, weights_only=True)
+    except Exception:
+        # A truncated or stale file is simply recomputed
+        return None
+
+def _save_to_disk(key, embeds):
+    if not PROMPT_CACHE_DIR:
+        return
+    os.makedirs(PROMPT_CACHE_DIR, exist_ok=True)
+    path = _disk_path(key)
+    # A temp file of its own, as the same prompt may be encoded twice at once
+    fd, tmp_path = tempfile.mkstemp(dir=PROMPT_CACHE_DIR, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            torch.save({name: tensor.cpu() for name, tensor in embeds.items()}, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+def _encode(pipe, prompt, prompt_2, negative_prompt):
+    with torch.no_grad():
+        if _pipeline_family(pipe) == "sdxl":
+            prompt_embeds, negative_prompt_embeds, pooled, negative_pooled = pipe.encode_prompt(
+                prompt=prompt,
+                prompt_2=prompt_2,
+                device=pipe.device,
+                num_images_per_prompt=1,
+                do_classifier_free_guidance=True,
+                negative_prompt=negative_prompt
+            )
+            return {
+                "prompt_embeds": prompt_embeds,
+                "negative_prompt_embeds": negative_prompt_embeds,
+                "pooled_prompt_embeds": pooled,
+                "negative_pooled_prompt_embeds": negative_pooled
+            }
+        prompt_embeds, negative_prompt_embeds = pipe.encode_prompt(
+            prompt,
+            pipe.device,
+            1,
+            True,
+            negative_prompt
+        )
+        return {
+            "prompt_embeds": prompt_embeds,
+            "negative_prompt_embeds": negative_prompt_embeds
+        }
+
+def encode_prompt_cached(pipe, prompt, prompt_2=None, negative_prompt=None):
+    """Return pipeline kwargs carrying the embeddings for ``prompt``.
+
+    The result replaces ``prompt``/``prompt_2``/``negative_prompt`` in the
+    pipeline call. Pipelines other than SD1.5 and SDXL (Flux) get the raw
+    prompts back unchanged.
+    """
+    if _pipeline_family(pipe) is None:
+        params = {"prompt": prompt}
+        if prompt_2 is not None:
+            params["prompt_2"] = prompt_2
+        if negative_prompt is not None:
+            params["negative_prompt"] = negative_prompt
+        return params
+
+    key = prompt_cache_key(pipe, prompt, prompt_2, negative_prompt)
+    embeds = _prompt_cache.get(key)
+    if embeds is None:
+        embeds = _load_from_disk(key, pipe.device)
+        if embeds is None:
+            with stage("text_encode"):
+                embeds = _encode(pipe, prompt, prompt_2, negative_prompt)
+            _save_to_disk(key, embeds)
+        _prompt_cache.put(key, embeds)
+    return dict(embeds)
+
+def precompute_default_prompts(model_names=None):
+    """Encode the ``default_prompt`` of each style so first clicks hit the cache."""
+    # Imported here so the cache module stays usable without the loader
+    from src.pipelines.model_loader import use_model
+
+    for model_name in model_names or list(MODEL_CONFIGS):
+        config = MODEL_CONFIGS[model_name]
+        if config["pipeline"] == "flux":
+            continue
+        with use_model(model_name) as pipe:
+            encode_prompt_cached(pipe, config["default_prompt"])
+
+def prompt_cache_stats():
+    return _prompt_cache.stats()
+
+def image_content_hash(image):
+    """Hash of a PIL image's mode, size and decoded pixels."""
+    digest = hashlib.sha256()
+    digest.update(f"{image.mode}:{image.size[0]}x{image.size[1]}".encode("utf-8"))
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+def encode_ip_adapter_image_cached(pipe, image, do_classifier_free_guidance=True):
+    """Return pipeline kwargs carrying the IP-Adapter embeddings for ``image``.
+
+    ``do_classifier_free_guidance`` must match the pipeline call (guidance
+    scale above 1), since it decides whether negative embeddings are included.
+    The adapter scale is applied inside the UNet, so one entry serves every
+    scale and every style sharing the image encoder.
+    """
+    key = (
+        _module_id(pipe.image_encoder),
+        image_content_hash(image),
+        bool(do_classifier_free_guidance)
+    )
+    embeds = _image_embed_cache.get(key)
+    if embeds is None:
+        with torch.no_grad(), stage("ip_adapter_encode"):
+            embeds = pipe.prepare_ip_adapter_image_embeds(
+                image,
+                None,
+                pipe.device,
+                1,
+                do_classifier_free_guidance
+            )
+        _image_embed_cache.put(key, embeds)
+    return {"ip_adapter_image_embeds": list(embeds)}
+
+def ip_adapter_cache_stats():
+    return _image_embed_cache.stats()
+
+def _vae_encode(pipe, pixels):
+    vae = pipe.vae
+    with torch.no_grad(), stage("vae_encode"):
+        latents = vae.encode(pixels.to(device=vae.device, dtype=vae.dtype)).latent_dist.mode()
+    # Pipelines take pre-encoded latents already scaled
+    return latents * vae.config.scaling_factor
+
+def encode_image_latents_cached(pipe, image, height=None, width=None):
+    """VAE latents of an init image, to pass as ``image`` to img2img/inpainting.
+
+    ``height``/``width`` are the size the pipeline would resize ``image`` to
+    (its own size when None). The distribution mode is used, so the latents
+    do not depend on the seed. Pipelines other than SD1.5 and SDXL get the
+    image back unchanged.
+    """
+    if _pipeline_family(pipe) is None:
+        return image
+    height, width = pipe.image_processor.get_default_height_width(image, height, width)
+    key = (_module_id(pipe.vae), image_content_hash(image), height, width)
+    latents = _latent_cache.get(key)
+    if latents is None:
+        pixels = pipe.image_processor.preprocess(image, height=height, width=width)
+        latents = _vae_encode(pipe, pixels)
+        _latent_cache.put(key, latents)
+    return latents
+
+def encode_masked_image_latents_cached(pipe, image, mask_image, height, width):
+    """VAE latents of ``image`` with the masked area blanked, for 9-channel inpainting UNets."""
+    key = (_module_id(pipe.vae), image_content_hash(image), image_content_hash(mask_image), height, width)
+    latents = _latent_cache.get(key)
+    if latents is None:
+        pixels = pipe.image_processor.preprocess(image, height=height, width=width)
+        mask = pipe.mask_processor.preprocess(mask_image, height=height, width=width)
+        latents = _vae_encode(pipe, pixels * (mask < 0.5))
+        _latent_cache.put(key, latents)
+    return latents
+
+def latent_cache_stats():
+    return _latent_cache.stats()
+
+def clear_caches():
+    """Drop every in-memory prompt and IP-Adapter embedding and init latent."""
+    _prompt_cache.clear()
+    _image_embed_cache.clear()
+    _latent_cache.clear()
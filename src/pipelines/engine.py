@@ -0,0 +1,656 @@
+"""
+UI-free generation engine.
+
+Every generation flow of the app lives here so the Streamlit tabs and the
+FastAPI service run exactly the same code. Functions take plain parameters and
+PIL images and return PIL images; encoding for download or transport is left to
+``encode_image``.
+
+Text-to-image and image-to-image requests go through a batching scheduler
+when ``BATCHING_ENABLED`` is set, so concurrent compatible requests share one
+UNet forward pass per step. ``sweep`` runs a grid of settings over a list of
+seeds as batched calls instead.
+
+Every flow first looks its request up in the on-disk result cache, so an
+identical request returns the stored image without loading a model.
+"""
+import io
+import itertools
+import math
+import threading
+import time
+import torch
+from src.config.constants import (
+    MODEL_CONFIGS,
+    DEFAULT_SEED,
+    DEFAULT_STEPS,
+    DEFAULT_GUIDANCE_SCALE,
+    DEFAULT_STRENGTH,
+    TWO_TEXT_ENCODERS_MODEL,
+    BATCHING_ENABLED,
+    BATCH_MAX_SIZE,
+    BATCH_MAX_WAIT_MS
+)
+from src.pipelines.batching import BatchRequest, BatchScheduler
+from src.pipelines.jobs import JobCancelled
+from src.pipelines.model_loader import use_model, use_base, use_ensemble
+from src.pipelines.fusion import fusion_state
+from src.pipelines.embedding_cache import (
+    encode_prompt_cached,
+    encode_ip_adapter_image_cached,
+    encode_image_latents_cached,
+    encode_masked_image_latents_cached
+)
+from src.pipelines.precision import denoiser, inference_context
+from src.pipelines.previews import latent_space, latents_to_rgb
+from src.pipelines.result_cache import cached, is_hit, lookup, store
+from src.pipelines.schedulers import resolve_scheduler
+from src.utils.metrics import flow_labels, labels, observe, stage
+
+def _device():
+    return "cuda" if torch.cuda.is_available() else "cpu"
+
+def _step_end_callback(on_step=None, should_cancel=None):
+    """``callback_on_step_end`` kwargs reporting progress and honouring cancellation.
+
+    ``on_step(step, timestep, latents)`` receives the number of completed steps.
+    ``should_cancel()`` is checked at every step boundary and aborts the
+    pipeline call with ``JobCancelled``. The time between step boundaries is
+    recorded as the ``unet_step`` stage, labelled with the denoiser's fusion.
+    """
+    last_step_end = [None]
+
+    def callback(pipe, step_index, timestep, callback_kwargs):
+        now = time.perf_counter()
+        if last_step_end[0] is not None:
+            observe("unet_step", now - last_step_end[0], fusion=fusion_state(pipe))
+        last_step_end[0] = now
+        if should_cancel is not None and should_cancel():
+            raise JobCancelled()
+        if on_step is not None:
+            on_step(step_index + 1, timestep, callback_kwargs["latents"])
+        return callback_kwargs
+
+    return {"callback_on_step_end": callback, "callback_on_step_end_tensor_inputs": ["latents"]}
+
+def _cancel_check(cancel_event):
+    return cancel_event.is_set if cancel_event is not None else None
+
+def has_ip_adapter(pipe):
+    unet = getattr(pipe, "unet", None)
+    return getattr(unet, "encoder_hid_proj", None) is not None and getattr(pipe, "image_encoder", None) is not None
+
+def ip_adapter_params(pipe, image, scale, do_classifier_free_guidance):
+    """IP-Adapter kwargs for a pipeline call.
+
+    A UNet with an IP-Adapter loaded requires image embeddings on every call,
+    so without a reference image the adapter is neutralised with zero
+    embeddings at scale 0.
+    """
+    if not has_ip_adapter(pipe):
+        return {}
+    if image is None:
+        pipe.set_ip_adapter_scale(0.0)
+        batch = 2 if do_classifier_free_guidance else 1
+        dim = pipe.image_encoder.config.projection_dim
+        zeros = torch.zeros(batch, 1, dim, device=pipe.device, dtype=denoiser(pipe).dtype)
+        return {"ip_adapter_image_embeds": [zeros]}
+    if scale is not None:
+        pipe.set_ip_adapter_scale(scale)
+    return encode_ip_adapter_image_cached(pipe, image, do_classifier_free_guidance)
+
+def stack_conditioning(conditionings, do_classifier_free_guidance):
+    """Concatenate per-request pipeline kwargs into one batch.
+
+    Prompt embeddings are concatenated along the batch dimension. IP-Adapter
+    embeddings carry ``[negative; positive]`` halves under guidance, so the
+    halves are stacked separately to keep that layout.
+    """
+    if len(conditionings) == 1:
+        return dict(conditionings[0])
+    stacked = {}
+    for name in conditionings[0]:
+        values = [conditioning[name] for conditioning in conditionings]
+        if name == "ip_adapter_image_embeds":
+            per_adapter = []
+            for adapter_embeds in zip(*values):
+                if do_classifier_free_guidance:
+                    halves = [embeds.chunk(2) for embeds in adapter_embeds]
+                    negative = torch.cat([half[0] for half in halves])
+                    positive = torch.cat([half[1] for half in halves])
+                    per_adapter.append(torch.cat([negative, positive]))
+                else:
+                    per_adapter.append(torch.cat(adapter_embeds))
+            stacked[name] = per_adapter
+        elif isinstance(values[0], torch.Tensor):
+            stacked[name] = torch.cat(values)
+        else:
+            stacked[name] = values
+    return stacked
+
+def _resolve_ip_adapter(model_name, ip_adapter_image, ip_adapter_scale):
+    """Reference image and adapter scale a request runs with.
+
+    Without a reference image, or on a style without the adapter, the adapter
+    runs at scale 0; an image without a scale gets the style's configured one.
+    """
+    config = MODEL_CONFIGS[model_name]
+    if ip_adapter_image is None or not config.get("use_ip_adapter", False):
+        return None, 0.0
+    if ip_adapter_scale is None:
+        ip_adapter_scale = config.get("ip_adapter_scale", 0.6)
+    return ip_adapter_image, float(ip_adapter_scale)
+
+def _check_strength(num_inference_steps, strength):
+    """Reject img2img settings that would leave no denoising step to run.
+
+    The pipeline runs ``int(num_inference_steps * strength)`` of the steps, so
+    a low strength needs at least ``ceil(1 / strength)`` steps.
+    """
+    if strength <= 0:
+        raise ValueError(f"Transformation strength must be above 0, got {strength}")
+    if int(num_inference_steps * strength) < 1:
+        raise ValueError(
+            f"{num_inference_steps} steps at strength {strength} leave no denoising step; "
+            f"use at least {math.ceil(1 / strength)} steps"
+        )
+
+def _batch_key(model_name, task, params):
+    # Everything that has to be uniform across one pipeline call. The adapter
+    # scale is pipeline state, so requests with a reference image only share a
+    # call with requests at the same scale, and never with image-less ones,
+    # which run at scale 0. Init images are encoded at their own size, fitted
+    # to the output size with their aspect ratio kept, and only latents of one
+    # shape can be stacked.
+    return (
+        model_name,
+        task,
+        int(params["width"]),
+        int(params["height"]),
+        int(params["num_inference_steps"]),
+        float(params["guidance_scale"]),
+        float(params.get("strength", 0.0)),
+        float(params["ip_adapter_scale"]),
+        params["scheduler"],
+        params["image"].size if task == "img2img" else None
+    )
+
+def run_batch(key, requests):
+    """Run compatible text2img/img2img requests as one batched pipeline call.
+
+    Each request keeps its own seeded generator, so its latents and scheduler
+    noise are drawn exactly as in an unbatched run.
+    """
+    model_name, task, width, height, num_inference_steps, guidance_scale, strength, ip_adapter_scale, scheduler, _ = key
+    do_classifier_free_guidance = guidance_scale > 1
+
+    def on_step(step, timestep, latents):
+        for index, request in enumerate(requests):
+            request.publish(step, timestep, latents[index:index + 1])
+
+    def should_cancel():
+        return all(request.cancelled for request in requests)
+
+    gen_params = {
+        "height": height,
+        "width": width,
+        "num_inference_steps": num_inference_steps,
+        "guidance_scale": guidance_scale,
+        "generator": [torch.Generator(device="cpu").manual_seed(int(request.params["seed"])) for request in requests],
+        **_step_end_callback(on_step, should_cancel)
+    }
+    if task == "img2img":
+        gen_params["strength"] = strength
+
+    # Activate the style on the shared base and generate
+    request_labels = flow_labels(task, model_name, width, height)
+    with labels(**request_labels), use_model(model_name, img2img=task == "img2img", scheduler=scheduler) as pipe, inference_context(pipe):
+        conditionings = []
+        for request in requests:
+            conditioning = encode_prompt_cached(pipe, request.params["prompt"])
+            conditioning.update(ip_adapter_params(
+                pipe,
+                request.params["ip_adapter_image"],
+                ip_adapter_scale,
+                do_classifier_free_guidance
+            ))
+            conditionings.append(conditioning)
+        gen_params.update(stack_conditioning(conditionings, do_classifier_free_guidance))
+        if task == "img2img":
+            # Init images are VAE-encoded once and reused across parameter changes
+            images = [encode_image_latents_cached(pipe, request.params["image"]) for request in requests]
+            gen_params["image"] = torch.cat(images) if isinstance(images[0], torch.Tensor) else images
+        return pipe(**gen_params).images
+
+_batch_scheduler = None
+_batch_scheduler_lock = threading.Lock()
+
+def _get_batch_scheduler():
+    global _batch_scheduler
+    with _batch_scheduler_lock:
+        if _batch_scheduler is None:
+            _batch_scheduler = BatchScheduler(run_batch, BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS)
+        return _batch_scheduler
+
+def _generate(model_name, task, params, progress_callback, cancel_event):
+    key = _batch_key(model_name, task, params)
+
+    def run():
+        if BATCHING_ENABLED:
+            request = _get_batch_scheduler().submit(key, params, cancel_event=cancel_event)
+            return [request.wait(progress_callback)]
+        # Unbatched: run in the caller's thread with progress delivered directly
+        return run_batch(key, [BatchRequest(key, params, progress_callback, cancel_event)])
+
+    return cached(task, model_name, params, run)[0]
+
+def generate_text_to_image(
+    model_name,
+    prompt,
+    width=512,
+    height=512,
+    num_inference_steps=DEFAULT_STEPS,
+    guidance_scale=DEFAULT_GUIDANCE_SCALE,
+    seed=DEFAULT_SEED,
+    ip_adapter_image=None,
+    ip_adapter_scale=None,
+    scheduler=None,
+    progress_callback=None,
+    cancel_event=None
+):
+    ip_adapter_image, ip_adapter_scale = _resolve_ip_adapter(model_name, ip_adapter_image, ip_adapter_scale)
+    params = {
+        "prompt": prompt,
+        "width": width,
+        "height": height,
+        "num_inference_steps": num_inference_steps,
+        "guidance_scale": guidance_scale,
+        "seed": seed,
+        "ip_adapter_image": ip_adapter_image,
+        "ip_adapter_scale": ip_adapter_scale,
+        "scheduler": resolve_scheduler(model_name, scheduler)
+    }
+    return _generate(model_name, "text2img", params, progress_callback, cancel_event)
+
+def generate_image_to_image(
+    model_name,
+    prompt,
+    image,
+    width=512,
+    height=512,
+    num_inference_steps=DEFAULT_STEPS,
+    guidance_scale=DEFAULT_GUIDANCE_SCALE,
+    strength=DEFAULT_STRENGTH,
+    seed=DEFAULT_SEED,
+    ip_adapter_image=None,
+    ip_adapter_scale=None,
+    scheduler=None,
+    progress_callback=None,
+    cancel_event=None
+):
+    _check_strength(num_inference_steps, strength)
+    ip_adapter_image, ip_adapter_scale = _resolve_ip_adapter(model_name, ip_adapter_image, ip_adapter_scale)
+    params = {
+        "prompt": prompt,
+        "image": image,
+        "width": width,
+        "height": height,
+        "num_inference_steps": num_inference_steps,
+        "guidance_scale": guidance_scale,
+        "strength": strength,
+        "seed": seed,
+        "ip_adapter_image": ip_adapter_image,
+        "ip_adapter_scale": ip_adapter_scale,
+        "scheduler": resolve_scheduler(model_name, scheduler)
+    }
+    return _generate(model_name, "img2img", params, progress_callback, cancel_event)
+
+def _run_sweep_group(model_name, task, params, seeds, on_step, should_cancel):
+    """One pipeline call producing an image per seed via ``num_images_per_prompt``."""
+    guidance_scale = float(params["guidance_scale"])
+    do_classifier_free_guidance = guidance_scale > 1
+    gen_params = {
+        "height": int(params["height"]),
+        "width": int(params["width"]),
+        "num_inference_steps": int(params["num_inference_steps"]),
+        "guidance_scale": guidance_scale,
+        "num_images_per_prompt": len(seeds),
+        # A generator per sample draws the same noise as a single run with that seed
+        "generator": [torch.Generator(device="cpu").manual_seed(int(seed)) for seed in seeds],
+        **_step_end_callback(on_step, should_cancel)
+    }
+    with use_model(model_name, img2img=task == "img2img", scheduler=params["scheduler"]) as pipe, inference_context(pipe):
+        gen_params.update(encode_prompt_cached(pipe, params["prompt"]))
+        gen_params.update(ip_adapter_params(
+            pipe,
+            params["ip_adapter_image"],
+            params["ip_adapter_scale"],
+            do_classifier_free_guidance
+        ))
+        if task == "img2img":
+            gen_params["image"] = encode_image_latents_cached(pipe, params["image"])
+            gen_params["strength"] = float(params["strength"])
+        return pipe(**gen_params).images
+
+def sweep(
+    model_name,
+    prompt,
+    seeds,
+    guidance_scales=(DEFAULT_GUIDANCE_SCALE,),
+    steps=(DEFAULT_STEPS,),
+    ip_adapter_scales=(None,),
+    image=None,
+    width=512,
+    height=512,
+    strength=DEFAULT_STRENGTH,
+    ip_adapter_image=None,
+    scheduler=None,
+    progress_callback=None,
+    cancel_event=None
+):
+    """Generate every combination of guidance scale, step count and IP-Adapter
+    scale for each of ``seeds``; image-to-image when ``image`` is given.
+
+    Each combination runs as pipeline calls of up to ``BATCH_MAX_SIZE`` seeds,
+    so the style lookup and prompt encoding happen once per call and the seeds
+    share every UNet forward pass. Each image goes through the result cache
+    exactly as a single request with the same settings would. Progress steps
+    count the denoising steps of every call across the whole sweep; calls
+    served from the result cache advance it by their steps at once.
+
+    Returns one row per combination, ``{"guidance_scale", "num_inference_steps",
+    "ip_adapter_scale", "images"}``, with an image per seed in ``seeds`` order.
+    """
+    task = "img2img" if image is not None else "text2img"
+    if task == "img2img":
+        for num_inference_steps in steps:
+            _check_strength(num_inference_steps, strength)
+    scheduler = resolve_scheduler(model_name, scheduler)
+    if not MODEL_CONFIGS[model_name].get("use_ip_adapter", False):
+        ip_adapter_image = None
+        ip_adapter_scales = (None,)
+    completed = [0, 0]
+    calls = math.ceil(len(seeds) / BATCH_MAX_SIZE)
+
+    def on_step(step, timestep, latents):
+        completed[1] = step
+        if progress_callback is not None:
+            progress_callback(completed[0] + step, timestep, latents)
+
+    rows = []
+    with labels(**flow_labels(task, model_name, width, height)):
+        for guidance_scale, num_inference_steps, ip_adapter_scale in itertools.product(guidance_scales, steps, ip_adapter_scales):
+            # The same parameters as a single request, so results are shared
+            run_ip_adapter_image, run_ip_adapter_scale = _resolve_ip_adapter(model_name, ip_adapter_image, ip_adapter_scale)
+            params = {
+                "prompt": prompt,
+                "width": width,
+                "height": height,
+                "num_inference_steps": num_inference_steps,
+                "guidance_scale": guidance_scale,
+                "ip_adapter_image": run_ip_adapter_image,
+                "ip_adapter_scale": run_ip_adapter_scale,
+                "scheduler": scheduler
+            }
+            if task == "img2img":
+                params.update(image=image, strength=strength)
+            lookups = [lookup(task, model_name, dict(params, seed=seed)) for seed in seeds]
+            images = [found[0] if found is not None else None for _, found in lookups]
+            missing = [index for index, found in enumerate(images) if found is None]
+            for start in range(0, len(missing), BATCH_MAX_SIZE):
+                chunk = missing[start:start + BATCH_MAX_SIZE]
+                generated = _run_sweep_group(
+                    model_name,
+                    task,
+                    params,
+                    [seeds[index] for index in chunk],
+                    on_step,
+                    _cancel_check(cancel_event)
+                )
+                completed[0] += completed[1]
+                for index, generated_image in zip(chunk, generated):
+                    store(lookups[index][0], [generated_image])
+                    images[index] = generated_image
+            cached_calls = calls - math.ceil(len(missing) / BATCH_MAX_SIZE)
+            if cached_calls:
+                # img2img runs only int(steps * strength) of the steps
+                denoised = int(num_inference_steps * strength) if task == "img2img" else num_inference_steps
+                completed[0] += cached_calls * denoised
+                if progress_callback is not None:
+                    progress_callback(completed[0], 0.0, None)
+            rows.append({
+                "guidance_scale": guidance_scale,
+                "num_inference_steps": num_inference_steps,
+                "ip_adapter_scale": ip_adapter_scale,
+                "images": images
+            })
+    return rows
+
+def inpaint(
+    model_name,
+    prompt,
+    image,
+    mask_image,
+    num_inference_steps=75,
+    guidance_scale=DEFAULT_GUIDANCE_SCALE,
+    high_noise_frac=0.7,
+    seed=DEFAULT_SEED,
+    scheduler=None,
+    progress_callback=None,
+    cancel_event=None
+):
+    params = {
+        "prompt": prompt,
+        "image": image,
+        "mask_image": mask_image,
+        "num_inference_steps": num_inference_steps,
+        "guidance_scale": guidance_scale,
+        "high_noise_frac": high_noise_frac,
+        "seed": seed,
+        "scheduler": resolve_scheduler(model_name, scheduler)
+    }
+    return cached("inpainting", model_name, params, lambda: [_inpaint(
+        model_name, progress_callback=progress_callback, cancel_event=cancel_event, **params
+    )])[0]
+
+def _inpaint(
+    model_name,
+    prompt,
+    image,
+    mask_image,
+    num_inference_steps,
+    guidance_scale,
+    high_noise_frac,
+    seed,
+    scheduler,
+    progress_callback,
+    cancel_event
+):
+    with labels(**flow_labels("inpainting", model_name, *image.size)), use_ensemble(model_name, inpainting=True, scheduler=scheduler) as pipes:
+        base_pipe = pipes["base"]
+        refiner_pipe = pipes["refiner"]
+        generator = torch.Generator(device=_device()).manual_seed(int(seed))
+        height, width = base_pipe.image_processor.get_default_height_width(image)
+
+        # BASE: output_type="latent"
+        with inference_context(base_pipe):
+            # Pre-encoded latents also stop the pipeline encoding the masked
+            # image, which only 9-channel inpainting UNets use
+            masked_image_params = {}
+            if denoiser(base_pipe).config.in_channels == 9:
+                masked_image_params["masked_image_latents"] = encode_masked_image_latents_cached(
+                    base_pipe, image, mask_image, height, width
+                )
+            base_result = base_pipe(
+                **encode_prompt_cached(base_pipe, prompt),
+                **ip_adapter_params(base_pipe, None, None, guidance_scale > 1),
+                image=encode_image_latents_cached(base_pipe, image, height, width),
+                mask_image=mask_image,
+                height=height,
+                width=width,
+                **masked_image_params,
+                num_inference_steps=num_inference_steps,
+                guidance_scale=guidance_scale,
+                denoising_end=high_noise_frac,
+                output_type="latent",
+                generator=generator,
+                **_step_end_callback(progress_callback, _cancel_check(cancel_event)),
+                return_dict=True
+            )
+        # Handed to the refiner as latents, never decoded
+        latents = base_result.images
+        # REFINER: input latent, output PIL
+        with inference_context(refiner_pipe):
+            refined_result = refiner_pipe(
+                **encode_prompt_cached(refiner_pipe, prompt),
+                image=latents,
+                mask_image=mask_image,
+                height=height,
+                width=width,
+                num_inference_steps=num_inference_steps,
+                guidance_scale=guidance_scale,
+                denoising_start=high_noise_frac,
+                generator=generator,
+                **_step_end_callback(progress_callback, _cancel_check(cancel_event)),
+                return_dict=True
+            )
+        return refined_result.images[0]
+
+def refine(
+    model_name,
+    prompt,
+    num_inference_steps=DEFAULT_STEPS,
+    guidance_scale=DEFAULT_GUIDANCE_SCALE,
+    denoising_end=0.8,
+    seed=DEFAULT_SEED,
+    scheduler=None,
+    progress_callback=None,
+    cancel_event=None,
+    on_base_image=None
+):
+    """Run the base model up to ``denoising_end`` and finish with the refiner.
+
+    Returns ``(base_image, refined_image)``, where ``base_image`` is a
+    low-resolution preview of the base latents. ``on_base_image`` is called
+    with it before the refiner starts.
+    """
+    params = {
+        "prompt": prompt,
+        "num_inference_steps": num_inference_steps,
+        "guidance_scale": guidance_scale,
+        "denoising_end": denoising_end,
+        "seed": seed,
+        "scheduler": resolve_scheduler(model_name, scheduler)
+    }
+    images = cached("refining", model_name, params, lambda: list(_refine(
+        model_name, progress_callback=progress_callback, cancel_event=cancel_event, on_base_image=on_base_image, **params
+    )))
+    base_image, refined_image = images
+    if on_base_image is not None and is_hit(refined_image):
+        on_base_image(base_image)
+    return base_image, refined_image
+
+def _refine(
+    model_name,
+    prompt,
+    num_inference_steps,
+    guidance_scale,
+    denoising_end,
+    seed,
+    scheduler,
+    progress_callback,
+    cancel_event,
+    on_base_image
+):
+    with labels(**flow_labels("refining", model_name)), use_ensemble(model_name, scheduler=scheduler) as pipes:
+        base_pipe = pipes["base"]
+        refiner_pipe = pipes["refiner"]
+        generator = torch.Generator(device=_device()).manual_seed(int(seed))
+
+        with torch.no_grad(), inference_context(base_pipe):
+            # BASE: output_type="latent" for the refiner, previewed for display
+            base_result = base_pipe(
+                **encode_prompt_cached(base_pipe, prompt),
+                **ip_adapter_params(base_pipe, None, None, guidance_scale > 1),
+                num_inference_steps=num_inference_steps,
+                guidance_scale=guidance_scale,
+                denoising_end=denoising_end,
+                output_type="latent",
+                generator=generator,
+                **_step_end_callback(progress_callback, _cancel_check(cancel_event)),
+                return_dict=True
+            )
+            latents = base_result.images
+            # Approximate preview for display; a full VAE decode here would
+            # cost as much as the final one
+            base_image = latents_to_rgb(latents, latent_space(model_name))
+            if on_base_image is not None:
+                on_base_image(base_image)
+
+            # REFINER: input latent, output PIL
+            refined_result = refiner_pipe(
+                **encode_prompt_cached(refiner_pipe, prompt),
+                num_inference_steps=num_inference_steps,
+                guidance_scale=guidance_scale,
+                denoising_start=denoising_end,
+                image=latents,
+                generator=generator,
+                **_step_end_callback(progress_callback, _cancel_check(cancel_event)),
+                return_dict=True
+            )
+        return base_image, refined_result.images[0]
+
+def generate_two_text_encoders(
+    prompt,
+    prompt_2,
+    num_inference_steps=30,
+    guidance_scale=7.5,
+    seed=42,
+    scheduler=None,
+    progress_callback=None,
+    cancel_event=None
+):
+    params = {
+        "prompt": prompt,
+        "prompt_2": prompt_2,
+        "num_inference_steps": num_inference_steps,
+        "guidance_scale": guidance_scale,
+        "seed": seed,
+        "scheduler": resolve_scheduler(scheduler=scheduler)
+    }
+    return cached("two_text_encoders", None, params, lambda: [_generate_two_text_encoders(
+        progress_callback=progress_callback, cancel_event=cancel_event, **params
+    )])[0]
+
+def _generate_two_text_encoders(
+    prompt,
+    prompt_2,
+    num_inference_steps,
+    guidance_scale,
+    seed,
+    scheduler,
+    progress_callback,
+    cancel_event
+):
+    generator = torch.Generator(device=_device()).manual_seed(int(seed))
+    # Plain SDXL base: shared with the styles, but with every style LoRA switched off
+    with labels(task="two_text_encoders"), use_base(TWO_TEXT_ENCODERS_MODEL, "sdxl", scheduler=scheduler) as pipe, inference_context(pipe):
+        return pipe(
+            **encode_prompt_cached(pipe, prompt, prompt_2),
+            **ip_adapter_params(pipe, None, None, guidance_scale > 1),
+            num_inference_steps=num_inference_steps,
+            guidance_scale=guidance_scale,
+            generator=generator,
+            **_step_end_callback(progress_callback, _cancel_check(cancel_event)),
+            return_dict=True
+        ).images[0]
+
+def encode_image(image, format="PNG"):
+    """Encode a PIL image to bytes for download or transport."""
+    with stage("png_encode"):
+        buf = io.BytesIO()
+        image.save(buf, format=format)
+        return buf.getvalue()
+
+def batching_stats():
+    return _batch_scheduler.stats() if _batch_scheduler is not None else None
@@ -0,0 +1,124 @@
+"""
+Fused execution mode: style LoRAs merged into the base weights.
+
+With PEFT adapters loaded, every LoRA-wrapped Linear of the denoiser and text
+encoders runs its base matmul plus two low-rank matmuls on each forward pass.
+With ``FUSED_MODE`` set, the active adapters are merged into the base weights
+when a style is activated and the attention Q, K and V projections are fused
+into one matmul, so the steps run plain Linear layers. Activating another
+style on a fused base first restores the unfused weights and processors and
+drops the fused projections, then fuses the new adapter set; a style that
+stays active pays the merge once.
+
+Only float32 bases are fused: int8 Linear layers cannot be merged into, and in
+bfloat16 every merge and unmerge rounds the weights, so styles switching back
+and forth would drift. QKV fusion replaces the attention processors, so the
+UNet of a base carrying the IP-Adapter, whose processors inject the image
+embeddings, keeps its own.
+
+Fusion state lives on the shared modules, so every task view of a base sees
+it. Per-step timings carry it as the ``fusion`` label; ``fusion_report``
+compares them per style and resolution.
+"""
+from src.config.constants import FUSED_MODE
+from src.pipelines.precision import denoiser
+from src.utils.metrics import STAGE_SECONDS, stage
+
+_enabled = FUSED_MODE
+
+def fused_mode():
+    return _enabled
+
+def set_fused_mode(enabled):
+    """Switch fused mode on or off; bases follow on their next activation."""
+    global _enabled
+    _enabled = bool(enabled)
+
+def can_fuse(precision):
+    return _enabled and precision == "fp32"
+
+def fused_adapters(pipe):
+    """Adapters merged into ``pipe``'s weights, or None when it is not fused."""
+    return getattr(denoiser(pipe), "fused_adapters", None)
+
+def fusion_state(pipe):
+    """Label value of the denoiser's fusion: ``none``, ``lora``, ``qkv`` or ``lora+qkv``."""
+    module = denoiser(pipe)
+    parts = []
+    if getattr(module, "fused_adapters", None):
+        parts.append("lora")
+    if getattr(module, "qkv_fused", False):
+        parts.append("qkv")
+    return "+".join(parts) or "none"
+
+def _qkv_modules(pipe):
+    module = denoiser(pipe)
+    modules = [getattr(pipe, "vae", None)]
+    # IP-Adapter attention processors would be replaced by fused ones
+    if getattr(module, "encoder_hid_proj", None) is None:
+        modules.append(module)
+    return [module for module in modules if module is not None and hasattr(module, "fuse_qkv_projections")]
+
+def fuse(pipe, adapters):
+    """Merge ``adapters`` (already loaded and active) and fuse the QKV projections."""
+    with stage("lora_fuse"):
+        if adapters:
+            pipe.fuse_lora(adapter_names=list(adapters))
+        for module in _qkv_modules(pipe):
+            if not getattr(module, "qkv_fused", False):
+                module.fuse_qkv_projections()
+                module.qkv_fused = True
+        denoiser(pipe).fused_adapters = tuple(adapters)
+
+def _drop_fused_projections(module):
+    # unfuse_qkv_projections only restores the processors; the fused Linear
+    # layers would keep a second copy of the projection weights
+    for submodule in module.modules():
+        if getattr(submodule, "fused_projections", False):
+            for name in ("to_qkv", "to_kv", "to_added_qkv"):
+                if name in submodule._modules:
+                    delattr(submodule, name)
+            submodule.fused_projections = False
+
+def unfuse(pipe):
+    """Restore the unfused weights and attention processors of ``pipe``'s modules."""
+    module = denoiser(pipe)
+    if getattr(module, "fused_adapters", None) is None:
+        return
+    with stage("lora_unfuse"):
+        for qkv_module in (module, getattr(pipe, "vae", None)):
+            if getattr(qkv_module, "qkv_fused", False):
+                qkv_module.unfuse_qkv_projections()
+                _drop_fused_projections(qkv_module)
+                qkv_module.qkv_fused = False
+        if module.fused_adapters:
+            pipe.unfuse_lora()
+        module.fused_adapters = None
+
+def fusion_report():
+    """Mean ``unet_step`` seconds per style, resolution and fusion state.
+
+    Each row's ``saving`` is the fraction of the unfused step time a fused
+    state saves, once both have been measured in this process.
+    """
+    rows = {}
+    for labels, series in STAGE_SECONDS.series():
+        if labels["stage"] != "unet_step" or not series["count"]:
+            continue
+        row = rows.setdefault((labels["style"], labels["resolution"]), {
+            "style": labels["style"] or None,
+            "resolution": labels["resolution"] or None,
+            "fusion": {}
+        })
+        row["fusion"][labels["fusion"] or "none"] = {
+            "steps": series["count"],
+            "mean_seconds": series["sum"] / series["count"]
+        }
+    for row in rows.values():
+        unfused = row["fusion"].get("none")
+        if unfused:
+            row["saving"] = {
+                state: 1 - timing["mean_seconds"] / unfused["mean_seconds"]
+                for state, timing in row["fusion"].items() if state != "none"
+            }
+    return sorted(rows.values(), key=lambda row: (row["style"] or "", row["resolution"] or ""))
@@ -0,0 +1,198 @@
+"""
+Background generation jobs with progress streaming and cancellation.
+
+``JobManager.submit`` returns immediately with a ``Job``. Generation runs on a
+worker thread and publishes progress events that any number of readers can
+follow with ``Job.events``. Cancellation takes effect at the next denoising
+step boundary, and submitting a new job for a session cancels the session's
+previous job, so abandoned work stops consuming cores.
+
+Every ``PREVIEW_EVERY`` steps a job also publishes a ``preview`` event with an
+approximate low-resolution image of the current latents.
+
+With ``INFERENCE_WORKERS`` set, the job threads only wait on generation that
+runs in the pinned worker processes of ``src.pipelines.workers``.
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from src.config.constants import JOB_WORKERS, PREVIEW_EVERY
+from src.pipelines.previews import latent_space, latents_to_rgb
+from src.utils.metrics import flow_labels, labels, stage
+
+TERMINAL_STATUSES = ("succeeded", "failed", "cancelled")
+
+class JobCancelled(Exception):
+    """Raised at a step boundary when the job being generated was cancelled."""
+
+def step_callback(publish, model_name=None, cancel_event=None):
+    """``progress_callback`` for the engine that publishes progress and preview events.
+
+    Raises ``JobCancelled`` at the step boundary once ``cancel_event`` is set.
+    """
+    space = latent_space(model_name) if PREVIEW_EVERY > 0 else None
+
+    def progress_callback(step, timestep, latents=None):
+        if cancel_event is not None and cancel_event.is_set():
+            raise JobCancelled()
+        publish({"type": "progress", "step": int(step), "timestep": float(timestep)})
+        if space is not None and latents is not None and step % PREVIEW_EVERY == 0:
+            publish({"type": "preview", "step": int(step), "value": latents_to_rgb(latents, space)})
+
+    return progress_callback
+
+class Job:
+    def __init__(self, kind, session_id=None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.session_id = session_id
+        self.status = "queued"
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.cancel_event = threading.Event()
+        self._events = []
+        self._cond = threading.Condition()
+
+    @property
+    def done(self):
+        return self.status in TERMINAL_STATUSES
+
+    def cancel(self):
+        self.cancel_event.set()
+
+    def publish(self, event):
+        with self._cond:
+            self._events.append(event)
+            self._cond.notify_all()
+
+    def _set_status(self, status, error=None):
+        self.status = status
+        self.error = error
+        event = {"type": "status", "status": status}
+        if error is not None:
+            event["error"] = error
+        self.publish(event)
+
+    def events(self, start=0, timeout=None):
+        """Yield events from index ``start`` until the job reaches a terminal status.
+
+        With ``timeout`` set, iteration also stops after that many seconds
+        without a new event.
+        """
+        index = start
+        while True:
+            with self._cond:
+                if index >= len(self._events):
+                    if self.done:
+                        return
+                    if not self._cond.wait(timeout) and timeout is not None:
+                        return
+                    continue
+                event = self._events[index]
+            index += 1
+            yield event
+
+    def wait(self, on_event=None):
+        """Block until the job finishes and return its result.
+
+        Raises ``JobCancelled`` for cancelled jobs and ``RuntimeError`` carrying
+        the original message for failed ones.
+        """
+        for event in self.events():
+            if on_event is not None:
+                on_event(event)
+        if self.status == "cancelled":
+            raise JobCancelled(self.id)
+        if self.status == "failed":
+            raise RuntimeError(self.error)
+        return self.result
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "error": self.error,
+            "created_at": self.created_at
+        }
+
+class JobManager:
+    def __init__(self, max_workers=4, history=256):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation-job")
+        self._jobs = OrderedDict()
+        self._sessions = {}
+        self._history = history
+        self._lock = threading.Lock()
+
+    def submit(self, fn, kwargs=None, kind="generation", session_id=None):
+        """Queue ``fn(**kwargs, progress_callback=..., cancel_event=...)`` as a job."""
+        job = self.create(kind, session_id)
+        self.start(job, fn, kwargs)
+        return job
+
+    def create(self, kind="generation", session_id=None):
+        """Register a job without starting it.
+
+        Lets callers build kwargs that publish to the job (e.g. intermediate
+        images) before handing them to ``start``.
+        """
+        job = Job(kind, session_id)
+        with self._lock:
+            if session_id is not None:
+                previous = self._sessions.get(session_id)
+                if previous is not None and not previous.done:
+                    previous.cancel()
+                self._sessions[session_id] = job
+            self._jobs[job.id] = job
+            self._prune()
+        return job
+
+    def start(self, job, fn, kwargs=None):
+        self._executor.submit(self._run, job, fn, kwargs or {})
+
+    def _prune(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.done]
+        for job_id in finished[:max(0, len(self._jobs) - self._history)]:
+            job = self._jobs.pop(job_id)
+            # A session's last job would otherwise keep its images alive forever
+            if self._sessions.get(job.session_id) is job:
+                del self._sessions[job.session_id]
+
+    def _run(self, job, fn, kwargs):
+        if job.cancel_event.is_set():
+            job._set_status("cancelled")
+            return
+        job._set_status("running")
+        # Imported here: the worker pool module builds on this one
+        from src.pipelines.workers import run_inference
+
+        request_labels = flow_labels(job.kind, kwargs.get("model_name"), kwargs.get("width"), kwargs.get("height"))
+        try:
+            with labels(**request_labels), stage("request"):
+                result = run_inference(fn, kwargs, job.publish, job.cancel_event)
+        except JobCancelled:
+            job._set_status("cancelled")
+        except Exception as e:
+            job._set_status("failed", error=str(e))
+        else:
+            job.result = result
+            job._set_status("succeeded")
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self._jobs.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def cancel_session(self, session_id):
+        job = self._sessions.get(session_id)
+        if job is not None and not job.done:
+            job.cancel()
+
+job_manager = JobManager(max_workers=JOB_WORKERS)
@@ -1,130 +1,395 @@
 import torch
 from diffusers import (
-    StableDiffusionXLPipeline,
-    StableDiffusionXLImg2ImgPipeline,
-    StableDiffusionXLInpaintPipeline,
-    EulerAncestralDiscreteScheduler,
     DiffusionPipeline,
     StableDiffusionPipeline,
-    AutoPipelineForImage2Image,
-    AutoPipelineForText2Image,
-    AutoPipelineForInpainting
+    StableDiffusionXLImg2ImgPipeline,
+    AutoPipelineForText2Image
 )
 from transformers import CLIPTextModel, CLIPTokenizer
 from huggingface_hub import login
 import os
-import streamlit as st
-from src.config.constants import MODEL_CONFIGS
+import time
+from contextlib import contextmanager
+from src.config.constants import (
+    MODEL_CONFIGS,
+    PINNED_STYLES,
+    OFFLINE_MODE,
+    IP_ADAPTER_REPO,
+    IP_ADAPTER_SUBFOLDER,
+    IP_ADAPTER_WEIGHT_NAME,
+    REFINER_MODEL,
+    LCM_LORA_REPOS,
+    PARALLEL_LOADING,
+    LOAD_WORKERS
+)
+from src.pipelines import model_store, parallel_loader
+from src.pipelines.fusion import can_fuse, fuse, fused_adapters, unfuse
+from src.pipelines.precision import apply_precision, resolve_precision
+from src.pipelines.registry import registry, task_name
+from src.pipelines.schedulers import apply_scheduler, resolve_scheduler
+from src.utils.metrics import instrument, observe, stage
 
-@st.cache_resource
-def load_model(model_name, img2img=False, inpainting=False):
-    try:
-        config = MODEL_CONFIGS[model_name]
-        
-        # Check if HF token is set
-        hf_token = os.getenv("HUGGINGFACE_TOKEN")
-        if not hf_token:
-            st.error("Hugging Face token not found. Please set the HUGGINGFACE_TOKEN environment variable.")
-            st.stop()
-        
-        # Login to Hugging Face
+class ModelLoadError(RuntimeError):
+    """Raised when a pipeline or one of its adapters cannot be loaded."""
+
+# PEFT adapter name of the LCM-LoRA, stacked on the style's own adapter
+LCM_ADAPTER = "lcm"
+
+def adapter_name(model_name):
+    """PEFT adapter name under which a style's LoRA is registered."""
+    return model_name.lower()
+
+def _base_uses_ip_adapter(base_model):
+    return any(
+        config["base_model"] == base_model and config.get("use_ip_adapter", False)
+        for config in MODEL_CONFIGS.values()
+    )
+
+def _get_hf_token():
+    # Check if HF token is set
+    hf_token = os.getenv("HUGGINGFACE_TOKEN")
+    if not hf_token:
+        raise ModelLoadError("Hugging Face token not found. Please set the HUGGINGFACE_TOKEN environment variable.")
+    return hf_token
+
+def _hub_login(repo_ids):
+    """Log in to the Hub only if one of ``repo_ids`` is not in the local store."""
+    if OFFLINE_MODE or all(model_store.is_local(repo_id) for repo_id in repo_ids):
+        return None
+    hf_token = _get_hf_token()
+    with stage("hub_login"):
         login(token=hf_token)
-        
+    return hf_token
+
+def base_key(model_name, precision=None):
+    """Registry key of the base pipeline a style runs on.
+
+    Precision is part of the key: the same base model loaded in two precisions
+    is two separate sets of weights.
+    """
+    config = MODEL_CONFIGS[model_name]
+    return (config["base_model"], config["pipeline"], precision or resolve_precision(model_name))
+
+def _styles_on_base(base_model, pipeline_type):
+    """Styles running on ``base_model``, whatever precision they are configured for."""
+    return [
+        name for name, config in MODEL_CONFIGS.items()
+        if (config["base_model"], config["pipeline"]) == (base_model, pipeline_type)
+    ]
+
+@contextmanager
+def _timed(timings, name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+# Keep the bases of pinned styles resident whatever the cache budget says
+for _style in PINNED_STYLES:
+    registry.cache.pin(base_key(_style))
+
+def load_base_pipeline(base_model, pipeline_type, use_safetensors=True, precision="fp32"):
+    """Load one text-to-image base pipeline in ``precision``.
+
+    Image-to-image and inpainting variants are derived from it by the registry,
+    so this runs once per base model and precision. Style LoRAs are loaded on
+    first use, except for int8 where every style on the base is loaded up front.
+    """
+    uses_ip_adapter = pipeline_type == "sdxl" and _base_uses_ip_adapter(base_model)
+    hf_token = _hub_login([base_model] + ([IP_ADAPTER_REPO] if uses_ip_adapter else []))
+    start = time.perf_counter()
+    timings = {}
+    try:
+        source = model_store.resolve(base_model)
+        hub_kwargs = {"token": hf_token, "local_files_only": OFFLINE_MODE}
+
         # Load base model based on pipeline type
-        if config["pipeline"] == "sdxl":
-            if inpainting:
-                # First load text2image pipeline
-                base_pipe = StableDiffusionXLPipeline.from_pretrained(
-                    config["base_model"],
+        if PARALLEL_LOADING and parallel_loader.supports(pipeline_type):
+            pipe, timings = parallel_loader.load_pipeline(
+                source,
+                pipeline_type,
+                use_safetensors=use_safetensors,
+                variant="fp16" if pipeline_type == "sdxl" else None,
+                hub_kwargs=hub_kwargs,
+                max_workers=LOAD_WORKERS
+            )
+        elif pipeline_type == "sdxl":
+            with _timed(timings, "pipeline"):
+                pipe = AutoPipelineForText2Image.from_pretrained(
+                    source,
                     torch_dtype=torch.float32,
                     variant="fp16",
-                    use_safetensors=config["use_safetensors"],
-                    token=hf_token
+                    use_safetensors=use_safetensors,
+                    **hub_kwargs
                 )
-                # Convert to inpainting pipeline
-                pipe = AutoPipelineForInpainting.from_pipe(base_pipe)
-            elif img2img:
-                # Load base pipeline with IP-Adapter support
-                pipe = AutoPipelineForImage2Image.from_pretrained(
-                    config["base_model"],
+        elif pipeline_type == "flux":
+            with _timed(timings, "pipeline"):
+                pipe = DiffusionPipeline.from_pretrained(
+                    source,
                     torch_dtype=torch.float32,
-                    variant="fp16",
-                    use_safetensors=config["use_safetensors"],
-                    token=hf_token
+                    use_safetensors=use_safetensors,
+                    **hub_kwargs
                 )
-                
-                # Load IP-Adapter if specified in config
-                if config.get("use_ip_adapter", False):
-                    pipe.load_ip_adapter(
-                        "h94/IP-Adapter",
-                        subfolder="sdxl_models",
-                        weight_name="ip-adapter_sdxl.bin"
-                    )
-                    pipe.set_ip_adapter_scale(config.get("ip_adapter_scale", 0.6))
-                
-                # Load LoRA weights if specified
-                if config.get("lora_path"):
-                    pipe.load_lora_weights(config["lora_path"])
-                
-                return pipe
-            else:
-                # Load base pipeline with IP-Adapter support
-                pipe = AutoPipelineForText2Image.from_pretrained(
-                    config["base_model"],
+        else:  # stable-diffusion
+            with _timed(timings, "pipeline"):
+                tokenizer = CLIPTokenizer.from_pretrained(
+                    source,
+                    subfolder="tokenizer",
+                    **hub_kwargs
+                )
+                text_encoder = CLIPTextModel.from_pretrained(
+                    source,
+                    subfolder="text_encoder",
+                    **hub_kwargs
+                )
+
+                pipe = StableDiffusionPipeline.from_pretrained(
+                    source,
                     torch_dtype=torch.float32,
-                    variant="fp16",
-                    use_safetensors=config["use_safetensors"],
-                    token=hf_token
+                    use_safetensors=use_safetensors,
+                    tokenizer=tokenizer,
+                    text_encoder=text_encoder,
+                    **hub_kwargs
                 )
-                
-                # Load IP-Adapter if specified in config
-                if config.get("use_ip_adapter", False):
-                    pipe.load_ip_adapter(
-                        "h94/IP-Adapter",
-                        subfolder="sdxl_models",
-                        weight_name="ip-adapter_sdxl.bin"
-                    )
-                    pipe.set_ip_adapter_scale(config.get("ip_adapter_scale", 0.6))
-        elif config["pipeline"] == "flux":
-            pipe = DiffusionPipeline.from_pretrained(
-                config["base_model"],
-                torch_dtype=torch.float32,
-                use_safetensors=config["use_safetensors"],
-                token=hf_token
-            )
-        else:  # stable-diffusion
-            tokenizer = CLIPTokenizer.from_pretrained(
-                config["base_model"],
-                subfolder="tokenizer",
-                token=hf_token
-            )
-            text_encoder = CLIPTextModel.from_pretrained(
-                config["base_model"],
-                subfolder="text_encoder",
-                token=hf_token
-            )
-            
-            pipe = StableDiffusionPipeline.from_pretrained(
-                config["base_model"],
-                torch_dtype=torch.float32,
-                use_safetensors=config["use_safetensors"],
-                token=hf_token,
-                tokenizer=tokenizer,
-                text_encoder=text_encoder
-            )
-        
-        # Set scheduler
-        pipe.scheduler = EulerAncestralDiscreteScheduler.from_config(pipe.scheduler.config)
-        
-        # Load LoRA weights if specified
-        if config.get("lora_path"):
-            pipe.load_lora_weights(config["lora_path"])
-        
+
+        # Load IP-Adapter once if any style on this base uses it; the task
+        # views pick up the image encoder from the base components
+        if uses_ip_adapter:
+            with _timed(timings, "ip_adapter"):
+                pipe.load_ip_adapter(
+                    model_store.resolve(IP_ADAPTER_REPO),
+                    subfolder=IP_ADAPTER_SUBFOLDER,
+                    weight_name=IP_ADAPTER_WEIGHT_NAME,
+                    **hub_kwargs
+                )
+
         # Move to GPU if available, otherwise keep on CPU
         device = "cuda" if torch.cuda.is_available() else "cpu"
-        pipe = pipe.to(device)
-        
+        with _timed(timings, "to_device"):
+            pipe = pipe.to(device)
+
+        with _timed(timings, "precision"):
+            if precision == "int8":
+                # PEFT cannot inject adapters into quantized layers. Every style
+                # on the base, whatever its configured precision, since
+                # PRECISION_MODE or a precision override runs it in int8
+                styles = _styles_on_base(base_model, pipeline_type)
+                for style in styles:
+                    lora_path = MODEL_CONFIGS[style].get("lora_path")
+                    if lora_path:
+                        pipe.load_lora_weights(lora_path, adapter_name=adapter_name(style))
+                if any(MODEL_CONFIGS[style].get("scheduler") == "lcm" for style in styles):
+                    _load_lcm_lora(pipe, pipeline_type)
+            pipe = apply_precision(pipe, precision)
+        # Shared by every task view, so one wrapper times all decodes
+        instrument(pipe.vae, "decode", "vae_decode")
+        for name, seconds in timings.items():
+            observe(f"load_{name}", seconds)
+        model_store.record_cold_start(
+            base_model,
+            pipeline_type,
+            precision,
+            time.perf_counter() - start,
+            local=source != base_model,
+            modules=timings
+        )
         return pipe
     except Exception as e:
-        st.error(f"Error loading model: {str(e)}")
-        st.stop() 
\ No newline at end of file
+        raise ModelLoadError(f"Error loading model: {str(e)}") from e
+
+def load_refiner(base, precision="fp32"):
+    """Load the SDXL refiner over ``base``'s second text encoder and VAE.
+
+    Only the refiner's own UNet is read from disk; sharing the rest keeps the
+    ensemble close to the size of the base alone.
+    """
+    hf_token = _hub_login([REFINER_MODEL])
+    start = time.perf_counter()
+    try:
+        source = model_store.resolve(REFINER_MODEL)
+        refiner = StableDiffusionXLImg2ImgPipeline.from_pretrained(
+            source,
+            text_encoder_2=base.text_encoder_2,
+            vae=base.vae,
+            torch_dtype=torch.float32,
+            variant="fp16",
+            use_safetensors=True,
+            token=hf_token,
+            local_files_only=OFFLINE_MODE
+        )
+        refiner = apply_precision(refiner.to(base.device), precision)
+        seconds = time.perf_counter() - start
+        observe("load_refiner", seconds)
+        model_store.record_cold_start(REFINER_MODEL, "sdxl-refiner", precision, seconds, local=source != REFINER_MODEL)
+        return refiner
+    except Exception as e:
+        raise ModelLoadError(f"Error loading refiner: {str(e)}") from e
+
+def _disable_lora(pipe):
+    # diffusers raises if LoRA is toggled before any adapter was loaded
+    if any(pipe.get_list_adapters().values()):
+        pipe.disable_lora()
+
+def _loaded_adapters(pipe):
+    return {adapter for adapters in pipe.get_list_adapters().values() for adapter in adapters}
+
+def _load_lcm_lora(pipe, pipeline_type):
+    pipe.load_lora_weights(
+        model_store.resolve(LCM_LORA_REPOS[pipeline_type]),
+        adapter_name=LCM_ADAPTER,
+        local_files_only=OFFLINE_MODE
+    )
+
+def _activate_adapters(pipe, key, adapters):
+    """Make ``adapters`` (name to LoRA path, None for the LCM-LoRA) the active set.
+
+    Adapters are loaded on first use and stay resident, so switching back only
+    flips which ones are active. In fused mode they are merged into the base
+    weights, which stay merged until another set is activated.
+    """
+    target = tuple(adapters) if can_fuse(key[2]) else None
+    if target is not None and fused_adapters(pipe) == target:
+        # PEFT unmerges merged layers when their active adapters are set again
+        return
+    was_fused = fused_adapters(pipe) is not None
+    unfuse(pipe)
+    missing = [name for name in adapters if name not in _loaded_adapters(pipe)]
+    if missing and key[2] == "int8":
+        raise ModelLoadError(
+            f"Adapters {', '.join(missing)} cannot be added to an int8 base after quantization; "
+            "configure the style with them before loading"
+        )
+    for name in missing:
+        if adapters[name] is None:
+            _load_lcm_lora(pipe, key[1])
+        else:
+            pipe.load_lora_weights(adapters[name], adapter_name=name)
+    if missing:
+        registry.refresh(key)
+    if adapters:
+        pipe.enable_lora()
+        pipe.set_adapters(list(adapters))
+    else:
+        _disable_lora(pipe)
+    if target is not None:
+        fuse(pipe, target)
+    if target is not None or was_fused:
+        # The fused QKV weights are new tensors, dropped again on unfuse
+        registry.refresh(key)
+
+def activate_style(pipe, model_name, precision=None, scheduler=None):
+    """Make ``model_name``'s LoRA the only active adapter on ``pipe`` and set its sampler.
+
+    ``scheduler`` overrides the style's configured sampler; ``"lcm"`` stacks
+    the LCM-LoRA on the style's LoRA.
+    """
+    config = MODEL_CONFIGS[model_name]
+    key = base_key(model_name, precision)
+    scheduler = resolve_scheduler(model_name, scheduler)
+    adapters = {}
+    if config.get("lora_path"):
+        adapters[adapter_name(model_name)] = config["lora_path"]
+    if scheduler == "lcm":
+        adapters[LCM_ADAPTER] = None
+    _activate_adapters(pipe, key, adapters)
+    apply_scheduler(pipe, key, scheduler)
+
+    if config.get("use_ip_adapter", False):
+        pipe.set_ip_adapter_scale(config.get("ip_adapter_scale", 0.6))
+    return pipe
+
+def _get_pipeline(model_name, img2img=False, inpainting=False, precision=None):
+    config = MODEL_CONFIGS[model_name]
+    key = base_key(model_name, precision)
+    return registry.get(
+        key,
+        task_name(img2img=img2img, inpainting=inpainting),
+        lambda: load_base_pipeline(
+            config["base_model"],
+            config["pipeline"],
+            use_safetensors=config["use_safetensors"],
+            precision=key[2]
+        )
+    )
+
+def load_model(model_name, img2img=False, inpainting=False, precision=None, scheduler=None):
+    """Shared pipeline for ``model_name`` with its style and sampler active.
+
+    ``precision`` and ``scheduler`` override the style's configured precision
+    mode and sampler.
+    """
+    with stage("load_model", style=model_name, task=task_name(img2img=img2img, inpainting=inpainting)):
+        pipe = _get_pipeline(model_name, img2img=img2img, inpainting=inpainting, precision=precision)
+        try:
+            return activate_style(pipe, model_name, precision, scheduler)
+        except ModelLoadError:
+            raise
+        except Exception as e:
+            raise ModelLoadError(f"Error loading model: {str(e)}") from e
+
+@contextmanager
+def use_model(model_name, img2img=False, inpainting=False, precision=None, scheduler=None):
+    """Yield the shared pipeline with ``model_name``'s style active.
+
+    The base lock is held for the duration of the block so another session
+    cannot swap the adapter or sampler out mid-generation, whichever task view
+    it uses.
+    """
+    with registry.lock(base_key(model_name, precision)):
+        yield load_model(model_name, img2img=img2img, inpainting=inpainting, precision=precision, scheduler=scheduler)
+
+def load_ensemble(model_name, inpainting=False, precision=None, scheduler=None):
+    """SDXL base with ``model_name``'s style active plus the refiner sharing its modules.
+
+    Returns ``{"base": ..., "refiner": ...}``: the text-to-image base and the
+    image-to-image refiner, or both inpainting views with ``inpainting``.
+    """
+    config = MODEL_CONFIGS[model_name]
+    if config["pipeline"] != "sdxl":
+        raise ValueError(f"The refiner only works with SDXL styles, not {model_name}")
+    scheduler = resolve_scheduler(model_name, scheduler)
+    if scheduler == "lcm":
+        # There is no LCM-LoRA for the refiner's UNet
+        raise ValueError("The LCM scheduler cannot be combined with the refiner")
+    key = base_key(model_name, precision)
+    base = load_model(model_name, inpainting=inpainting, precision=precision, scheduler=scheduler)
+    task = "inpainting" if inpainting else "img2img"
+    with stage("load_model", style=model_name, task=f"refiner_{task}"):
+        refiner = registry.get_refiner(key, task, lambda base: load_refiner(base, key[2]))
+    # Base and refiner split one schedule, so they use the same sampler
+    apply_scheduler(refiner, (key, "refiner"), scheduler)
+    return {"base": base, "refiner": refiner}
+
+@contextmanager
+def use_ensemble(model_name, inpainting=False, precision=None, scheduler=None):
+    """Yield ``load_ensemble``'s pipelines while holding the base lock."""
+    with registry.lock(base_key(model_name, precision)):
+        yield load_ensemble(model_name, inpainting=inpainting, precision=precision, scheduler=scheduler)
+
+@contextmanager
+def use_base(base_model, pipeline_type, img2img=False, inpainting=False, precision=None, scheduler=None):
+    """Yield the shared base pipeline with every style LoRA switched off.
+
+    ``scheduler`` selects the sampler (``DEFAULT_SCHEDULER`` by default);
+    ``"lcm"`` activates only the LCM-LoRA.
+    """
+    key = (base_model, pipeline_type, precision or resolve_precision())
+    scheduler = resolve_scheduler(scheduler=scheduler)
+    with registry.lock(key):
+        pipe = registry.get(
+            key,
+            task_name(img2img=img2img, inpainting=inpainting),
+            lambda: load_base_pipeline(base_model, pipeline_type, precision=key[2])
+        )
+        _activate_adapters(pipe, key, {LCM_ADAPTER: None} if scheduler == "lcm" else {})
+        apply_scheduler(pipe, key, scheduler)
+        yield pipe
+
+def memory_report():
+    """Resident bytes of every shared module, grouped by base model."""
+    return registry.memory_report()
+
+def cache_stats():
+    """Hit, miss and eviction counters of the pipeline cache."""
+    return registry.cache.stats()
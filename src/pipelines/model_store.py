@@ -0,0 +1,166 @@
+"""
+Local model store: pinned snapshots of every Hub repo the app loads.
+
+``MODEL_STORE_MANIFEST`` (``models/manifest.json`` by default) maps Hub repo
+ids to a local snapshot directory and the commit it was downloaded at::
+
+    {"repos": {"stabilityai/stable-diffusion-xl-base-1.0": {
+        "path": "models/hub/stabilityai--stable-diffusion-xl-base-1.0",
+        "revision": "462165984030d82259a11f4367a4eed129e94a7b"}}}
+
+``resolve`` turns a repo id into its snapshot directory when one is present,
+so loading never needs a Hub round-trip. With ``OFFLINE_MODE`` every repo must
+resolve locally and the Hub is never contacted. ``prefetch`` fills the store;
+run it once with ``python -m src.tools.prefetch``.
+"""
+import json
+import os
+import threading
+import time
+from src.config.constants import (
+    MODEL_CONFIGS,
+    MODEL_STORE_DIR,
+    MODEL_STORE_MANIFEST,
+    OFFLINE_MODE,
+    IP_ADAPTER_REPO,
+    IP_ADAPTER_SUBFOLDER,
+    IP_ADAPTER_WEIGHT_NAME,
+    REFINER_MODEL,
+    LCM_LORA_REPOS,
+    TWO_TEXT_ENCODERS_MODEL
+)
+
+class MissingSnapshotError(FileNotFoundError):
+    """Raised in offline mode for a repo that is not in the local store."""
+
+# Files each kind of repo needs; anything else in the repo is never downloaded
+_ALLOW_PATTERNS = {
+    "sdxl": ["model_index.json", "*/*.json", "*/*.txt", "*/*.fp16.safetensors"],
+    "stable-diffusion": ["model_index.json", "*/*.json", "*/*.txt", "*/*.safetensors"],
+    "flux": ["model_index.json", "*/*.json", "*/*.txt", "*/*.model", "*/*.safetensors"],
+    "ip-adapter": [f"{IP_ADAPTER_SUBFOLDER}/{IP_ADAPTER_WEIGHT_NAME}", f"{IP_ADAPTER_SUBFOLDER}/image_encoder/*"],
+    "lora": ["*.safetensors"]
+}
+_IGNORE_PATTERNS = {
+    "stable-diffusion": ["*.fp16.safetensors", "*non_ema*"]
+}
+
+_manifest = None
+_manifest_lock = threading.Lock()
+_cold_starts = []
+
+def required_repos(model_names=None):
+    """Hub repos needed by ``model_names`` (every style by default), with their kind."""
+    repos = {}
+    for model_name in model_names or list(MODEL_CONFIGS):
+        config = MODEL_CONFIGS[model_name]
+        repos[config["base_model"]] = config["pipeline"]
+        if config.get("use_ip_adapter", False):
+            repos[IP_ADAPTER_REPO] = "ip-adapter"
+        if config["pipeline"] == "sdxl":
+            repos[REFINER_MODEL] = "sdxl"
+        if config["pipeline"] in LCM_LORA_REPOS:
+            # Any request may switch the style to the LCM scheduler
+            repos[LCM_LORA_REPOS[config["pipeline"]]] = "lora"
+    if not model_names:
+        repos.setdefault(TWO_TEXT_ENCODERS_MODEL, "sdxl")
+        repos.setdefault(LCM_LORA_REPOS["sdxl"], "lora")
+    return repos
+
+def load_manifest():
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            if os.path.exists(MODEL_STORE_MANIFEST):
+                with open(MODEL_STORE_MANIFEST) as f:
+                    _manifest = json.load(f)
+            else:
+                _manifest = {"repos": {}}
+        return _manifest
+
+def _save_manifest(manifest):
+    directory = os.path.dirname(MODEL_STORE_MANIFEST)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{MODEL_STORE_MANIFEST}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, MODEL_STORE_MANIFEST)
+
+def local_path(repo_id):
+    """Snapshot directory of ``repo_id``, or None if it is not in the store."""
+    entry = load_manifest()["repos"].get(repo_id)
+    if entry is None or not os.path.isdir(entry["path"]):
+        return None
+    return entry["path"]
+
+def is_local(repo_id):
+    return local_path(repo_id) is not None
+
+def resolve(repo_id):
+    """Where ``from_pretrained`` should load ``repo_id`` from."""
+    path = local_path(repo_id)
+    if path is not None:
+        return path
+    if OFFLINE_MODE:
+        raise MissingSnapshotError(
+            f"{repo_id} is not in the local model store ({MODEL_STORE_MANIFEST}). "
+            "Run `python -m src.tools.prefetch` on a machine with Hub access first."
+        )
+    return repo_id
+
+def prefetch(repos=None, token=None, on_progress=None):
+    """Download pinned snapshots of ``repos`` (``{repo_id: kind}``) into the store.
+
+    Each repo is pinned to the commit current at download time and the manifest
+    is saved after every repo, so an interrupted prefetch keeps its progress.
+    """
+    from huggingface_hub import HfApi, snapshot_download
+
+    api = HfApi(token=token)
+    manifest = load_manifest()
+    for repo_id, kind in (repos or required_repos()).items():
+        revision = api.model_info(repo_id).sha
+        path = os.path.join(MODEL_STORE_DIR, repo_id.replace("/", "--"))
+        start = time.perf_counter()
+        snapshot_download(
+            repo_id,
+            revision=revision,
+            local_dir=path,
+            allow_patterns=_ALLOW_PATTERNS.get(kind),
+            ignore_patterns=_IGNORE_PATTERNS.get(kind),
+            token=token
+        )
+        with _manifest_lock:
+            manifest["repos"][repo_id] = {"path": path, "revision": revision}
+            _save_manifest(manifest)
+        if on_progress is not None:
+            on_progress(repo_id, path, revision, time.perf_counter() - start)
+    return manifest
+
+def record_cold_start(base_model, pipeline_type, precision, seconds, local, modules=None):
+    """Remember how long a base took to load, with an optional per-module breakdown."""
+    _cold_starts.append({
+        "base_model": base_model,
+        "pipeline": pipeline_type,
+        "precision": precision,
+        "seconds": seconds,
+        "source": "local" if local else "hub",
+        "modules": dict(modules or {})
+    })
+
+def status():
+    """Offline flag, store state of every required repo and cold start timings."""
+    manifest = load_manifest()
+    return {
+        "offline": OFFLINE_MODE,
+        "manifest": MODEL_STORE_MANIFEST,
+        "repos": {
+            repo_id: {
+                "local": is_local(repo_id),
+                "revision": manifest["repos"].get(repo_id, {}).get("revision")
+            }
+            for repo_id in required_repos()
+        },
+        "cold_starts": list(_cold_starts)
+    }
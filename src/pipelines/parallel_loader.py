@@ -0,0 +1,154 @@
+"""
+Concurrent loading of pipeline submodules.
+
+``from_pretrained`` on a pipeline deserializes its UNet, VAE, text encoders and
+tokenizers one after another. Here the safetensors reads and weight loading of
+each model run on their own thread and the pipeline is then assembled from the
+loaded modules. The time spent on each module is returned so cold start can be
+broken down.
+
+Building a model on the meta device goes through accelerate's
+``init_empty_weights``, which patches ``nn.Module.register_parameter`` for the
+whole process. Threads entering and leaving such patches out of order can leave
+them in place, so models are only ever built under ``construction_lock``, one
+at a time. The weights are then put in with ``set_module_tensor_to_device``,
+which writes the module's parameters directly and is safe while another
+thread holds the patch.
+"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import torch
+from accelerate import init_empty_weights
+from accelerate.utils import set_module_tensor_to_device
+from diffusers import AutoencoderKL, AutoPipelineForText2Image, ModelMixin, StableDiffusionPipeline, UNet2DConditionModel
+from diffusers.pipelines.stable_diffusion.safety_checker import StableDiffusionSafetyChecker
+from huggingface_hub import snapshot_download
+from safetensors.torch import load_file
+from transformers import CLIPImageProcessor, CLIPTextModel, CLIPTextModelWithProjection, CLIPTokenizer
+
+# Submodules loaded per pipeline type, as (subfolder, class, is_model)
+COMPONENTS = {
+    "sdxl": (
+        ("unet", UNet2DConditionModel, True),
+        ("vae", AutoencoderKL, True),
+        ("text_encoder", CLIPTextModel, True),
+        ("text_encoder_2", CLIPTextModelWithProjection, True),
+        ("tokenizer", CLIPTokenizer, False),
+        ("tokenizer_2", CLIPTokenizer, False)
+    ),
+    "stable-diffusion": (
+        ("unet", UNet2DConditionModel, True),
+        ("vae", AutoencoderKL, True),
+        ("text_encoder", CLIPTextModel, True),
+        ("safety_checker", StableDiffusionSafetyChecker, True),
+        ("tokenizer", CLIPTokenizer, False),
+        ("feature_extractor", CLIPImageProcessor, False)
+    )
+}
+
+_PIPELINES = {
+    "sdxl": AutoPipelineForText2Image,
+    "stable-diffusion": StableDiffusionPipeline
+}
+
+# Held while a model is built or a pipeline is assembled; see the module docstring
+construction_lock = threading.Lock()
+
+def supports(pipeline_type):
+    return pipeline_type in COMPONENTS
+
+def _weight_stem(cls):
+    return "diffusion_pytorch_model" if issubclass(cls, ModelMixin) else "model"
+
+def _component_dir(source, name, cls, variant, hub_kwargs):
+    if os.path.isdir(source):
+        return os.path.join(source, name)
+    # Only this component's config and the weights of the requested variant
+    weights = f"{_weight_stem(cls)}{f'.{variant}' if variant else ''}"
+    snapshot = snapshot_download(
+        source,
+        allow_patterns=[f"{name}/*.json", f"{name}/{weights}.safetensors", f"{name}/{weights}-*-of-*.safetensors"],
+        **hub_kwargs
+    )
+    return os.path.join(snapshot, name)
+
+def _weight_files(directory, cls, variant):
+    weights = f"{_weight_stem(cls)}{f'.{variant}' if variant else ''}"
+    files = sorted(
+        os.path.join(directory, file_name)
+        for file_name in os.listdir(directory)
+        if file_name == f"{weights}.safetensors"
+        or (file_name.startswith(f"{weights}-") and file_name.endswith(".safetensors") and "-of-" in file_name)
+    )
+    if not files:
+        raise FileNotFoundError(f"No {weights} safetensors weights in {directory}")
+    return files
+
+def _build_model(directory, cls):
+    with construction_lock, init_empty_weights():
+        if issubclass(cls, ModelMixin):
+            return cls.from_config(cls.load_config(directory))
+        # _from_config picks the attention implementation as from_pretrained does
+        return cls._from_config(cls.config_class.from_pretrained(directory))
+
+def _load_model(source, name, cls, variant, hub_kwargs):
+    directory = _component_dir(source, name, cls, variant, hub_kwargs)
+    model = _build_model(directory, cls)
+    state_dict = {}
+    for path in _weight_files(directory, cls, variant):
+        state_dict.update(load_file(path))
+    if hasattr(model, "_convert_deprecated_attention_blocks"):
+        # Older VAE checkpoints name their attention weights query/key/value
+        model._convert_deprecated_attention_blocks(state_dict)
+    expected = model.state_dict().keys()
+    for key, tensor in state_dict.items():
+        if key in expected:
+            set_module_tensor_to_device(model, key, "cpu", value=tensor, dtype=torch.float32)
+    missing = [key for key, tensor in model.state_dict().items() if tensor.device.type == "meta"]
+    if missing:
+        raise ValueError(f"{name} checkpoint is missing {len(missing)} weights, e.g. {missing[0]}")
+    return model.eval()
+
+def _load_component(source, name, cls, is_model, variant, hub_kwargs):
+    start = time.perf_counter()
+    if is_model:
+        module = _load_model(source, name, cls, variant, hub_kwargs)
+    else:
+        module = cls.from_pretrained(source, subfolder=name, **hub_kwargs)
+    return module, time.perf_counter() - start
+
+def load_pipeline(source, pipeline_type, use_safetensors=True, variant=None, hub_kwargs=None, max_workers=4):
+    """Load a text-to-image pipeline with its submodules deserialized concurrently.
+
+    Only safetensors checkpoints are read concurrently; with
+    ``use_safetensors=False`` the pipeline is loaded by one ``from_pretrained``.
+    Returns ``(pipe, seconds)`` where ``seconds`` maps each submodule, and the
+    final assembly, to the wall time it took.
+    """
+    hub_kwargs = hub_kwargs or {}
+    model_kwargs = {"torch_dtype": torch.float32, "use_safetensors": use_safetensors, "variant": variant}
+    components = {}
+    seconds = {}
+    if use_safetensors:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="component-loader") as executor:
+            futures = {
+                name: executor.submit(_load_component, source, name, cls, is_model, variant, hub_kwargs)
+                for name, cls, is_model in COMPONENTS[pipeline_type]
+            }
+            loaded = {name: future.result() for name, future in futures.items()}
+        components = {name: module for name, (module, _) in loaded.items()}
+        seconds = {name: elapsed for name, (_, elapsed) in loaded.items()}
+
+    # Only the scheduler and configs are left for from_pretrained to read
+    start = time.perf_counter()
+    with construction_lock:
+        pipe = _PIPELINES[pipeline_type].from_pretrained(
+            source,
+            **components,
+            **model_kwargs,
+            **hub_kwargs
+        )
+    seconds["assemble"] = time.perf_counter() - start
+    return pipe, seconds
@@ -0,0 +1,99 @@
+"""
+Precision modes for loaded pipelines.
+
+``fp32`` keeps every module in float32. ``bf16`` casts the denoiser and text
+encoders to bfloat16 and runs pipeline calls under bfloat16 autocast; the VAE
+stays in float32 and its encode/decode run with autocast disabled. ``int8``
+applies dynamic int8 quantization to the Linear layers of the denoiser and
+text encoders. It is CPU-only, and because PEFT cannot wrap quantized layers,
+every LoRA that will run on the pipeline must be loaded before it is applied;
+the LoRA's own low-rank layers stay in float32.
+"""
+import contextlib
+import functools
+import torch
+from src.config.constants import MODEL_CONFIGS, PRECISION_MODE
+
+PRECISIONS = ("fp32", "bf16", "int8")
+
+# Modules whose precision changes; the VAE and image encoder stay in float32
+_TARGETS = ("unet", "transformer", "text_encoder", "text_encoder_2")
+
+def resolve_precision(model_name=None):
+    """Precision for a style: ``PRECISION_MODE`` if set, else the style's config."""
+    precision = PRECISION_MODE
+    if precision is None:
+        precision = MODEL_CONFIGS[model_name].get("precision", "fp32") if model_name else "fp32"
+    if precision not in PRECISIONS:
+        raise ValueError(f"Unknown precision mode '{precision}', expected one of {', '.join(PRECISIONS)}")
+    return precision
+
+def denoiser(pipe):
+    """The UNet of SD pipelines or the transformer of Flux."""
+    unet = getattr(pipe, "unet", None)
+    return unet if unet is not None else getattr(pipe, "transformer", None)
+
+def precision_of(module):
+    return getattr(module, "precision_mode", "fp32")
+
+def _target_modules(pipe):
+    return [
+        module for module in (getattr(pipe, name, None) for name in _TARGETS)
+        if module is not None
+    ]
+
+def _int8_qconfig_spec(module):
+    # PEFT reads the weight dtype of its lora_A/lora_B layers on every forward,
+    # which a quantized Linear does not have, so only base layers are converted
+    return {
+        name: torch.ao.quantization.default_dynamic_qconfig
+        for name, submodule in module.named_modules()
+        if isinstance(submodule, torch.nn.Linear) and not {"lora_A", "lora_B"} & set(name.split("."))
+    }
+
+def _without_autocast(fn):
+    @functools.wraps(fn)
+    def call(x, *args, **kwargs):
+        with torch.autocast(device_type=x.device.type, enabled=False):
+            return fn(x.to(torch.float32), *args, **kwargs)
+    return call
+
+def _keep_vae_fp32(vae):
+    # SDXL pipelines otherwise cast the VAE to the latents' dtype after an
+    # upcast; the wrappers take care of feeding it float32 instead
+    if getattr(vae, "precision_mode", None) == "fp32":
+        return
+    vae.precision_mode = "fp32"
+    vae.register_to_config(force_upcast=False)
+    vae.encode = _without_autocast(vae.encode)
+    vae.decode = _without_autocast(vae.decode)
+
+def apply_precision(pipe, precision):
+    """Convert a freshly loaded pipeline to ``precision`` in place.
+
+    Modules already in ``precision``, e.g. ones shared with another converted
+    pipeline, are left alone.
+    """
+    if precision == "fp32":
+        return pipe
+    modules = [module for module in _target_modules(pipe) if precision_of(module) != precision]
+    if precision == "bf16":
+        for module in modules:
+            module.to(dtype=torch.bfloat16)
+        if getattr(pipe, "vae", None) is not None:
+            _keep_vae_fp32(pipe.vae)
+    elif precision == "int8":
+        if pipe.device.type != "cpu":
+            raise ValueError("int8 precision is only supported for CPU inference")
+        for module in modules:
+            torch.ao.quantization.quantize_dynamic(module, _int8_qconfig_spec(module), dtype=torch.qint8, inplace=True)
+    for module in modules:
+        module.precision_mode = precision
+    return pipe
+
+def inference_context(pipe):
+    """Context for a pipeline call: bfloat16 autocast for bf16 pipelines."""
+    module = denoiser(pipe)
+    if module is not None and precision_of(module) == "bf16":
+        return torch.autocast(device_type=module.device.type, dtype=torch.bfloat16)
+    return contextlib.nullcontext()
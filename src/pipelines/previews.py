@@ -0,0 +1,54 @@
+"""
+Approximate previews of in-progress latents.
+
+A fixed linear projection maps the four latent channels of SD1.5 and SDXL
+straight to RGB at latent resolution (1/8 of the output size). It costs a
+tiny matrix product per preview instead of a VAE decode, which is enough to
+watch composition and colour settle while the denoising loop runs.
+
+Only numpy and PIL are needed, so the job layer can use it without pulling in
+torch.
+"""
+import numpy as np
+from PIL import Image
+from src.config.constants import MODEL_CONFIGS
+
+# Per latent space: RGB contribution of each latent channel, and an RGB bias
+_LATENT_RGB = {
+    "stable-diffusion": (
+        [
+            [0.3512, 0.2297, 0.3227],
+            [0.3250, 0.4974, 0.2350],
+            [-0.2829, 0.1762, 0.2721],
+            [-0.2120, -0.2616, -0.7177]
+        ],
+        [0.0, 0.0, 0.0]
+    ),
+    "sdxl": (
+        [
+            [0.3651, 0.4232, 0.4341],
+            [-0.2533, -0.0042, 0.1068],
+            [0.1076, 0.1111, -0.0362],
+            [-0.3165, -0.2492, -0.2188]
+        ],
+        [0.1084, -0.0175, -0.0011]
+    )
+}
+
+def latent_space(model_name=None):
+    """Latent space a style denoises in, or None if it has no previewer.
+
+    Without a style the plain SDXL base of the two text-encoders flow is used.
+    """
+    pipeline_type = MODEL_CONFIGS[model_name]["pipeline"] if model_name else "sdxl"
+    return pipeline_type if pipeline_type in _LATENT_RGB else None
+
+def latents_to_rgb(latents, space):
+    """RGB preview of the first latent in a ``(batch, 4, h, w)`` tensor or array."""
+    if hasattr(latents, "detach"):
+        latents = latents.detach().float().cpu().numpy()
+    factors, bias = _LATENT_RGB[space]
+    rgb = np.einsum("chw,cr->hwr", latents[0], np.asarray(factors)) + np.asarray(bias)
+    # The projection lands roughly in [-1, 1]
+    pixels = np.clip((rgb + 1.0) * 127.5, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels, mode="RGB")
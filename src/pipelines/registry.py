@@ -0,0 +1,202 @@
+"""
+Component-sharing registry for loaded pipelines.
+
+Each base model is loaded once as a text-to-image pipeline. The image-to-image
+and inpainting pipelines are built from it with ``from_pipe``, so all task
+variants reference the same UNet, VAE, text encoders and IP-Adapter modules.
+
+An SDXL base can also have a refiner attached, built over the base's second
+text encoder and VAE. It is sized, locked and evicted together with its base.
+
+Views and refiners are built under their base's lock, but evictions run under
+the cache's lock, so both dicts are only read and written under ``_guard``. A
+view finished after its base was evicted is not kept.
+"""
+import threading
+import torch
+from diffusers import AutoPipelineForImage2Image, AutoPipelineForInpainting
+from src.config.constants import PIPELINE_CACHE_BUDGET_BYTES
+from src.pipelines.cache import PipelineCache
+
+TASKS = ("text2img", "img2img", "inpainting")
+
+def task_name(img2img=False, inpainting=False):
+    if inpainting:
+        return "inpainting"
+    if img2img:
+        return "img2img"
+    return "text2img"
+
+def module_nbytes(module, seen=None):
+    """Bytes held by a module's parameters and buffers.
+
+    Tensors whose storage is already in ``seen`` are skipped, so modules shared
+    between pipelines are only counted once.
+    """
+    seen = set() if seen is None else seen
+    total = 0
+    for tensor in list(module.parameters()) + list(module.buffers()):
+        ptr = tensor.data_ptr()
+        if ptr in seen:
+            continue
+        seen.add(ptr)
+        total += tensor.numel() * tensor.element_size()
+    # Dynamically quantized Linear layers keep their weights in packed params
+    for submodule in module.modules():
+        if isinstance(submodule, torch.ao.nn.quantized.dynamic.Linear) and id(submodule) not in seen:
+            seen.add(id(submodule))
+            weight, bias = submodule._weight_bias()
+            total += weight.numel() * weight.element_size()
+            if bias is not None:
+                total += bias.numel() * bias.element_size()
+    return total
+
+def pipeline_nbytes(pipe, seen=None):
+    """Total parameter and buffer bytes of all modules in a pipeline."""
+    seen = set() if seen is None else seen
+    return sum(
+        module_nbytes(component, seen)
+        for component in pipe.components.values()
+        if isinstance(component, torch.nn.Module)
+    )
+
+def _build_view(base, task):
+    if task == "img2img":
+        return AutoPipelineForImage2Image.from_pipe(base)
+    if task == "inpainting":
+        return AutoPipelineForInpainting.from_pipe(base)
+    return base
+
+class ComponentRegistry:
+    """Resident base pipelines and the task views built over their modules."""
+
+    def __init__(self, budget_bytes):
+        self.cache = PipelineCache(budget_bytes, on_evict=self._drop_views)
+        self._views = {}
+        self._refiners = {}
+        self._locks = {}
+        self._guard = threading.Lock()
+
+    def _drop_views(self, key, base):
+        with self._guard:
+            for view_key in [view_key for view_key in self._views if view_key[0] == key]:
+                del self._views[view_key]
+            self._refiners.pop(key, None)
+
+    def _view(self, key, name):
+        with self._guard:
+            return self._views.get((key, name))
+
+    def _keep_view(self, key, name, base, view):
+        # The cache drops an evicted entry before calling _drop_views, so a
+        # base still resident here has its views dropped after this insert
+        with self._guard:
+            if self.cache.peek(key) is base:
+                self._views[(key, name)] = view
+
+    def _refiner(self, key):
+        with self._guard:
+            return self._refiners.get(key)
+
+    def _entry_nbytes(self, key, base):
+        # Modules the refiner shares with its base are counted once
+        seen = set()
+        total = pipeline_nbytes(base, seen)
+        refiner = self._refiner(key)
+        if refiner is not None:
+            total += pipeline_nbytes(refiner, seen)
+        return total
+
+    def lock(self, key):
+        """Lock shared by every task view of the base identified by ``key``."""
+        with self._guard:
+            return self._locks.setdefault(key, threading.RLock())
+
+    def get(self, key, task, load_base):
+        """Return the ``task`` pipeline for ``key``, loading the base on first use."""
+        if task not in TASKS:
+            raise ValueError(f"Unknown task: {task}")
+        with self.lock(key):
+            base = self.cache.get(key)
+            if base is None:
+                self.cache.reserve(key)
+                base = load_base()
+                self.cache.put(key, base, pipeline_nbytes(base))
+            if task == "text2img":
+                return base
+            view = self._view(key, task)
+            if view is None:
+                view = _build_view(base, task)
+                self._keep_view(key, task, base, view)
+            return view
+
+    def get_refiner(self, key, task, load_refiner):
+        """Return the refiner ``task`` pipeline attached to the resident base ``key``.
+
+        ``load_refiner(base)`` builds the refiner over the base's shared modules
+        on first use; ``task`` is ``"img2img"`` or ``"inpainting"``.
+        """
+        if task not in ("img2img", "inpainting"):
+            raise ValueError(f"Unknown refiner task: {task}")
+        with self.lock(key):
+            base = self.peek(key)
+            if base is None:
+                raise KeyError(f"Base {key} is not resident")
+            refiner = self._refiner(key)
+            if refiner is None:
+                refiner = load_refiner(base)
+                with self._guard:
+                    if self.cache.peek(key) is base:
+                        self._refiners[key] = refiner
+                self.refresh(key)
+            if task == "img2img":
+                return refiner
+            view = self._view(key, "refiner_inpainting")
+            if view is None:
+                view = _build_view(refiner, "inpainting")
+                self._keep_view(key, "refiner_inpainting", base, view)
+            return view
+
+    def refresh(self, key):
+        """Re-measure a resident base after modules were added to it."""
+        base = self.peek(key)
+        if base is not None:
+            self.cache.resize(key, self._entry_nbytes(key, base))
+
+    def peek(self, key):
+        """Resident base for ``key`` without touching LRU order or counters."""
+        return self.cache.peek(key)
+
+    def keys(self):
+        return self.cache.keys()
+
+    def module_memory(self, key):
+        """Resident bytes for each module of the base identified by ``key``."""
+        base = self.peek(key)
+        if base is None:
+            return {}
+        report = {}
+        seen = set()
+        for name, component in base.components.items():
+            if isinstance(component, torch.nn.Module):
+                report[name] = module_nbytes(component, seen)
+        refiner = self._refiner(key)
+        if refiner is not None:
+            # Shared modules were counted with the base and are left out
+            for name, component in refiner.components.items():
+                if isinstance(component, torch.nn.Module):
+                    nbytes = module_nbytes(component, seen)
+                    if nbytes:
+                        report[f"refiner.{name}"] = nbytes
+        return report
+
+    def memory_report(self):
+        """Per-base module footprint plus the total across all resident bases."""
+        bases = {key: self.module_memory(key) for key in self.keys()}
+        return {
+            "bases": bases,
+            "total_bytes": sum(sum(modules.values()) for modules in bases.values()),
+            "cache": self.cache.stats()
+        }
+
+registry = ComponentRegistry(PIPELINE_CACHE_BUDGET_BYTES)
@@ -0,0 +1,299 @@
+"""
+Deterministic result cache: finished generations stored on disk as PNG.
+
+Every flow is seeded, so the same parameters on the same weights reproduce the
+same image. Results are keyed by a hash of the task, style, every generation
+parameter (input images by their pixel content) and a fingerprint of the
+weights involved: the revision of each Hub repo, pinned in the local model
+store or else the commit of its snapshot in the Hugging Face cache, the size
+and modification time of the style's LoRA file and the precision mode.
+Changing any of them changes the key, so stale entries are never served and
+age out of the LRU. Requests on a repo whose revision is not known yet, e.g.
+one not downloaded so far, bypass the cache.
+
+Entries live in ``RESULT_CACHE_DIR`` as ``<key>-<index>.png`` and the least
+recently used ones are deleted beyond ``RESULT_CACHE_MAX_GB``. With
+``INFERENCE_WORKERS`` every worker stores into the same directory, so each one
+rescans it before evicting and on a miss for a key another worker may have
+stored; the file modification times are the shared access order. Images returned
+from the cache carry ``image.info["result_cache"] == "hit"``. Requests made
+inside ``bypass()`` neither read nor store entries.
+"""
+import contextvars
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from PIL import Image
+from src.config.constants import (
+    MODEL_CONFIGS,
+    IP_ADAPTER_REPO,
+    REFINER_MODEL,
+    TWO_TEXT_ENCODERS_MODEL,
+    LCM_LORA_REPOS,
+    RESULT_CACHE_DIR,
+    RESULT_CACHE_MAX_BYTES,
+    INFERENCE_WORKERS
+)
+from src.pipelines import model_store
+from src.pipelines.embedding_cache import image_content_hash
+from src.pipelines.precision import resolve_precision
+from src.utils.metrics import stage
+
+_bypassed = contextvars.ContextVar("result_cache_bypassed", default=False)
+
+def _file_fingerprint(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime_ns]
+
+def _hub_cache_revision(repo_id):
+    # Commit of the snapshot from_pretrained resolves for a repo outside the store
+    from huggingface_hub.constants import HF_HUB_CACHE
+
+    ref = os.path.join(HF_HUB_CACHE, f"models--{repo_id.replace('/', '--')}", "refs", "main")
+    try:
+        with open(ref) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+def weights_fingerprint(task, model_name=None, scheduler=None):
+    """Revisions, LoRA file state and precision of the weights ``task`` runs on.
+
+    None when the revision of any repo involved is unknown.
+    """
+    if model_name is None:
+        repos = [TWO_TEXT_ENCODERS_MODEL]
+        lora = None
+    else:
+        config = MODEL_CONFIGS[model_name]
+        repos = [config["base_model"]]
+        if config.get("use_ip_adapter", False):
+            repos.append(IP_ADAPTER_REPO)
+        lora = _file_fingerprint(config["lora_path"])
+    if task in ("inpainting", "refining"):
+        repos.append(REFINER_MODEL)
+    if scheduler == "lcm":
+        repos.append(LCM_LORA_REPOS[MODEL_CONFIGS[model_name]["pipeline"] if model_name else "sdxl"])
+    manifest = model_store.load_manifest()["repos"]
+    revisions = {
+        repo_id: manifest.get(repo_id, {}).get("revision") or _hub_cache_revision(repo_id)
+        for repo_id in repos
+    }
+    if None in revisions.values():
+        return None
+    return {
+        "repos": revisions,
+        "lora": lora,
+        "precision": resolve_precision(model_name)
+    }
+
+def _canonical(value):
+    if isinstance(value, Image.Image):
+        return {"image": image_content_hash(value)}
+    if isinstance(value, float):
+        # 7.5 and 7.50000001 from a float slider are the same request
+        return round(value, 6)
+    return value
+
+def result_key(task, model_name, params):
+    """Content hash of a generation request; ``params`` holds its plain kwargs.
+
+    None when the weights cannot be fingerprinted, so the request is not cached.
+    """
+    weights = weights_fingerprint(task, model_name, params.get("scheduler"))
+    if weights is None:
+        return None
+    canonical = {
+        "task": task,
+        "model_name": model_name,
+        "params": {name: _canonical(value) for name, value in sorted(params.items())},
+        "weights": weights
+    }
+    return hashlib.sha256(json.dumps(canonical, sort_keys=True).encode("utf-8")).hexdigest()
+
+class ResultCache:
+    """On-disk PNG store bounded by total bytes, evicting least recently used keys.
+
+    With ``shared`` other processes write to the same directory, and the index
+    is rebuilt from it before it is used to evict, count or clear entries.
+    """
+
+    def __init__(self, directory, max_bytes, shared=False):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.shared = shared
+        self._entries = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return bool(self.directory) and self.max_bytes > 0
+
+    def _index(self):
+        # Rebuilt from the directory on first use, oldest access first
+        if self._entries is None:
+            entries = {}
+            if os.path.isdir(self.directory):
+                for entry in os.scandir(self.directory):
+                    key, _, suffix = entry.name.rpartition("-")
+                    if not key or not suffix.endswith(".png"):
+                        continue
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        # Evicted by another worker during the scan
+                        continue
+                    paths, size, used = entries.get(key, ([], 0, 0))
+                    entries[key] = (paths + [entry.path], size + stat.st_size, max(used, stat.st_mtime))
+            ordered = sorted(entries.items(), key=lambda item: item[1][2])
+            self._entries = OrderedDict((key, (sorted(paths), size)) for key, (paths, size, _) in ordered)
+        return self._entries
+
+    def _rescan(self):
+        if self.shared:
+            self._entries = None
+        return self._index()
+
+    def get(self, key):
+        """Decoded images stored under ``key``, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._index().get(key)
+            if entry is None and self.shared and os.path.exists(os.path.join(self.directory, f"{key}-0.png")):
+                # Stored by another worker since the index was built
+                entry = self._rescan().get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        images = []
+        try:
+            for path in entry[0]:
+                image = Image.open(path)
+                image.load()
+                image.info["result_cache"] = "hit"
+                images.append(image)
+            # The modification time doubles as last access for the next restart
+            for path in entry[0]:
+                os.utime(path)
+        except OSError:
+            self._discard(key)
+            return None
+        return images
+
+    def put(self, key, images):
+        if not self.enabled:
+            return
+        with stage("result_cache_store"):
+            os.makedirs(self.directory, exist_ok=True)
+            paths = []
+            size = 0
+            for index, image in enumerate(images):
+                buf = io.BytesIO()
+                image.save(buf, format="PNG")
+                path = os.path.join(self.directory, f"{key}-{index}.png")
+                # A temp file of its own, as identical requests may store at once
+                fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        f.write(buf.getvalue())
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    self._remove([tmp_path])
+                    raise
+                paths.append(path)
+                size += buf.tell()
+        with self._lock:
+            self._rescan()[key] = (paths, size)
+            self._entries.move_to_end(key)
+            self._evict()
+
+    def _evict(self):
+        total = sum(size for _, size in self._entries.values())
+        while total > self.max_bytes and len(self._entries) > 1:
+            key, (paths, size) = self._entries.popitem(last=False)
+            self._remove(paths)
+            total -= size
+
+    def _discard(self, key):
+        with self._lock:
+            paths, _ = self._index().pop(key, ([], 0))
+        self._remove(paths)
+
+    def _remove(self, paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            for paths, _ in self._rescan().values():
+                self._remove(paths)
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            entries = self._rescan() if self.enabled else {}
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(entries),
+                "bytes": sum(size for _, size in entries.values())
+            }
+
+result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_BYTES, shared=INFERENCE_WORKERS > 0)
+
+@contextmanager
+def bypass():
+    """Run the requests made inside the block without the result cache."""
+    token = _bypassed.set(True)
+    try:
+        yield
+    finally:
+        _bypassed.reset(token)
+
+def lookup(task, model_name, params):
+    """Cache key and stored images of a request.
+
+    The images are None on a miss; both are None with the cache disabled or
+    bypassed, or when the weights' revisions are unknown.
+    """
+    if not result_cache.enabled or _bypassed.get():
+        return None, None
+    key = result_key(task, model_name, params)
+    if key is None:
+        return None, None
+    return key, result_cache.get(key)
+
+def store(key, images):
+    if key is not None:
+        result_cache.put(key, images)
+
+def cached(task, model_name, params, run):
+    """Return the stored images for this request, or ``run()`` them and store them.
+
+    ``run`` returns a list of PIL images.
+    """
+    key, images = lookup(task, model_name, params)
+    if images is not None:
+        return images
+    images = run()
+    store(key, images)
+    return images
+
+def is_hit(image):
+    return image.info.get("result_cache") == "hit"
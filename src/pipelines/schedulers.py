@@ -0,0 +1,66 @@
+"""
+Sampler selection for the shared pipelines.
+
+Every style names its sampler in ``MODEL_CONFIGS`` and a request may pick
+another one from ``SCHEDULERS``. Schedulers only hold configuration and the
+timesteps of the call in progress, so one instance per sampler is cached for
+each base (and refiner) and swapped onto the pipeline under the base lock:
+switching samplers never rebuilds one from its config.
+"""
+import threading
+from diffusers import (
+    DPMSolverMultistepScheduler,
+    EulerAncestralDiscreteScheduler,
+    LCMScheduler,
+    UniPCMultistepScheduler
+)
+from src.config.constants import MODEL_CONFIGS, SCHEDULERS, DEFAULT_SCHEDULER, LCM_LORA_REPOS
+
+# Scheduler class and config overrides per sampler name
+_SCHEDULER_CLASSES = {
+    "euler_a": (EulerAncestralDiscreteScheduler, {}),
+    "dpmpp_2m": (DPMSolverMultistepScheduler, {"algorithm_type": "dpmsolver++", "solver_order": 2, "use_karras_sigmas": True}),
+    "unipc": (UniPCMultistepScheduler, {}),
+    "lcm": (LCMScheduler, {})
+}
+
+_schedulers = {}
+_source_configs = {}
+_lock = threading.Lock()
+
+def resolve_scheduler(model_name=None, scheduler=None):
+    """Sampler a request runs with: ``scheduler``, else the style's configured one.
+
+    Without a style the plain SDXL base of the two text-encoders flow is meant.
+    Returns None for pipelines with their own sampler (Flux), which accept no
+    override.
+    """
+    pipeline_type = MODEL_CONFIGS[model_name]["pipeline"] if model_name else "sdxl"
+    if pipeline_type not in LCM_LORA_REPOS:
+        if scheduler is not None:
+            raise ValueError(f"{model_name} uses its own sampler; no scheduler can be selected")
+        return None
+    name = scheduler or (MODEL_CONFIGS[model_name].get("scheduler") if model_name else None) or DEFAULT_SCHEDULER
+    if name not in SCHEDULERS:
+        raise ValueError(f"Unknown scheduler: {name}. Expected one of {', '.join(SCHEDULERS)}")
+    return name
+
+def apply_scheduler(pipe, owner, name):
+    """Put the cached ``name`` scheduler of ``owner`` on ``pipe``.
+
+    ``owner`` identifies the pipelines sharing one scheduler config, e.g. a
+    base key. The config of the first pipeline seen for ``owner`` is the one
+    every sampler is derived from, so swapping back and forth never drifts.
+    """
+    if name is None:
+        return pipe
+    with _lock:
+        source = _source_configs.setdefault(owner, pipe.scheduler.config)
+        scheduler = _schedulers.get((owner, name))
+        if scheduler is None:
+            scheduler_class, overrides = _SCHEDULER_CLASSES[name]
+            scheduler = scheduler_class.from_config(source, **overrides)
+            _schedulers[(owner, name)] = scheduler
+    if pipe.scheduler is not scheduler:
+        pipe.scheduler = scheduler
+    return pipe
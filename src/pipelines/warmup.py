@@ -0,0 +1,120 @@
+"""
+Warm pool: preload configured styles in the background at server start.
+
+Each style in ``WARM_STYLES`` is loaded for every task in ``WARM_TASKS`` and
+run through a tiny generation via the engine, so the weights, LoRA, IP-Adapter,
+lazily initialised kernels and allocator pools are all in place before the
+first real request. Bases of styles that warmed without errors are pinned in
+the pipeline cache so the pool stays resident.
+
+``readiness`` reports per style whether it is cold, queued, warming, warm or
+failed. Any style whose base is resident with the style's LoRA loaded counts
+as warm, and one whose base has left the cache reports cold again. Reading readiness never imports torch,
+so style pickers can use it on every script run.
+"""
+import sys
+import threading
+import time
+from PIL import Image
+from src.config.constants import MODEL_CONFIGS, WARM_STYLES, WARM_TASKS, WARMUP_STEPS
+
+# Smallest size that is a valid multiple of every pipeline's latent grid
+_WARMUP_SIZE = 64
+
+_readiness = {}
+_lock = threading.Lock()
+
+def _set(model_name, **fields):
+    with _lock:
+        _readiness.setdefault(model_name, {"state": "cold", "tasks": {}}).update(fields)
+
+def _dummy_generation(model_name, task):
+    from src.pipelines import engine
+    from src.pipelines.result_cache import bypass
+
+    config = MODEL_CONFIGS[model_name]
+    params = {
+        "model_name": model_name,
+        "prompt": config["default_prompt"],
+        "num_inference_steps": WARMUP_STEPS,
+        "seed": 0
+    }
+    image = Image.new("RGB", (_WARMUP_SIZE, _WARMUP_SIZE))
+    # A stored result would answer the request without loading anything
+    with bypass():
+        if task == "text2img":
+            engine.generate_text_to_image(width=_WARMUP_SIZE, height=_WARMUP_SIZE, **params)
+        elif task == "img2img":
+            engine.generate_image_to_image(image=image, width=_WARMUP_SIZE, height=_WARMUP_SIZE, strength=1.0, **params)
+        elif task == "inpainting":
+            mask = Image.new("L", (_WARMUP_SIZE, _WARMUP_SIZE), 255)
+            engine.inpaint(image=image, mask_image=mask, **params)
+        else:
+            raise ValueError(f"Unknown warm-up task: {task}")
+
+def warm_style(model_name, tasks):
+    """Load ``model_name`` for each of ``tasks`` and run a tiny generation."""
+    from src.pipelines.model_loader import base_key, registry
+
+    _set(model_name, state="warming")
+    start = time.perf_counter()
+    results = {}
+    for task in tasks:
+        try:
+            _dummy_generation(model_name, task)
+            results[task] = "warm"
+        except Exception as e:
+            results[task] = f"failed: {e}"
+    failed = any(result != "warm" for result in results.values())
+    if not failed:
+        registry.cache.pin(base_key(model_name))
+    _set(model_name, state="failed" if failed else "warm", tasks=results, seconds=time.perf_counter() - start)
+
+def start_warmup(model_names=None, tasks=None):
+    """Warm ``model_names`` (``WARM_STYLES`` by default) on a daemon thread."""
+    model_names = [name for name in (model_names or WARM_STYLES) if name in MODEL_CONFIGS]
+    tasks = tasks or WARM_TASKS
+    for model_name in model_names:
+        _set(model_name, state="queued")
+
+    def run():
+        for model_name in model_names:
+            warm_style(model_name, tasks)
+
+    thread = threading.Thread(target=run, name="warmup", daemon=True)
+    thread.start()
+    return thread
+
+def readiness(model_name=None):
+    """Readiness of one style, or of every style keyed by name."""
+    if model_name is None:
+        return {name: readiness(name) for name in MODEL_CONFIGS}
+    with _lock:
+        status = dict(_readiness.get(model_name, {"state": "cold", "tasks": {}}))
+    if status["state"] in ("cold", "warm"):
+        status["state"] = "warm" if _resident(model_name) else "cold"
+    return status
+
+def _resident(model_name):
+    # With inference workers the pipelines live in the worker processes
+    workers = sys.modules.get("src.pipelines.workers")
+    pool = workers.active_pool() if workers is not None else None
+    if pool is not None:
+        return model_name in pool.resident_styles()
+    # Nothing can be resident before the loader was imported, and importing it
+    # here would pull in torch and diffusers
+    loader = sys.modules.get("src.pipelines.model_loader")
+    if loader is None:
+        return False
+    base = loader.registry.peek(loader.base_key(model_name))
+    if base is None:
+        return False
+    # A resident base only serves the style without a load once its LoRA is in
+    if MODEL_CONFIGS[model_name].get("lora_path"):
+        return loader.adapter_name(model_name) in loader._loaded_adapters(base)
+    return True
+
+def style_label(model_name):
+    """Style name annotated with its readiness, for style pickers."""
+    state = readiness(model_name)["state"]
+    return f"{model_name} · {state}"
@@ -0,0 +1,251 @@
+"""
+Inference worker processes pinned to disjoint CPU cores.
+
+Generation in the server process runs every concurrent request on threads
+sharing torch's intra-op thread pool, so two requests at once oversubscribe
+the cores and both slow down more than running them in turn would. With
+``INFERENCE_WORKERS`` set, generation instead runs in that many spawned worker
+processes, each pinned to its own slice of the cores with torch's thread
+count sized to it, so concurrent requests scale with the number of workers.
+
+A worker runs one request at a time and keeps its own pipelines, prompt and
+latent caches; results, previews and callback values travel back as pickled
+messages. Requests go to the least loaded worker that already has the style
+resident, or to an idle worker when every warm one is busy, so each style
+tends to stay loaded on the workers that serve it. ``WARM_STYLES`` are spread
+round-robin across the workers at start.
+"""
+import importlib
+import multiprocessing
+import os
+import pickle
+import queue
+import threading
+from contextlib import contextmanager
+from src.config.constants import INFERENCE_WORKERS, WARM_STYLES, WARM_TASKS
+from src.pipelines.jobs import JobCancelled, step_callback
+from src.utils.cpu import partition_cores, pin_process
+
+# Seconds between checks for cancellation and worker exit while waiting
+_POLL_INTERVAL = 0.1
+
+def _send(results, request_id, message):
+    # Pickled here rather than in the queue's feeder thread, where a failure
+    # would be dropped and leave the caller waiting forever
+    try:
+        payload = pickle.dumps((request_id, message))
+    except Exception as e:
+        payload = pickle.dumps((request_id, {"type": "error", "error": RuntimeError(f"Unpicklable {message['type']}: {e}")}))
+    results.put(payload)
+
+def _resident_styles():
+    from src.pipelines.warmup import readiness
+
+    return [name for name, status in readiness().items() if status["state"] == "warm"]
+
+def _serve(cores, requests, results, cancel_event, warm_styles):
+    global _in_worker
+    # Generation in a worker always runs in process, never on a nested pool
+    _in_worker = True
+    pin_process(cores)
+    from src.pipelines.warmup import warm_style
+
+    for model_name in warm_styles:
+        warm_style(model_name, WARM_TASKS)
+
+    while True:
+        request = requests.get()
+        if request is None:
+            return
+        cancel_event.clear()
+        request_id, (module_name, function_name), kwargs, callback_names, with_events = request
+        send = lambda message, request_id=request_id: _send(results, request_id, message)
+        for name in callback_names:
+            kwargs[name] = lambda value, name=name: send({"type": "callback", "name": name, "value": value})
+        progress_callback = step_callback(send, kwargs.get("model_name"), cancel_event) if with_events else None
+        try:
+            fn = getattr(importlib.import_module(module_name), function_name)
+            value = fn(**kwargs, progress_callback=progress_callback, cancel_event=cancel_event)
+        except JobCancelled:
+            message = {"type": "cancelled"}
+        except Exception as e:
+            message = {"type": "error", "error": e}
+        else:
+            message = {"type": "result", "value": value}
+        send({"type": "resident", "styles": _resident_styles()})
+        send(message)
+
+class InferenceWorker:
+    """Parent-side handle of one worker process and its core slice."""
+
+    def __init__(self, index, cores, context, warm_styles=()):
+        self.index = index
+        self.cores = cores
+        self.load = 0
+        self._request_id = 0
+        # Styles resident in the worker, as of its last report; None stands for
+        # the style-less two text-encoders flow
+        self.warm = set(warm_styles)
+        self._context = context
+        self._lock = threading.Lock()
+        self._start(warm_styles)
+
+    def _start(self, warm_styles=()):
+        self.requests = self._context.Queue()
+        self.results = self._context.Queue()
+        self.cancel_event = self._context.Event()
+        self.process = self._context.Process(
+            target=_serve,
+            args=(self.cores, self.requests, self.results, self.cancel_event, list(warm_styles)),
+            name=f"inference-worker-{self.index}",
+            daemon=True
+        )
+        self.process.start()
+
+    @contextmanager
+    def _acquire(self, cancel_event):
+        # Held for a whole request: the worker serves one at a time and its
+        # cancel flag and result queue belong to the request being run
+        while not self._lock.acquire(timeout=_POLL_INTERVAL):
+            if cancel_event is not None and cancel_event.is_set():
+                raise JobCancelled()
+        try:
+            yield
+        finally:
+            self._lock.release()
+
+    def run(self, fn, kwargs, route, publish=None, cancel_event=None):
+        """Run ``fn(**kwargs)`` in the worker, relaying its events to ``publish``."""
+        callbacks = {name: value for name, value in kwargs.items() if callable(value)}
+        kwargs = {name: value for name, value in kwargs.items() if name not in callbacks}
+        with self._acquire(cancel_event):
+            self._request_id += 1
+            self.requests.put((self._request_id, (fn.__module__, fn.__name__), kwargs, list(callbacks), publish is not None))
+            self.warm.add(route)
+            try:
+                return self._wait(callbacks, publish, cancel_event)
+            except BaseException:
+                # Stop work nobody waits for any more; the worker resets the
+                # flag when it takes the next request
+                self.cancel_event.set()
+                raise
+
+    def _wait(self, callbacks, publish, cancel_event):
+        while True:
+            if cancel_event is not None and cancel_event.is_set():
+                self.cancel_event.set()
+            try:
+                request_id, message = pickle.loads(self.results.get(timeout=_POLL_INTERVAL))
+            except queue.Empty:
+                if not self.process.is_alive():
+                    # Killed outside Python, e.g. out of memory; start over cold
+                    self.warm = set()
+                    self._start()
+                    raise RuntimeError(f"Inference worker {self.index} exited while generating")
+                continue
+            if message["type"] == "resident":
+                self.warm = set(message["styles"]) | ({None} & self.warm)
+                continue
+            if request_id != self._request_id:
+                # Left over from a request whose caller stopped waiting
+                continue
+            if message["type"] == "result":
+                return message["value"]
+            if message["type"] == "error":
+                raise message["error"]
+            if message["type"] == "cancelled":
+                raise JobCancelled()
+            if message["type"] == "callback":
+                callbacks[message["name"]](message["value"])
+            elif publish is not None:
+                publish(message)
+
+    def close(self):
+        self.requests.put(None)
+
+class WorkerPool:
+    def __init__(self, workers, warm_styles=()):
+        # Inherited by the spawned workers and read when they import the
+        # config: one request at a time per worker, so the batch scheduler
+        # would only add its collection window to every request
+        os.environ["BATCHING_ENABLED"] = "0"
+        context = multiprocessing.get_context("spawn")
+        self._lock = threading.Lock()
+        self.workers = [
+            InferenceWorker(index, cores, context, warm_styles[index::workers])
+            for index, cores in enumerate(partition_cores(workers))
+        ]
+
+    def _pick(self, route):
+        with self._lock:
+            warm = [worker for worker in self.workers if route in worker.warm]
+            idle = [worker for worker in self.workers if worker.load == 0]
+            if warm:
+                worker = min(warm, key=lambda worker: worker.load)
+                # Loading on an idle worker beats queueing behind a busy one;
+                # the one holding the fewest styles has the most room
+                if worker.load and idle:
+                    worker = min(idle, key=lambda worker: len(worker.warm))
+            else:
+                worker = min(self.workers, key=lambda worker: worker.load)
+            worker.load += 1
+            return worker
+
+    def call(self, fn, kwargs, publish=None, cancel_event=None):
+        """Run engine function ``fn(**kwargs)`` on a worker and return its result.
+
+        ``fn`` must be importable by module and name. Progress and preview
+        events go to ``publish``; callable kwargs are called back in this
+        process with the values the worker passes them. Raises ``JobCancelled``
+        once ``cancel_event`` is set, and the worker's exception on failure.
+        """
+        route = kwargs.get("model_name")
+        worker = self._pick(route)
+        try:
+            return worker.run(fn, kwargs, route, publish, cancel_event)
+        finally:
+            with self._lock:
+                worker.load -= 1
+
+    def resident_styles(self):
+        return set().union(*(worker.warm for worker in self.workers)) - {None}
+
+    def status(self):
+        return [
+            {"index": worker.index, "cores": worker.cores, "load": worker.load, "alive": worker.process.is_alive(),
+             "warm": sorted(style for style in worker.warm if style is not None)}
+            for worker in self.workers
+        ]
+
+    def close(self):
+        for worker in self.workers:
+            worker.close()
+
+_pool = None
+_pool_lock = threading.Lock()
+_in_worker = False
+
+def get_worker_pool():
+    """The process-wide pool of ``INFERENCE_WORKERS`` workers, started on first use.
+
+    Returns None when ``INFERENCE_WORKERS`` is 0 and generation runs in process.
+    """
+    global _pool
+    if INFERENCE_WORKERS <= 0 or _in_worker:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = WorkerPool(INFERENCE_WORKERS, WARM_STYLES)
+        return _pool
+
+def active_pool():
+    """The running pool, without starting one."""
+    return _pool
+
+def run_inference(fn, kwargs, publish=None, cancel_event=None):
+    """``fn(**kwargs)`` on the worker pool, or in this process without one."""
+    pool = get_worker_pool()
+    if pool is None:
+        progress_callback = step_callback(publish, kwargs.get("model_name"), cancel_event) if publish is not None else None
+        return fn(**kwargs, progress_callback=progress_callback, cancel_event=cancel_event)
+    return pool.call(fn, kwargs, publish, cancel_event)
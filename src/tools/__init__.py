@@ -0,0 +1,4 @@
+"""
+Command-line tools for the Stable Diffusion Image Generator.
+Run with ``python -m src.tools.<name>``.
+"""
@@ -0,0 +1,340 @@
+"""
+Bulk generation from a JSONL manifest, outside the browser.
+
+Each manifest line is one job:
+
+    {"id": "fox-1", "style": "Disney", "task": "text2img", "prompt": "a fox in snow", "seed": 7,
+     "params": {"num_inference_steps": 30}, "ip_adapter_image": "refs/fox.jpg"}
+
+``task`` is one of the tabs (text2img, img2img, inpainting, refining,
+two_text_encoders); the last takes no ``style``. Input images (``image``,
+``mask_image``, ``ip_adapter_image``) are paths relative to the manifest.
+``params`` holds the remaining keyword arguments of the task's engine
+function. Jobs without an ``id`` are identified by a hash of their content.
+
+    python -m src.tools.batch_generate jobs.jsonl --output-dir out --workers 4
+
+Jobs are grouped by style and the groups are sharded across worker processes,
+each pinned to its own slice of the cores with torch's thread pool sized to
+match. A worker runs its jobs one style at a time, so it loads each pipeline
+at most once. Images are written to the output directory as they finish and
+every finished job is appended to ``checkpoint.jsonl`` there; rerunning the
+same command skips jobs that completed and retries the rest.
+"""
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from src.config.constants import MODEL_CONFIGS
+from src.utils.cpu import partition_cores, pin_process
+
+CHECKPOINT_FILE = "checkpoint.jsonl"
+
+# Per task: engine function, required and optional input images, accepted params
+TASKS = {
+    "text2img": (
+        "generate_text_to_image",
+        (),
+        ("ip_adapter_image",),
+        ("width", "height", "num_inference_steps", "guidance_scale", "ip_adapter_scale", "scheduler")
+    ),
+    "img2img": (
+        "generate_image_to_image",
+        ("image",),
+        ("ip_adapter_image",),
+        ("width", "height", "num_inference_steps", "guidance_scale", "strength", "ip_adapter_scale", "scheduler")
+    ),
+    "inpainting": (
+        "inpaint",
+        ("image", "mask_image"),
+        (),
+        ("num_inference_steps", "guidance_scale", "high_noise_frac", "scheduler")
+    ),
+    "refining": (
+        "refine",
+        (),
+        (),
+        ("num_inference_steps", "guidance_scale", "denoising_end", "scheduler")
+    ),
+    "two_text_encoders": (
+        "generate_two_text_encoders",
+        (),
+        (),
+        ("prompt_2", "num_inference_steps", "guidance_scale", "scheduler")
+    )
+}
+
+# Tasks that run the base model with the SDXL refiner
+ENSEMBLE_TASKS = ("inpainting", "refining")
+
+class ManifestError(Exception):
+    """Raised when the manifest has invalid jobs"""
+    pass
+
+def job_id(job):
+    if "id" in job:
+        return str(job["id"])
+    return hashlib.sha256(json.dumps(job, sort_keys=True).encode("utf-8")).hexdigest()[:16]
+
+def _validate(job):
+    task = job.get("task")
+    if task not in TASKS:
+        return f"unknown task {task!r}, expected one of {', '.join(TASKS)}"
+    _, required_images, optional_images, param_names = TASKS[task]
+    style = job.get("style")
+    if task == "two_text_encoders":
+        if style is not None:
+            return "two_text_encoders takes no style"
+        if "prompt_2" not in job.get("params", {}):
+            return "two_text_encoders needs params.prompt_2"
+    elif style not in MODEL_CONFIGS:
+        return f"unknown style {style!r}, expected one of {', '.join(MODEL_CONFIGS)}"
+    elif task in ENSEMBLE_TASKS and MODEL_CONFIGS[style]["pipeline"] != "sdxl":
+        return f"{task} needs an SDXL style"
+    if not isinstance(job.get("prompt"), str):
+        return "missing prompt"
+    missing = [name for name in required_images if name not in job]
+    if missing:
+        return f"missing {', '.join(missing)}"
+    unknown = set(job.get("params", {})) - set(param_names)
+    if unknown:
+        return f"unknown params {', '.join(sorted(unknown))} for {task}"
+    unknown = set(job) - {"id", "style", "task", "prompt", "seed", "params"} - set(required_images) - set(optional_images)
+    if unknown:
+        return f"unknown fields {', '.join(sorted(unknown))}"
+    return None
+
+def load_manifest(path):
+    """Jobs of a JSONL manifest, with ``id`` set and image paths made absolute."""
+    base_dir = os.path.dirname(os.path.abspath(path))
+    jobs = []
+    errors = []
+    seen = set()
+    with open(path, encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+            except json.JSONDecodeError as e:
+                errors.append(f"line {line_number}: invalid JSON ({e})")
+                continue
+            error = _validate(job)
+            if error is None:
+                job["id"] = job_id(job)
+                if job["id"] in seen:
+                    error = f"duplicate id {job['id']!r}"
+                seen.add(job["id"])
+            if error is not None:
+                errors.append(f"line {line_number}: {error}")
+                continue
+            for name in ("image", "mask_image", "ip_adapter_image"):
+                if name in job:
+                    job[name] = os.path.join(base_dir, job[name])
+            jobs.append(job)
+    if errors:
+        raise ManifestError("\n".join(errors))
+    return jobs
+
+def load_checkpoint(output_dir):
+    """Ids of jobs that finished in earlier runs and still have their outputs."""
+    done = set()
+    path = os.path.join(output_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return done
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by an interrupted run
+                continue
+            if record.get("status") == "ok" and all(
+                os.path.exists(os.path.join(output_dir, name)) for name in record["outputs"]
+            ):
+                done.add(record["id"])
+            else:
+                done.discard(record["id"])
+    return done
+
+def _group(job):
+    # Styles sharing a base still load their own LoRA, so group by style
+    return job.get("style") or job["task"]
+
+def shard(jobs, workers):
+    """Split ``jobs`` into at most ``workers`` lists, each ordered by style and task.
+
+    Styles stay on one worker unless they hold more than a fair share of the
+    jobs, in which case they are split into fair-share chunks. Chunks go to the
+    least loaded worker, largest first.
+    """
+    groups = {}
+    for job in jobs:
+        groups.setdefault(_group(job), []).append(job)
+    share = math.ceil(len(jobs) / workers)
+    chunks = []
+    for group_jobs in groups.values():
+        for start in range(0, len(group_jobs), share):
+            chunks.append(group_jobs[start:start + share])
+    shards = [[] for _ in range(workers)]
+    for chunk in sorted(chunks, key=len, reverse=True):
+        min(shards, key=len).extend(chunk)
+    # Contiguous styles and tasks: each pipeline is loaded once per worker even
+    # if the registry has to evict it for the next one
+    return [sorted(shard_jobs, key=lambda job: (_group(job), job["task"])) for shard_jobs in shards if shard_jobs]
+
+def _read_image(path, mode="RGB", max_size=None):
+    from src.utils.image_io import decode_image
+
+    with open(path, "rb") as f:
+        return decode_image(f.read(), max_size=max_size, mode=mode)
+
+def _save(image, output_dir, name):
+    path = os.path.join(output_dir, name)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    image.save(tmp_path, format="PNG")
+    os.replace(tmp_path, path)
+    return name
+
+def run_job(engine, job, output_dir):
+    """Run one job through the engine and write its images; returns their file names."""
+    function_name, _, _, _ = TASKS[job["task"]]
+    params = dict(job.get("params", {}))
+    kwargs = {"prompt": job["prompt"], **params}
+    if "seed" in job:
+        kwargs["seed"] = job["seed"]
+    if job["task"] != "two_text_encoders":
+        kwargs["model_name"] = job["style"]
+    # Decoded the way the tabs decode uploads
+    if "image" in job:
+        max_size = None
+        if job["task"] == "img2img":
+            max_size = (params.get("width", 512), params.get("height", 512))
+        kwargs["image"] = _read_image(job["image"], max_size=max_size)
+    if "mask_image" in job:
+        from src.utils.image_io import resize_to
+
+        kwargs["mask_image"] = resize_to(_read_image(job["mask_image"], mode="L"), kwargs["image"].size)
+    if "ip_adapter_image" in job:
+        kwargs["ip_adapter_image"] = _read_image(job["ip_adapter_image"])
+
+    result = getattr(engine, function_name)(**kwargs)
+    if job["task"] == "refining":
+        base_image, refined_image = result
+        return [_save(refined_image, output_dir, f"{job['id']}.png"), _save(base_image, output_dir, f"{job['id']}-base.png")]
+    return [_save(result, output_dir, f"{job['id']}.png")]
+
+def _worker(index, cores, jobs, output_dir, results):
+    try:
+        pin_process(cores)
+        from src.pipelines import engine
+
+        for job in jobs:
+            start = time.perf_counter()
+            record = {"id": job["id"], "worker": index}
+            try:
+                record["outputs"] = run_job(engine, job, output_dir)
+                record["status"] = "ok"
+            except Exception as e:
+                record["status"] = "failed"
+                record["error"] = f"{type(e).__name__}: {e}"
+            record["seconds"] = round(time.perf_counter() - start, 2)
+            results.put(record)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        results.put(None)
+
+def run(jobs, output_dir, workers, on_record=None):
+    """Run ``jobs`` on ``workers`` pinned processes, appending each result to the checkpoint.
+
+    Returns the checkpoint records of this run.
+    """
+    shards = shard(jobs, workers)
+    core_slices = partition_cores(len(shards))
+    # Read by the spawned workers at import: one job at a time per process, so
+    # the batch scheduler would only add its collection window to every job
+    os.environ["BATCHING_ENABLED"] = "0"
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    processes = [
+        context.Process(target=_worker, args=(index, cores, shard_jobs, output_dir, results), daemon=True)
+        for index, (cores, shard_jobs) in enumerate(zip(core_slices, shards))
+    ]
+    for process in processes:
+        process.start()
+
+    records = []
+    running = len(processes)
+    try:
+        with open(os.path.join(output_dir, CHECKPOINT_FILE), "a", encoding="utf-8") as checkpoint:
+            while running:
+                try:
+                    record = results.get(timeout=1.0)
+                except queue.Empty:
+                    # A worker killed outside Python (e.g. out of memory) never
+                    # reports back; its unfinished jobs run again on resume
+                    if not any(process.is_alive() for process in processes):
+                        break
+                    continue
+                if record is None:
+                    running -= 1
+                    continue
+                checkpoint.write(json.dumps(record) + "\n")
+                checkpoint.flush()
+                records.append(record)
+                if on_record is not None:
+                    on_record(record)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+    return records
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("manifest", help="JSONL file with one job per line")
+    parser.add_argument("--output-dir", default="batch_output", help="Where images and the checkpoint are written")
+    parser.add_argument("--workers", type=int, default=1, help="Worker processes, each pinned to its own slice of the cores")
+    args = parser.parse_args()
+
+    try:
+        jobs = load_manifest(args.manifest)
+    except ManifestError as e:
+        print(f"Invalid manifest:\n{e}", file=sys.stderr)
+        sys.exit(2)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    done = load_checkpoint(args.output_dir)
+    pending = [job for job in jobs if job["id"] not in done]
+    print(f"{len(jobs)} jobs, {len(jobs) - len(pending)} already done, {len(pending)} to run")
+    if not pending:
+        return
+
+    finished = 0
+
+    def report(record):
+        nonlocal finished
+        finished += 1
+        outcome = ", ".join(record["outputs"]) if record["status"] == "ok" else record["error"]
+        print(f"[{finished}/{len(pending)}] {record['id']} {record['status']} in {record['seconds']}s (worker {record['worker']}): {outcome}")
+
+    try:
+        records = run(pending, args.output_dir, max(1, args.workers), on_record=report)
+    except KeyboardInterrupt:
+        print("Interrupted; rerun the same command to resume", file=sys.stderr)
+        sys.exit(130)
+    failed = [record for record in records if record["status"] != "ok"]
+    missing = len(pending) - len(records)
+    if failed or missing:
+        print(f"{len(failed)} failed, {missing} not run; rerun the same command to retry them", file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+"""
+Benchmark of every generation flow on tiny random-weight pipelines.
+
+Builds miniature SDXL and SD1.5 pipelines from local configs, so no Hub access
+or downloaded weights are needed, and runs each tab's flow through the
+generation engine exactly as the UI does:
+
+    python -m src.tools.benchmark --save-baseline benchmark.json
+    python -m src.tools.benchmark --baseline benchmark.json
+
+Prints JSON with cold load time per base and, per flow, wall time, time per
+denoising step, text encoding, VAE encode and decode and PNG encode, plus the peak RSS of
+the process. A flow that raises is reported with its error instead of
+timings. With ``--baseline`` every timing is compared to the stored run
+and the exit status is 1 if any regressed by more than ``--tolerance``.
+Comparing a ``--fused`` run to an unfused baseline gives the per-step saving
+of the fused execution mode.
+"""
+import os
+
+# Keep the run isolated from the on-disk prompt and result caches and the Hub;
+# set before src modules read their configuration
+os.environ["PROMPT_CACHE_DIR"] = ""
+os.environ["RESULT_CACHE_DIR"] = ""
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import argparse
+import json
+import platform
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import numpy as np
+import torch
+from PIL import Image
+from diffusers import (
+    AutoencoderKL,
+    EulerAncestralDiscreteScheduler,
+    StableDiffusionPipeline,
+    StableDiffusionXLImg2ImgPipeline,
+    StableDiffusionXLPipeline,
+    UNet2DConditionModel
+)
+from transformers import CLIPTextConfig, CLIPTextModel, CLIPTextModelWithProjection, CLIPTokenizer
+from transformers.models.clip.tokenization_clip import bytes_to_unicode
+from src.config.constants import DEFAULT_SCHEDULER, MODEL_CONFIGS, SCHEDULERS, TWO_TEXT_ENCODERS_MODEL
+from src.pipelines import engine
+from src.pipelines.embedding_cache import clear_caches
+from src.pipelines.fusion import set_fused_mode
+from src.pipelines.model_loader import base_key
+from src.pipelines.precision import apply_precision, resolve_precision
+from src.pipelines.registry import registry
+
+PROMPT = "a small red fox sitting in fresh snow, detailed illustration"
+
+# Benchmark styles registered next to the real ones; no LoRA so nothing is read
+# from models/
+BENCHMARK_STYLES = {
+    "benchmark-sdxl": {
+        "base_model": "benchmark/tiny-sdxl",
+        "lora_path": None,
+        "default_prompt": PROMPT,
+        "use_safetensors": True,
+        "precision": "fp32",
+        "is_sdxl": True,
+        "pipeline": "sdxl",
+        "scheduler": "euler_a"
+    },
+    "benchmark-sd15": {
+        "base_model": "benchmark/tiny-sd15",
+        "lora_path": None,
+        "default_prompt": PROMPT,
+        "use_safetensors": True,
+        "precision": "fp32",
+        "is_sdxl": False,
+        "pipeline": "stable-diffusion",
+        "scheduler": "euler_a"
+    }
+}
+
+def _tokenizer(directory):
+    # Byte-level vocabulary without merges: every word splits into characters,
+    # which is enough to drive the text encoders
+    chars = list(bytes_to_unicode().values())
+    tokens = chars + [char + "</w>" for char in chars] + ["<|startoftext|>", "<|endoftext|>"]
+    vocab_file = os.path.join(directory, "vocab.json")
+    merges_file = os.path.join(directory, "merges.txt")
+    with open(vocab_file, "w", encoding="utf-8") as f:
+        json.dump({token: index for index, token in enumerate(tokens)}, f)
+    with open(merges_file, "w", encoding="utf-8") as f:
+        f.write("#version: 0.2\n")
+    return CLIPTokenizer(vocab_file, merges_file, model_max_length=77)
+
+def _text_encoder_config():
+    return CLIPTextConfig(
+        bos_token_id=0,
+        eos_token_id=2,
+        hidden_size=32,
+        intermediate_size=37,
+        layer_norm_eps=1e-05,
+        num_attention_heads=4,
+        num_hidden_layers=5,
+        pad_token_id=1,
+        vocab_size=1000,
+        hidden_act="gelu",
+        projection_dim=32
+    )
+
+def _vae():
+    return AutoencoderKL(
+        block_out_channels=[32, 64],
+        in_channels=3,
+        out_channels=3,
+        down_block_types=["DownEncoderBlock2D", "DownEncoderBlock2D"],
+        up_block_types=["UpDecoderBlock2D", "UpDecoderBlock2D"],
+        latent_channels=4,
+        sample_size=128
+    )
+
+def _sdxl_unet(cross_attention_dim, projection_class_embeddings_input_dim):
+    return UNet2DConditionModel(
+        block_out_channels=(32, 64),
+        layers_per_block=2,
+        sample_size=32,
+        in_channels=4,
+        out_channels=4,
+        down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+        up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+        attention_head_dim=(2, 4),
+        use_linear_projection=True,
+        addition_embed_type="text_time",
+        addition_time_embed_dim=8,
+        transformer_layers_per_block=(1, 2),
+        projection_class_embeddings_input_dim=projection_class_embeddings_input_dim,
+        cross_attention_dim=cross_attention_dim,
+        norm_num_groups=1
+    )
+
+def tiny_sdxl(tokenizer):
+    torch.manual_seed(0)
+    return StableDiffusionXLPipeline(
+        vae=_vae(),
+        text_encoder=CLIPTextModel(_text_encoder_config()),
+        text_encoder_2=CLIPTextModelWithProjection(_text_encoder_config()),
+        tokenizer=tokenizer,
+        tokenizer_2=tokenizer,
+        # Both encoders' hidden states concatenated; 6 time ids of 8 dims plus
+        # the pooled projection
+        unet=_sdxl_unet(64, 6 * 8 + 32),
+        scheduler=EulerAncestralDiscreteScheduler()
+    )
+
+def tiny_refiner(base):
+    torch.manual_seed(0)
+    return StableDiffusionXLImg2ImgPipeline(
+        vae=base.vae,
+        text_encoder=None,
+        text_encoder_2=base.text_encoder_2,
+        tokenizer=None,
+        tokenizer_2=base.tokenizer_2,
+        # Only the second encoder's hidden states; 5 time ids (with the
+        # aesthetic score) of 8 dims plus the pooled projection
+        unet=_sdxl_unet(32, 5 * 8 + 32),
+        scheduler=EulerAncestralDiscreteScheduler(),
+        requires_aesthetics_score=True
+    )
+
+def tiny_sd15(tokenizer):
+    torch.manual_seed(0)
+    return StableDiffusionPipeline(
+        vae=_vae(),
+        text_encoder=CLIPTextModel(_text_encoder_config()),
+        tokenizer=tokenizer,
+        unet=UNet2DConditionModel(
+            block_out_channels=(32, 64),
+            layers_per_block=2,
+            sample_size=32,
+            in_channels=4,
+            out_channels=4,
+            down_block_types=("DownBlock2D", "CrossAttnDownBlock2D"),
+            up_block_types=("CrossAttnUpBlock2D", "UpBlock2D"),
+            cross_attention_dim=32
+        ),
+        scheduler=EulerAncestralDiscreteScheduler(),
+        safety_checker=None,
+        feature_extractor=None,
+        requires_safety_checker=False
+    )
+
+class StageTimer:
+    """Accumulates wall time of patched methods per stage label."""
+
+    def __init__(self):
+        self.seconds = {}
+        self._patches = []
+
+    def patch(self, obj, name, stage):
+        if obj is None:
+            return
+        had_own = name in vars(obj)
+        original = getattr(obj, name)
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return original(*args, **kwargs)
+            finally:
+                self.seconds[stage] = self.seconds.get(stage, 0.0) + time.perf_counter() - start
+
+        setattr(obj, name, timed)
+        self._patches.append((obj, name, original if had_own else None))
+
+    def restore(self):
+        for obj, name, original in reversed(self._patches):
+            if original is None:
+                delattr(obj, name)
+            else:
+                setattr(obj, name, original)
+        self._patches.clear()
+
+    def reset(self):
+        self.seconds = {}
+
+def load_bases(tokenizer):
+    """Put the tiny pipelines in the registry under the keys the engine uses."""
+    for name, config in BENCHMARK_STYLES.items():
+        MODEL_CONFIGS.setdefault(name, config)
+    builders = {
+        base_key("benchmark-sdxl"): lambda: tiny_sdxl(tokenizer),
+        base_key("benchmark-sd15"): lambda: tiny_sd15(tokenizer),
+        (TWO_TEXT_ENCODERS_MODEL, "sdxl", resolve_precision()): lambda: tiny_sdxl(tokenizer)
+    }
+    load_seconds = {}
+    for key, build in builders.items():
+        start = time.perf_counter()
+        registry.get(key, "text2img", lambda: apply_precision(build(), key[2]))
+        load_seconds[key[0]] = time.perf_counter() - start
+    # The refiner shares the tiny SDXL base's second text encoder and VAE
+    key = base_key("benchmark-sdxl")
+    start = time.perf_counter()
+    registry.get_refiner(key, "img2img", lambda base: apply_precision(tiny_refiner(base), key[2]))
+    load_seconds["refiner"] = time.perf_counter() - start
+    return load_seconds
+
+def _flows(size, steps, scheduler):
+    image = Image.fromarray(np.random.RandomState(0).randint(0, 256, (size, size, 3), dtype=np.uint8))
+    mask = Image.new("L", (size, size), 0)
+    mask.paste(255, (size // 4, size // 4, 3 * size // 4, 3 * size // 4))
+    common = {"prompt": PROMPT, "num_inference_steps": steps, "seed": 0, "scheduler": scheduler}
+    sized = {**common, "width": size, "height": size}
+    # (flow name, style whose pipeline is instrumented, engine function, kwargs)
+    return [
+        ("text2img_sdxl", "benchmark-sdxl", engine.generate_text_to_image, {"model_name": "benchmark-sdxl", **sized}),
+        ("text2img_sd15", "benchmark-sd15", engine.generate_text_to_image, {"model_name": "benchmark-sd15", **sized}),
+        ("img2img_sdxl", "benchmark-sdxl", engine.generate_image_to_image, {"model_name": "benchmark-sdxl", "image": image, **sized}),
+        ("inpainting", "benchmark-sdxl", engine.inpaint, {"model_name": "benchmark-sdxl", "image": image, "mask_image": mask, **common}),
+        ("refining", "benchmark-sdxl", engine.refine, {"model_name": "benchmark-sdxl", **common}),
+        ("two_text_encoders", None, engine.generate_two_text_encoders, {**common, "prompt_2": PROMPT})
+    ]
+
+def _instrument(timer, pipe):
+    timer.patch(pipe.unet, "forward", "unet")
+    timer.patch(pipe.vae, "encode", "vae_encode")
+    timer.patch(pipe.vae, "decode", "vae_decode")
+    timer.patch(getattr(pipe, "text_encoder", None), "forward", "text_encode")
+    timer.patch(getattr(pipe, "text_encoder_2", None), "forward", "text_encode")
+
+def run_flow(fn, kwargs, pipe, steps, runs):
+    timer = StageTimer()
+    _instrument(timer, pipe)
+    samples = []
+    try:
+        # First call builds task views and warms allocators
+        fn(**kwargs)
+        for _ in range(runs):
+            clear_caches()
+            timer.reset()
+            start = time.perf_counter()
+            result = fn(**kwargs)
+            total = time.perf_counter() - start
+            image = result[-1] if isinstance(result, tuple) else result
+            start = time.perf_counter()
+            engine.encode_image(image)
+            png = time.perf_counter() - start
+            samples.append({
+                "total_seconds": total,
+                "step_seconds": timer.seconds.get("unet", 0.0) / steps,
+                "text_encode_seconds": timer.seconds.get("text_encode", 0.0),
+                "vae_encode_seconds": timer.seconds.get("vae_encode", 0.0),
+                "vae_decode_seconds": timer.seconds.get("vae_decode", 0.0),
+                "png_encode_seconds": png
+            })
+    finally:
+        timer.restore()
+    return {name: statistics.median(sample[name] for sample in samples) for name in samples[0]}
+
+def run(args):
+    set_fused_mode(args.fused)
+    with tempfile.TemporaryDirectory() as directory:
+        load_seconds = load_bases(_tokenizer(directory))
+    flows = {}
+    for name, style, fn, kwargs in _flows(args.size, args.steps, args.scheduler):
+        if args.flows and name not in args.flows:
+            continue
+        key = base_key(style) if style else (TWO_TEXT_ENCODERS_MODEL, "sdxl", resolve_precision())
+        try:
+            flows[name] = run_flow(fn, kwargs, registry.peek(key), args.steps, args.runs)
+        except Exception as e:
+            flows[name] = {"error": f"{type(e).__name__}: {e}"}
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 ** 2 if sys.platform == "darwin" else 1024)
+    return {
+        "environment": {
+            "python": platform.python_version(),
+            "torch": torch.__version__,
+            "threads": torch.get_num_threads(),
+            "precision": resolve_precision(),
+            "size": args.size,
+            "steps": args.steps,
+            "scheduler": args.scheduler,
+            "fused": args.fused,
+            "runs": args.runs
+        },
+        "cold_load_seconds": load_seconds,
+        "flows": flows,
+        "peak_rss_mb": peak_rss_mb
+    }
+
+def _metrics(report):
+    values = {f"cold_load_seconds.{name}": value for name, value in report["cold_load_seconds"].items()}
+    for flow, metrics in report["flows"].items():
+        for name, value in metrics.items():
+            if isinstance(value, (int, float)):
+                values[f"{flow}.{name}"] = value
+    values["peak_rss_mb"] = report["peak_rss_mb"]
+    return values
+
+def compare(report, baseline, tolerance):
+    """Ratio of every shared metric to the baseline and the ones that regressed."""
+    current, previous = _metrics(report), _metrics(baseline)
+    ratios = {
+        name: current[name] / previous[name]
+        for name in sorted(current.keys() & previous.keys())
+        if previous[name] > 0
+    }
+    regressions = [name for name, ratio in ratios.items() if ratio > 1 + tolerance]
+    return {"tolerance": tolerance, "ratios": ratios, "regressions": regressions}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", type=int, default=64, help="Image width and height in pixels")
+    parser.add_argument("--steps", type=int, default=10)
+    # The LCM-LoRA needs the Hub, so only the plain samplers are benchmarked
+    parser.add_argument("--scheduler", choices=[name for name in SCHEDULERS if name != "lcm"], default=DEFAULT_SCHEDULER)
+    # The benchmark styles have no LoRA, so only the QKV fusion is measured
+    parser.add_argument("--fused", action="store_true", help="Run with FUSED_MODE on; compare to an unfused baseline")
+    parser.add_argument("--runs", type=int, default=3, help="Timed runs per flow; the median is reported")
+    parser.add_argument("--flows", nargs="+", help="Only run these flows")
+    parser.add_argument("--baseline", help="Compare against a report saved with --save-baseline")
+    parser.add_argument("--save-baseline", help="Write this run's report to the given file")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="Allowed slowdown before a metric counts as a regression")
+    args = parser.parse_args()
+
+    report = run(args)
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["comparison"] = compare(report, json.load(f), args.tolerance)
+    print(json.dumps(report, indent=2))
+    if args.baseline and report["comparison"]["regressions"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Import-time profile of the modules a Streamlit script run loads.
+
+Each module is imported in a fresh interpreter with ``-X importtime`` and the
+report lists its total import time, whether torch/diffusers were pulled in and
+the slowest top-level imports:
+
+    python -m src.tools.import_profile
+    python -m src.tools.import_profile src.pipelines.engine --top 20
+
+By default it profiles every Streamlit tab next to the generation engine, whose
+import the tabs defer until the first generation.
+"""
+import argparse
+import json
+import subprocess
+import sys
+
+DEFAULT_MODULES = [
+    "src.components.text_to_image",
+    "src.components.image_to_image",
+    "src.components.inpainting",
+    "src.components.refining",
+    "src.components.two_text_encoders",
+    "src.pipelines.engine"
+]
+
+HEAVY_PACKAGES = ("torch", "diffusers", "transformers")
+
+def _run(code):
+    return subprocess.run([sys.executable, "-X", "importtime", "-c", code], capture_output=True, text=True)
+
+def _parse(stderr):
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|", 2)
+        entries.append({
+            "name": name.strip(),
+            # Nesting is shown as two spaces per level after the separator
+            "depth": (len(name) - len(name.lstrip()) - 1) // 2,
+            "self_us": int(self_us.strip()),
+            "cumulative_us": int(cumulative_us.strip())
+        })
+    return entries
+
+def profile(module, startup=()):
+    """Import ``module`` in a new interpreter and parse its ``-X importtime`` output.
+
+    Top-level imports named in ``startup`` (the interpreter's own start-up
+    imports) are left out of the totals.
+    """
+    result = _run(f"import {module}")
+    entries = _parse(result.stderr)
+    top_level = [entry for entry in entries if entry["depth"] == 0 and entry["name"] not in startup]
+    imported = {entry["name"].split(".")[0] for entry in entries}
+    return {
+        "ok": result.returncode == 0,
+        "error": result.stderr.strip().splitlines()[-1] if result.returncode else None,
+        "total_seconds": sum(entry["cumulative_us"] for entry in top_level) / 1e6,
+        "heavy_imports": sorted(package for package in HEAVY_PACKAGES if package in imported),
+        "top_level": top_level
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--top", type=int, default=10, help="Slowest top-level imports to list per module")
+    args = parser.parse_args()
+
+    startup = {entry["name"] for entry in _parse(_run("pass").stderr) if entry["depth"] == 0}
+    report = {}
+    for module in args.modules:
+        result = profile(module, startup)
+        slowest = sorted(result.pop("top_level"), key=lambda entry: entry["cumulative_us"], reverse=True)
+        result["slowest"] = [
+            {"name": entry["name"], "seconds": entry["cumulative_us"] / 1e6}
+            for entry in slowest[:args.top]
+        ]
+        report[module] = result
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
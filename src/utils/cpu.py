@@ -0,0 +1,54 @@
+"""
+CPU core partitioning for worker processes.
+
+Inference workers sharing a host each get a disjoint slice of the cores and
+size torch's thread pool to it, so concurrent pipeline calls never
+oversubscribe the cores the way threads of one process sharing torch's
+intra-op pool do.
+"""
+import os
+
+def available_cores():
+    """Cores this process may run on."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+def partition_cores(workers, cores=None):
+    """Split ``cores`` (every available core by default) into ``workers`` disjoint slices.
+
+    Slices differ in size by at most one core. With more workers than cores,
+    workers share single cores round-robin.
+    """
+    cores = list(cores) if cores is not None else available_cores()
+    if workers <= len(cores):
+        size, extra = divmod(len(cores), workers)
+        slices = []
+        start = 0
+        for index in range(workers):
+            end = start + size + (1 if index < extra else 0)
+            slices.append(cores[start:end])
+            start = end
+        return slices
+    return [[cores[index % len(cores)]] for index in range(workers)]
+
+def pin_process(cores):
+    """Restrict the calling process to ``cores`` and size torch's threads to match.
+
+    Call it before torch runs anything: the OpenMP and MKL variables only take
+    effect if torch has not been imported yet.
+    """
+    threads = str(len(cores))
+    os.environ["OMP_NUM_THREADS"] = threads
+    os.environ["MKL_NUM_THREADS"] = threads
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+    import torch
+
+    torch.set_num_threads(len(cores))
+    try:
+        # One pipeline call at a time per worker, so no inter-op parallelism
+        torch.set_num_interop_threads(1)
+    except RuntimeError:
+        # Raised once any inter-op work has run; the pool keeps its size
+        pass
@@ -0,0 +1,23 @@
+"""
+Image grids assembled with NumPy.
+
+Cells are stacked into one array and reshaped into rows and columns, so the
+grid is built with a single copy instead of a paste per image.
+"""
+import numpy as np
+from PIL import Image
+
+def make_image_grid(images, rows, cols, size=None):
+    """Tile ``images`` row by row into a ``rows`` x ``cols`` RGB grid.
+
+    Every cell is ``size`` (width, height), the size of the first image by
+    default; only images of another size are resized. Missing cells stay black.
+    """
+    width, height = size or images[0].size
+    cells = np.zeros((rows * cols, height, width, 3), dtype=np.uint8)
+    for index, image in enumerate(images[:rows * cols]):
+        if image.size != (width, height):
+            image = image.resize((width, height), Image.Resampling.BILINEAR)
+        cells[index] = np.asarray(image.convert("RGB"))
+    grid = cells.reshape(rows, cols, height, width, 3).swapaxes(1, 2).reshape(rows * height, cols * width, 3)
+    return Image.fromarray(grid)
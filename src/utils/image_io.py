@@ -0,0 +1,73 @@
+"""
+Decoding of uploaded images ahead of the pipelines.
+
+Phone photos arrive as multi-megapixel JPEGs with the orientation in EXIF.
+``decode_image`` decodes them straight at a reduced scale where the format
+allows it (JPEG DCT scaling via ``Image.draft``), applies the EXIF orientation
+and shrinks the result to fit the target size, so neither the pipeline nor the
+preview widgets ever hold the full-resolution image.
+
+``load_upload`` memoises the decoded image per uploader in a session state
+mapping, so Streamlit reruns reuse it until a different file or target size
+is chosen.
+"""
+import io
+from PIL import Image, ImageOps
+from src.config.constants import UPLOAD_MAX_SIDE
+
+_EXIF_ORIENTATION = 0x0112
+# Orientations that rotate the image by 90 or 270 degrees
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+def _fit(size, max_size):
+    scale = min(max_size[0] / size[0], max_size[1] / size[1], 1.0)
+    return max(1, round(size[0] * scale)), max(1, round(size[1] * scale))
+
+def decode_image(data, max_size=None, mode="RGB"):
+    """Decode image bytes, upright and no larger than ``max_size`` (width, height).
+
+    ``max_size`` defaults to a ``UPLOAD_MAX_SIDE`` square. The aspect ratio is
+    kept; images that already fit are not resized.
+    """
+    max_size = max_size or (UPLOAD_MAX_SIDE, UPLOAD_MAX_SIDE)
+    image = Image.open(io.BytesIO(data))
+    raw_max_size = max_size
+    if image.getexif().get(_EXIF_ORIENTATION) in _TRANSPOSED_ORIENTATIONS:
+        raw_max_size = (max_size[1], max_size[0])
+    # Lets the JPEG decoder skip detail that would be thrown away anyway
+    image.draft(mode, _fit(image.size, raw_max_size))
+    image = ImageOps.exif_transpose(image)
+    if image.mode != mode:
+        image = image.convert(mode)
+    target = _fit(image.size, max_size)
+    if target != image.size:
+        image = image.resize(target, Image.Resampling.BILINEAR, reducing_gap=2.0)
+    return image
+
+def resize_to(image, size):
+    """``image`` at exactly ``size``, e.g. a mask matched to its image."""
+    if image.size == tuple(size):
+        return image
+    return image.resize(tuple(size), Image.Resampling.BILINEAR)
+
+def load_upload(uploaded_file, state, slot, max_size=None, mode="RGB", size=None):
+    """Decoded image of a Streamlit upload, memoised in ``state[slot]``.
+
+    ``state`` is ``st.session_state``. With ``size`` the image is brought to
+    exactly that size instead of fitting ``max_size``. Only the latest upload
+    of each slot is kept, so the memo never holds more than one image per
+    uploader.
+    """
+    if uploaded_file is None:
+        return None
+    file_id = getattr(uploaded_file, "file_id", None) or (uploaded_file.name, uploaded_file.size)
+    max_size = size or max_size
+    key = (file_id, tuple(max_size) if max_size else None, mode, size is not None)
+    memo = state.get(slot)
+    if memo is not None and memo[0] == key:
+        return memo[1]
+    image = decode_image(uploaded_file.getvalue(), max_size, mode)
+    if size is not None:
+        image = resize_to(image, size)
+    state[slot] = (key, image)
+    return image
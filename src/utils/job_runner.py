@@ -0,0 +1,44 @@
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from src.pipelines.jobs import job_manager
+
+def session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+def run_job(fn, kind, progress_callback=None, on_event=None, event_kwargs=None, **kwargs):
+    """Run ``fn(**kwargs)`` as a background job owned by the current session.
+
+    Progress is replayed in the script thread, so ``progress_callback`` may
+    update Streamlit elements. ``event_kwargs`` maps keyword arguments of
+    ``fn`` that take a callback to event types; values passed to those
+    callbacks reach ``on_event`` as ``{"type": ..., "value": ...}``, as do
+    latent previews (``{"type": "preview", "step": ..., "value": image}``)
+    and status changes.
+
+    When Streamlit interrupts the script run (any widget change triggers a
+    rerun), the job is cancelled at its next denoising step.
+    """
+    job = job_manager.create(kind, session_id=session_id())
+    for name, event_type in (event_kwargs or {}).items():
+        kwargs[name] = lambda value, event_type=event_type: job.publish({"type": event_type, "value": value})
+    job_manager.start(job, fn, kwargs)
+
+    def handle(event):
+        if event["type"] == "progress":
+            if progress_callback is not None:
+                progress_callback(event["step"], event["timestep"], None)
+        elif on_event is not None:
+            on_event(event)
+
+    try:
+        return job.wait(handle)
+    finally:
+        if not job.done:
+            job.cancel()
+
+def show_previews(placeholder):
+    """``on_event`` handler drawing latent previews into ``placeholder``."""
+    def on_event(event):
+        if event["type"] == "preview":
+            placeholder.image(event["value"], caption=f"Preview · step {event['step']}", use_container_width=True)
+    return on_event
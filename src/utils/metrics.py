@@ -0,0 +1,194 @@
+"""
+Per-stage timing and memory metrics for the generation hot path.
+
+``stage(name)`` times a block and records its duration and the peak process
+RSS while it ran in histograms labelled by stage, style, task, resolution and
+fusion. The peak is read from the kernel's RSS high-water mark at both ends of
+the stage, so allocation spikes that set a new process peak, such as a VAE
+decode, are caught without polling. The
+style/task/resolution labels come from the enclosing ``labels(...)`` block, so
+code deep in the engine (text encoding, VAE decode, ...) is attributed to the
+request that triggered it. Every observation is also emitted as a JSON log
+line on the ``src.metrics`` logger; ``METRICS_LOG=1`` sends those to stderr.
+
+``render_prometheus`` returns all histograms in the Prometheus text format.
+"""
+import contextvars
+import functools
+import json
+import logging
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from src.config.constants import METRICS_LOG
+
+LABEL_NAMES = ("stage", "style", "task", "resolution", "fusion")
+
+SECONDS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+RSS_BUCKETS = tuple(2 ** power * 1024 ** 2 for power in range(8, 17))  # 256 MiB .. 64 GiB
+
+logger = logging.getLogger("src.metrics")
+if METRICS_LOG and not logger.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+_labels = contextvars.ContextVar("metric_labels", default={})
+
+class Histogram:
+    """Cumulative-bucket histogram with one series per label combination."""
+
+    def __init__(self, name, description, buckets):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, label_values):
+        key = tuple(str(label_values.get(name) or "") for name in LABEL_NAMES)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0}
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def series(self):
+        """``(label values, sum and count)`` of every series."""
+        with self._lock:
+            return [
+                (dict(zip(LABEL_NAMES, key)), {"sum": series["sum"], "count": series["count"]})
+                for key, series in self._series.items()
+            ]
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                label_text = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(LABEL_NAMES, key))
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    lines.append(f'{self.name}_bucket{{{label_text},le="{bound:g}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label_text},le="+Inf"}} {series["count"]}')
+                lines.append(f"{self.name}_sum{{{label_text}}} {series['sum']}")
+                lines.append(f"{self.name}_count{{{label_text}}} {series['count']}")
+        return lines
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+STAGE_SECONDS = Histogram("generation_stage_seconds", "Duration of generation stages in seconds.", SECONDS_BUCKETS)
+STAGE_RSS = Histogram("generation_stage_rss_bytes", "Peak process resident memory during a generation stage.", RSS_BUCKETS)
+
+def current_rss_bytes():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        # No procfs: fall back to the peak
+        return peak_rss_bytes()
+
+def peak_rss_bytes():
+    """High-water mark of the process RSS."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError):
+        pass
+    # In KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+class _PeakRss:
+    """Peak RSS of one stage from the RSS and high-water mark at its ends.
+
+    A stage that raised the process high-water mark peaked at the new mark;
+    otherwise the larger of its start and end RSS stands in for the peak.
+    Nothing is polled, so open stages cost the hot path nothing.
+    """
+
+    def __init__(self):
+        self._start_rss = current_rss_bytes()
+        self._start_peak = peak_rss_bytes()
+
+    def close(self):
+        end_peak = peak_rss_bytes()
+        if end_peak > self._start_peak:
+            return end_peak
+        return max(self._start_rss, current_rss_bytes())
+
+def flow_labels(task, model_name=None, width=None, height=None):
+    """Label values for one generation request."""
+    return {
+        "style": model_name,
+        "task": task,
+        "resolution": f"{int(width)}x{int(height)}" if width and height else None
+    }
+
+@contextmanager
+def labels(**values):
+    """Attach label values to every stage recorded inside the block."""
+    merged = dict(_labels.get())
+    merged.update({name: value for name, value in values.items() if value is not None})
+    token = _labels.set(merged)
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+def observe(stage_name, seconds, rss_bytes=None, **extra_labels):
+    """Record one stage; ``rss_bytes`` is its peak RSS, the current RSS if not given."""
+    label_values = dict(_labels.get())
+    label_values.update({name: value for name, value in extra_labels.items() if value is not None})
+    label_values["stage"] = stage_name
+    rss = rss_bytes if rss_bytes is not None else current_rss_bytes()
+    STAGE_SECONDS.observe(seconds, label_values)
+    STAGE_RSS.observe(rss, label_values)
+    if logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps({
+            "event": "stage",
+            **{name: label_values.get(name) for name in LABEL_NAMES},
+            "seconds": round(seconds, 6),
+            "rss_bytes": rss
+        }))
+
+@contextmanager
+def stage(name, **extra_labels):
+    """Record the duration and peak RSS of the block as stage ``name``."""
+    tracker = _PeakRss()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        observe(name, seconds, rss_bytes=tracker.close(), **extra_labels)
+
+def instrument(obj, method_name, stage_name):
+    """Wrap ``obj.method_name`` so each call is recorded as ``stage_name``.
+
+    Idempotent, so modules shared between pipelines are wrapped once.
+    """
+    method = getattr(obj, method_name)
+    if getattr(method, "_metrics_stage", None) == stage_name:
+        return
+
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with stage(stage_name):
+            return method(*args, **kwargs)
+
+    wrapper._metrics_stage = stage_name
+    setattr(obj, method_name, wrapper)
+
+def render_prometheus():
+    lines = STAGE_SECONDS.render() + STAGE_RSS.render()
+    return "\n".join(lines) + "\n"
@@ -1,14 +1,13 @@
+import threading
 import streamlit as st
-from dotenv import load_dotenv
 from src.utils.template_loader import load_css, load_template
 from src.components.text_to_image import render_text_to_image_tab
 from src.components.image_to_image import render_image_to_image_tab
 from src.components.inpainting import render_inpainting_tab
 from src.components.refining import render_refining_tab
 from src.components.two_text_encoders import render_two_text_encoders_tab
-
-# Load environment variables from .env file
-load_dotenv()
+from src.config.constants import INFERENCE_WORKERS, PRECOMPUTE_DEFAULT_PROMPTS, WARM_STYLES
+from src.pipelines.warmup import start_warmup
 
 # Set page config
 st.set_page_config(
@@ -18,6 +17,40 @@ st.set_page_config(
     initial_sidebar_state="collapsed"
 )
 
+@st.cache_resource
+def start_prompt_precompute():
+    # Runs once per server process; encodes every style's default prompt in
+    # the background so the first click does not pay for the text encoders
+    from src.pipelines.embedding_cache import precompute_default_prompts
+
+    thread = threading.Thread(target=precompute_default_prompts, daemon=True)
+    thread.start()
+    return thread
+
+# Inference workers keep their own prompt caches, and encoding here would load
+# every base into this process; their warm-up encodes the default prompts of
+# the styles they serve
+if PRECOMPUTE_DEFAULT_PROMPTS and not INFERENCE_WORKERS:
+    start_prompt_precompute()
+
+@st.cache_resource
+def start_warm_pool():
+    # Runs once per server process; preloads WARM_STYLES so their first
+    # request does not pay for loading
+    return start_warmup()
+
+@st.cache_resource
+def start_inference_workers():
+    # Runs once per server process; the workers warm WARM_STYLES themselves
+    from src.pipelines.workers import get_worker_pool
+
+    return get_worker_pool()
+
+if INFERENCE_WORKERS:
+    start_inference_workers()
+elif WARM_STYLES:
+    start_warm_pool()
+
 # Load CSS
 load_css()
 